@@ -1,23 +1,481 @@
 # api.py
+import os
+import io
+import json
+import math
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+STARTED_AT = time.monotonic()  # Before the remaining imports, so startup timings include them
 import uvicorn
-from fastapi import FastAPI, File, Form, UploadFile, Response
+from fastapi import FastAPI, File, Form, UploadFile, Response, WebSocket, WebSocketDisconnect, HTTPException, Request, Depends
+from fastapi.requests import HTTPConnection
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from PIL import Image
-import io
-import json # <--- ADD THIS LINE
-import torch
+import numpy as np
 import traceback
-from core.segmentor import Segmentor
-from core.detector import OWLViTDetector
 from ui.visualizer import ResultsVisualizer
-from core.combined_pipeline import OwlViT_SAM_Pipeline
-combined_pipeline = OwlViT_SAM_Pipeline()
+from core.scheduler import BatchScheduler
+from core.workers import WorkerError
+from core import metrics, admission, coalescing
+from core.sessions import SessionStore
+from core.image_store import ImageStore
+from core.rle import encode_rle
+from core.backbones import SAM_BACKBONES, check_backbone, sam_checkpoint
+from core.image_handler import ImageScale, InvalidInput, MODEL_MAX_SIDE, decode_image as decode_image_source
+from typing import List, Optional
+
+# Micro-batching: requests arriving within the window share one forward pass
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", 10))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 8))
+MAX_QUEUE_SIZE = int(os.environ.get("MAX_QUEUE_SIZE", 64))
+# Interactive segmentation sessions each hold one SAM image embedding
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", 300))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 32))
+# Images uploaded once to POST /images/ and then referred to by id; LRU beyond this many MB of pixels
+IMAGE_STORE_MB = int(os.environ.get("IMAGE_STORE_MB", 256))
+# Uploads are decoded no larger than the models use (0 decodes at full resolution); results
+# are mapped back to the original image's coordinates
+DECODE_MAX_SIDE = int(os.environ.get("DECODE_MAX_SIDE", MODEL_MAX_SIDE))
+# fp32, bf16 or int8 (CPU only) encoders; see benchmarks/precision_report.py for the trade-off
+PRECISION = os.environ.get("PRECISION", "fp32")
+# "torch" (eager) or "onnx" (graphs written to EXPORT_DIR by export_models.py)
+BACKEND = os.environ.get("BACKEND", "torch")
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exported")
+# SAM backbone (vit_b, vit_l or vit_h) for final masks: box, text and combined requests, and a
+# session's "final" message. Checkpoints are read from SAM_CHECKPOINT_DIR under their release names.
+SAM_BACKBONE = check_backbone(os.environ.get("SAM_BACKBONE", "vit_h"))
+# Backbone for point clicks and session prompts; a lighter one (vit_b) makes clicks fast while
+# final masks still come from SAM_BACKBONE. Requests may pick either with a `backbone` field.
+INTERACTIVE_SAM_BACKBONE = check_backbone(os.environ.get("INTERACTIVE_SAM_BACKBONE", SAM_BACKBONE))
+SAM_CHECKPOINT_DIR = os.environ.get("SAM_CHECKPOINT_DIR", "")
+# Load the models in the background as soon as the server starts instead of on the first request
+WARMUP = os.environ.get("WARMUP", "0") == "1"
+# WORKERS > 0 runs inference on that many worker processes forked after the models load, so
+# they share the weights. Each is pinned to WORKER_THREADS cores (default: an equal share of
+# this process's cores) and takes up to WORKER_CONCURRENCY requests at a time.
+WORKERS = int(os.environ.get("WORKERS", 0))
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 0))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 2))
+# Admission control (core/admission.py): at most MAX_IN_FLIGHT inference jobs run at once, at
+# most BULK_SLOTS of them bulk, so interactive requests always have the rest. Each class waits
+# in a queue of at most MAX_WAITING_INTERACTIVE / MAX_WAITING_BULK requests. A request's class
+# comes from its X-Priority header (interactive or bulk), else from its endpoint, and its
+# deadline from X-Deadline-Ms, else INTERACTIVE_DEADLINE_MS / BULK_DEADLINE_MS.
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", WORKERS * WORKER_CONCURRENCY or 8))
+BULK_SLOTS = int(os.environ.get("BULK_SLOTS", 1))
+MAX_WAITING_INTERACTIVE = int(os.environ.get("MAX_WAITING_INTERACTIVE", 64))
+MAX_WAITING_BULK = int(os.environ.get("MAX_WAITING_BULK", 16))
+INTERACTIVE_DEADLINE_MS = float(os.environ.get("INTERACTIVE_DEADLINE_MS", 10000))
+BULK_DEADLINE_MS = float(os.environ.get("BULK_DEADLINE_MS", 120000))
+BULK_ENDPOINTS = {"/detect-and-segment/"}
+# Identical concurrent inference jobs (same images, parameters and priority class) run once,
+# the duplicates sharing the first one's result; COALESCE_REQUESTS=0 runs every job
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "1") != "0"
+# With PROFILE_DIR set, a request sent with `X-Profile: 1` has its inference traced by the torch
+# profiler into a Chrome trace in this directory (named in the X-Profile-Trace response header)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+
+scheduler_options = dict(max_batch_size=MAX_BATCH_SIZE, batch_window_ms=BATCH_WINDOW_MS, max_queue_size=MAX_QUEUE_SIZE)
+
+
+class SamTier:
+    """The segmentor, combined pipeline and encoder scheduler of one SAM backbone.
+
+    Tiers share the detector, and their SAM weights come from the model registry, so a
+    backbone is loaded once however many endpoints use it.
+    """
+    def __init__(self, backbone: str, detector, backend: dict):
+        from core.segmentor import Segmentor
+        from core.combined_pipeline import OwlViT_SAM_Pipeline
+        checkpoint = sam_checkpoint(backbone, SAM_CHECKPOINT_DIR)
+        self.backbone = backbone
+        self.segmentor = Segmentor(checkpoint, backbone, detector=detector, **backend)
+        self.combined_pipeline = OwlViT_SAM_Pipeline(sam_checkpoint_path=checkpoint, sam_model_type=backbone,
+                                                     detector=detector, **backend)
+        self.encoder_scheduler = BatchScheduler(f"sam-encoder-{backbone}", self.segmentor.encode_images, **scheduler_options)
+
+
+class Services:
+    """The detector, SAM tiers and schedulers shared by every endpoint.
+
+    Building them imports torch, transformers and segment_anything, so it happens on first
+    use rather than at import time; the models themselves load on their first inference.
+    """
+    def __init__(self):
+        from core.detector import OWLViTDetector
+        from core.model_registry import model_registry
+        from core.cache import sam_embedding_cache
+        self.model_registry = model_registry
+        self.sam_embedding_cache = sam_embedding_cache
+        # One detector (and its caches) is shared by every endpoint
+        self.backend = dict(precision=PRECISION, backend=BACKEND, export_dir=EXPORT_DIR)
+        self.detector = OWLViTDetector(**self.backend)
+        # SAM tiers by backbone, built on first use
+        self.sam_tiers = {}
+        self._tiers_lock = threading.Lock()
+
+        self.text_detection_scheduler = BatchScheduler("owlvit-text", self.detect_from_texts_batch, **scheduler_options)
+        self.image_detection_scheduler = BatchScheduler("owlvit-image", self.detect_similar_objects_batch, **scheduler_options)
+
+    def tier(self, backbone: str) -> SamTier:
+        with self._tiers_lock:
+            if backbone not in self.sam_tiers:
+                self.sam_tiers[backbone] = SamTier(backbone, self.detector, self.backend)
+            return self.sam_tiers[backbone]
+
+    @property
+    def schedulers(self) -> list:
+        tiers = list(self.sam_tiers.values())
+        return [self.text_detection_scheduler, self.image_detection_scheduler] + [t.encoder_scheduler for t in tiers]
+
+    def detect_from_texts_batch(self, items: list) -> list:
+        images, query_lists, thresholds = map(list, zip(*items))
+        return self.detector.detect_from_texts_batch(images, query_lists, thresholds)
+
+    def detect_similar_objects_batch(self, items: list) -> list:
+        targets, queries, thresholds = map(list, zip(*items))
+        return self.detector.detect_similar_objects_batch(targets, queries, thresholds)
+
+
+_services = None
+_services_lock = threading.Lock()
+
+def get_services() -> Services:
+    global _services
+    with _services_lock:
+        if _services is None:
+            _services = Services()
+        return _services
+
+async def services() -> Services:
+    """The shared services, built in the threadpool on first use so the event loop keeps serving."""
+    if _services is not None:
+        return _services
+    return await run_in_threadpool(get_services)
+
+def backbone_field(backbone: str, default: str) -> str:
+    """A request's `backbone` field, or the endpoint's `default` when it is not given."""
+    backbone = backbone or default
+    if backbone not in SAM_BACKBONES:
+        raise HTTPException(status_code=400, detail=f"backbone must be one of {', '.join(SAM_BACKBONES)}")
+    return backbone
+
+
+# Inference jobs: the model work behind each endpoint as one call. They run in this process's
+# threadpool, or on an inference worker when WORKERS > 0, so arguments and results must pickle.
+
+def detect_text_job(image: Image.Image, queries: list, threshold: float) -> dict:
+    svc = get_services()
+    # Batched with concurrent requests by the OWL-ViT scheduler
+    per_label = svc.text_detection_scheduler.submit((image, queries, threshold)).result()
+    return svc.detector.merge_results(per_label)
+
+def detect_image_job(target_image: Image.Image, query_image: Image.Image, threshold: float) -> dict:
+    return get_services().image_detection_scheduler.submit((target_image, query_image, threshold)).result()
+
+def combined_job(backbone: str, image: Image.Image, prompt: str, as_json: bool):
+    """The boxes and masks for `prompt`, or the annotated image."""
+    pipeline = get_services().tier(backbone).combined_pipeline
+    if as_json:
+        return pipeline.detect_and_segment(image, prompt)
+    return pipeline.run(image, prompt)[0]
+
+def encoded_segmentor(backbone: str, image: Image.Image):
+    tier = get_services().tier(backbone)
+    # Batch the SAM encoder pass with other requests; the decoder then hits the embedding cache
+    tier.encoder_scheduler.submit(image).result()
+    return tier.segmentor
+
+def segment_points_job(backbone: str, image: Image.Image, points: list, labels: list, as_json: bool):
+    segmentor = encoded_segmentor(backbone, image)
+    if as_json:
+        return segmentor.predict_mask_with_points(image, points, labels)
+    return segmentor.segment_with_points(image, points, labels)
+
+def segment_box_job(backbone: str, image: Image.Image, box: list, as_json: bool):
+    segmentor = encoded_segmentor(backbone, image)
+    if as_json:
+        return segmentor.predict_mask_with_box(image, box)
+    return segmentor.segment_with_box(image, box)
 
+def segment_text_job(backbone: str, image: Image.Image, text_prompt: str, as_json: bool):
+    segmentor = get_services().tier(backbone).segmentor
+    if as_json:
+        return segmentor.predict_mask_with_text(image, text_prompt)
+    return segmentor.segment_with_text(image, text_prompt)
 
-app = FastAPI(title="Agent Vision Small")
-segmentor = Segmentor()
-detector = OWLViTDetector()
+def embed_job(backbone: str, image: Image.Image) -> dict:
+    return encoded_segmentor(backbone, image).embed_image(image)
+
+def stats_job() -> dict:
+    from core import prefetch
+    svc = get_services()
+    return {
+        "sam_prefetch": prefetch.stats(),
+        "sam_backbones": {
+            backbone: tier.segmentor.tier_stats() for backbone, tier in list(svc.sam_tiers.items())
+        },
+        "sam_policy": {"interactive": INTERACTIVE_SAM_BACKBONE, "final": SAM_BACKBONE},
+        "sam_embedding_cache": svc.sam_embedding_cache.stats(),
+        "detection_cache": svc.detector.result_cache.stats(),
+        "schedulers": {scheduler.name: scheduler.stats() for scheduler in svc.schedulers},
+    }
+
+def run_job(job, args: tuple, ticket: admission.Ticket, profile_path: str = None) -> tuple:
+    """Run an inference job; returns its result, the stages it ran, its duration and any trace written."""
+    started = time.perf_counter()
+    # The ticket's priority and deadline apply to the schedulers the job submits to
+    with admission.bind(ticket), metrics.collect() as timings, metrics.profile(profile_path) as trace:
+        result = job(*args)
+    return result, timings.snapshot(), time.perf_counter() - started, trace
+
+worker_pool = None
+admission_controller = admission.AdmissionController(
+    MAX_IN_FLIGHT, BULK_SLOTS, {"interactive": MAX_WAITING_INTERACTIVE, "bulk": MAX_WAITING_BULK})
+# The HTTP request being served, checked for a disconnected client while its job waits or runs
+current_connection = contextvars.ContextVar("current_connection", default=None)
+
+async def watch_disconnect(ticket: admission.Ticket, connection: HTTPConnection) -> None:
+    while not await connection.is_disconnected():
+        await asyncio.sleep(admission_controller.poll_interval)
+    # Queued scheduler work for this request is dropped rather than run
+    ticket.cancelled = True
+
+# A leader whose client disconnects fails alone; the requests coalesced onto it run the job themselves
+single_flight = coalescing.SingleFlight(leader_only=(admission.ClientDisconnected,))
+
+async def infer(job, *args):
+    """Run an inference job on a worker process, or in the threadpool without WORKERS.
+
+    An identical job already in flight is awaited instead of run again (`single_flight`).
+    """
+    # Session WebSockets have no ticket: their messages are interactive, without a deadline
+    ticket = admission.current() or admission.Ticket()
+    if not COALESCE_REQUESTS:
+        return (await execute(job, args, ticket))[0]
+    timings = metrics.current()
+    started = time.perf_counter()
+    # Hashing the images is CPU work, so it stays off the event loop
+    key = await run_in_threadpool(coalescing.job_key, job, args, ticket.priority)
+    result, coalesced = await single_flight.run(key, job.__name__, lambda: execute(job, args, ticket))
+    if coalesced and timings is not None:
+        timings.add("coalesced_wait", time.perf_counter() - started)
+    return result
+
+async def execute(job, args: tuple, ticket: admission.Ticket) -> tuple:
+    """Run a job once admitted (see `admission_ticket`); returns its result and how long it ran.
+
+    The job's stage timings are added to the current request's, wherever it ran.
+    """
+    timings = metrics.current()
+    connection = current_connection.get()
+    profile_path = timings.profile_path if timings is not None else None
+    queued = time.perf_counter()
+    if timings is not None:
+        timings.note_queue_depth(f"admission-{ticket.priority}", admission_controller.waiting(ticket.priority))
+    async with admission_controller.slot(ticket, connection.is_disconnected if connection is not None else None):
+        started = time.perf_counter()
+        watcher = asyncio.create_task(watch_disconnect(ticket, connection)) if connection is not None else None
+        try:
+            if worker_pool is not None:
+                if timings is not None:
+                    timings.note_queue_depth("inference-workers", worker_pool.in_flight())
+                result, job_timings, seconds, trace = await worker_pool.run(run_job, job, args, ticket, profile_path)
+            else:
+                result, job_timings, seconds, trace = await run_in_threadpool(run_job, job, args, ticket, profile_path)
+        except Exception:
+            if ticket.cancelled:
+                # Whatever failed, nobody is waiting for this request's result any more
+                raise admission.ClientDisconnected("Client disconnected while its job ran")
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+    if timings is not None:
+        timings.add("admission_wait", started - queued)
+        timings.merge(job_timings)
+        if worker_pool is not None:
+            # Queueing for a worker and pickling the arguments and result
+            timings.add("worker_dispatch", time.perf_counter() - started - seconds)
+        timings.trace = trace or timings.trace
+    return result, seconds
+
+
+# Startup timings, reported by /readyz
+startup = {
+    "ready": not WARMUP,
+    "warmup_error": None,
+    "import_seconds": None,
+    "serving_after_seconds": None,
+    "warmup_seconds": None,
+    "time_to_first_inference_seconds": None,
+}
+
+def record_first_inference():
+    if startup["time_to_first_inference_seconds"] is None:
+        startup["time_to_first_inference_seconds"] = round(time.monotonic() - STARTED_AT, 3)
+        print(f"Time to first inference: {startup['time_to_first_inference_seconds']:.2f}s")
+
+def warm_models():
+    """Load every model and run one small inference through each."""
+    svc = get_services()
+    image = Image.new("RGB", (64, 64))
+    svc.detector.detect_from_texts(image, ["an object"])
+    # Both tiers of the interactive policy stay resident
+    for backbone in {INTERACTIVE_SAM_BACKBONE, SAM_BACKBONE}:
+        svc.tier(backbone).segmentor.encode_images([image])
+
+def warm_up():
+    """Warm the models up, then mark the server ready."""
+    started = time.monotonic()
+    try:
+        warm_models()
+    except Exception as exc:
+        traceback.print_exc()
+        startup["warmup_error"] = str(exc)
+        return
+    startup["warmup_seconds"] = round(time.monotonic() - started, 3)
+    record_first_inference()
+    startup["ready"] = True
+
+# Models loaded before forking the workers, held for the life of the process
+preloaded = []
+
+def start_worker_pool():
+    """Load the default models into the registry, then fork the inference workers that share them."""
+    import torch
+    from core.workers import WorkerPool
+    from core.model_registry import default_device
+    from core.detector import OWLViTDetector
+    from core.segmentor import Segmentor
+    if default_device() != "cpu":
+        raise RuntimeError("WORKERS is for CPU serving; on a GPU run a single process")
+    started = time.monotonic()
+    # OpenMP's thread pool does not survive a fork, so nothing here may run multi-threaded
+    torch.set_num_threads(1)
+    # ONNX Runtime sessions do not survive one either: with the onnx backend each worker
+    # loads its own (memory-light, see core/onnx_backend.py)
+    if BACKEND == "torch":
+        backend = dict(precision=PRECISION, backend=BACKEND, export_dir=EXPORT_DIR)
+        detector = OWLViTDetector(**backend)
+        preloaded.append(detector.graphs)
+        for backbone in {INTERACTIVE_SAM_BACKBONE, SAM_BACKBONE}:
+            segmentor = Segmentor(sam_checkpoint(backbone, SAM_CHECKPOINT_DIR), backbone, detector=detector, **backend)
+            preloaded.append(segmentor.sam_predictor)
+    pool = WorkerPool(WORKERS, WORKER_THREADS or None, initializer=warm_models if WARMUP else None,
+                      concurrency=WORKER_CONCURRENCY)
+    startup["warmup_seconds"] = round(time.monotonic() - started, 3)
+    return pool
+
+session_store = SessionStore(idle_timeout=SESSION_IDLE_SECONDS, max_sessions=MAX_SESSIONS)
+image_store = ImageStore(IMAGE_STORE_MB * 2**20)
+
+async def evict_idle_sessions():
+    while True:
+        await asyncio.sleep(min(60.0, SESSION_IDLE_SECONDS / 2))
+        session_store.evict_idle()
+
+@asynccontextmanager
+async def lifespan(app):
+    global worker_pool
+    if WORKERS:
+        # Forked before serving, while this process runs no other threads
+        worker_pool = start_worker_pool()
+        startup["ready"] = True
+    startup["serving_after_seconds"] = round(time.monotonic() - STARTED_AT, 3)
+    if WARMUP and not WORKERS:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    sweeper = asyncio.create_task(evict_idle_sessions())
+    yield
+    sweeper.cancel()
+    if worker_pool is not None:
+        worker_pool.close()
+
+
+async def admission_ticket(connection: HTTPConnection):
+    """Bind an HTTP request's priority class and deadline for `infer`; a dependency of every route."""
+    if connection.scope["type"] != "http":
+        yield
+        return
+    route = connection.scope.get("route")
+    default = "bulk" if route is not None and route.path in BULK_ENDPOINTS else "interactive"
+    priority = connection.headers.get("x-priority", default).lower()
+    if priority not in admission.PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"X-Priority must be one of {', '.join(admission.PRIORITIES)}")
+    try:
+        deadline_ms = float(connection.headers.get(
+            "x-deadline-ms", BULK_DEADLINE_MS if priority == "bulk" else INTERACTIVE_DEADLINE_MS))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Deadline-Ms must be a number of milliseconds")
+    ticket = admission.Ticket(priority, time.time() + deadline_ms / 1000)
+    token = current_connection.set(connection)
+    try:
+        with admission.bind(ticket):
+            yield
+    finally:
+        current_connection.reset(token)
+
+
+app = FastAPI(title="Agent Vision Small", lifespan=lifespan, dependencies=[Depends(admission_ticket)])
 visualizer = ResultsVisualizer()
 
+@app.middleware("http")
+async def first_inference_timer(request, call_next):
+    response = await call_next(request)
+    if request.method == "POST" and response.status_code == 200:
+        record_first_inference()
+    return response
+
+requests_in_progress = 0
+
+@app.middleware("http")
+async def server_timing(request, call_next):
+    """Time every request's stages into a Server-Timing header and the /metrics histograms."""
+    global requests_in_progress
+    profile_path = None
+    if PROFILE_DIR and request.headers.get("x-profile") == "1":
+        name = request.url.path.strip("/").replace("/", "-") or "root"
+        profile_path = os.path.join(PROFILE_DIR, f"{name}-{time.time_ns()}.json")
+    started = time.perf_counter()
+    requests_in_progress += 1
+    try:
+        with metrics.collect(metrics.RequestTimings(profile_path)) as timings:
+            response = await call_next(request)
+    finally:
+        requests_in_progress -= 1
+    total = time.perf_counter() - started
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    metrics.observe_request(endpoint, request.method, response.status_code, total, timings)
+    response.headers["Server-Timing"] = timings.server_timing(total)
+    if timings.trace:
+        response.headers["X-Profile-Trace"] = os.path.basename(timings.trace)
+    return response
+
+@app.exception_handler(admission.Overloaded)
+async def overloaded_handler(request, exc):
+    # Full queues and missed deadlines: the client should back off, then retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+@app.exception_handler(admission.ClientDisconnected)
+async def client_disconnected_handler(request, exc):
+    # Nobody reads this; 499 (client closed request) keeps these apart in the logs and metrics
+    return Response(status_code=499)
+
+@app.exception_handler(InvalidInput)
+async def invalid_input_handler(request, exc):
+    # Inputs the models cannot use, such as a query crop OWL-ViT finds no embedding for
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(WorkerError)
+async def worker_error_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 # @app.exception_handler(Exception)
 # async def generic_exception_handler(request, exc):
 #     traceback.print_exc()
@@ -26,102 +484,494 @@ visualizer = ResultsVisualizer()
 #         content={"detail": "An internal server error occurred.", "error": str(exc)},
 #     )
 
+def decode_image(image_bytes: bytes) -> tuple:
+    """The upload decoded at model resolution, and the `ImageScale` back to the original."""
+    return decode_image_source(io.BytesIO(image_bytes), DECODE_MAX_SIDE or None)
+
+async def read_image(upload: UploadFile, field: str = "image") -> tuple:
+    """Read an uploaded image and decode it off the event loop; see `decode_image`."""
+    with metrics.stage("upload_read"):
+        image_bytes = await upload.read()
+    try:
+        return await run_in_threadpool(decode_image, image_bytes)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{field}_file is not a readable image")
+
+async def load_image(upload: Optional[UploadFile], image_id: Optional[str], field: str = "image") -> tuple:
+    """The image of an upload or of a stored image's id (see POST /images/); one of them must be given.
+
+    `field` names the `<field>_file` and `<field>_id` form fields in errors.
+    """
+    if (upload is None) == (image_id is None):
+        raise HTTPException(status_code=400, detail=f"Send either {field}_file or {field}_id")
+    if upload is not None:
+        return await read_image(upload, field)
+    stored = image_store.get(image_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or evicted {field}_id; upload the image again")
+    return stored.image, stored.scale
+
+def parse_box(box: str, field: str = "box") -> list:
+    try:
+        box = [float(v) for v in json.loads(box)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail=f"{field} must be a JSON list [x1, y1, x2, y2]")
+    if len(box) != 4 or not all(map(math.isfinite, box)):
+        raise HTTPException(status_code=400, detail=f"{field} must be a JSON list [x1, y1, x2, y2]")
+    return box
+
+def parse_points(points: str, labels: str) -> tuple:
+    """Point prompts [[x, y], ...] and their labels [1 (foreground) or 0 (background), ...]."""
+    try:
+        points = [[float(x), float(y)] for x, y in json.loads(points)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="points must be a JSON list of [x, y] pairs")
+    if not points or not all(math.isfinite(v) for point in points for v in point):
+        raise HTTPException(status_code=400, detail="points must be a JSON list of [x, y] pairs")
+    try:
+        labels = json.loads(labels)
+    except ValueError:
+        labels = None
+    if not isinstance(labels, list) or not all(type(label) is int and label in (0, 1) for label in labels):
+        raise HTTPException(status_code=400, detail="labels must be a JSON list of 1 (foreground) or 0 (background)")
+    if len(labels) != len(points):
+        raise HTTPException(status_code=400, detail=f"Got {len(points)} points but {len(labels)} labels")
+    return points, labels
+
+# With output=json, endpoints skip rendering and return coordinates and RLE masks instead:
+# {"width", "height", "detections": [{"box", "score", "label"?}], "masks": [{"segmentation", "area", "box", "label"?}]}
+OUTPUT_MODES = ("image", "json")
+# Rendered images can be returned in any of these formats: name -> (PIL format, media type)
+IMAGE_FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+def parse_accept(header: str) -> list:
+    """Media types of an Accept header, most preferred first."""
+    ranked = []
+    for position, part in enumerate(header.split(",")):
+        media_type, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            ranked.append((-quality, position, media_type.strip().lower()))
+    return [media_type for _, _, media_type in sorted(ranked)]
+
+class ResponseOptions:
+    """How an endpoint answers: JSON, or a rendered image in a negotiated format, quality and size.
+
+    The `output` and `image_format` form fields win; otherwise they are picked from the Accept
+    header (application/json, image/webp, image/jpeg or image/png), defaulting to a PNG image.
+    """
+    def __init__(
+        self,
+        request: Request,
+        output: str = Form(None),  # "image" for a rendered image, "json" for boxes and RLE masks
+        image_format: str = Form(None),  # "png", "jpeg" or "webp"
+        quality: int = Form(85),  # JPEG/WebP quality, 1-100
+        max_side: int = Form(None),  # Downscale the rendered image so its longer side fits
+    ):
+        accepted = parse_accept(request.headers.get("accept", ""))
+        if output is None:
+            output = "json" if accepted[:1] == ["application/json"] else "image"
+        if output not in OUTPUT_MODES:
+            raise HTTPException(status_code=400, detail=f"output must be one of {', '.join(OUTPUT_MODES)}")
+        if image_format is None:
+            media_formats = {media_type: name for name, (_, media_type) in IMAGE_FORMATS.items()}
+            image_format = next((media_formats[m] for m in accepted if m in media_formats), "png")
+        image_format = image_format.lower()
+        if image_format not in IMAGE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"image_format must be one of {', '.join(IMAGE_FORMATS)}")
+        if not 1 <= quality <= 100:
+            raise HTTPException(status_code=400, detail="quality must be between 1 and 100")
+        if max_side is not None and max_side < 1:
+            raise HTTPException(status_code=400, detail="max_side must be positive")
+        self.as_json = output == "json"
+        self.image_format = image_format
+        self.quality = quality
+        self.max_side = max_side
+
+    def image_response(self, image: Image.Image, original_size: tuple = None) -> Response:
+        """Encode a rendered image as negotiated.
+
+        The image is returned at `original_size` (the upload's size), even when it was rendered
+        on a smaller decode, or fitted to `max_side`; a downscaled preview reports its scale
+        in X-Image-Scale.
+        """
+        headers = {"Vary": "Accept"}
+        original_size = original_size or image.size
+        size = original_size
+        if self.max_side and max(original_size) > self.max_side:
+            scale = self.max_side / max(original_size)
+            size = (max(1, round(original_size[0] * scale)), max(1, round(original_size[1] * scale)))
+        if image.size != size:
+            with metrics.stage("render_resize"):
+                image = image.resize(size, Image.BILINEAR)
+        if size != original_size:
+            headers["X-Image-Scale"] = f"{size[0] / original_size[0]:.6f}"
+        pil_format, media_type = IMAGE_FORMATS[self.image_format]
+        if pil_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        buffered = io.BytesIO()
+        with metrics.stage("encode_image"):
+            if pil_format == "PNG":
+                image.save(buffered, format=pil_format)
+            else:
+                image.save(buffered, format=pil_format, quality=self.quality)
+        return Response(content=buffered.getvalue(), media_type=media_type, headers=headers)
+
+def render_detections(image: Image.Image, results: dict, options: ResponseOptions, scale: ImageScale) -> Response:
+    return options.image_response(visualizer.draw_detections(image, results), scale.original_size)
+
+# JSON results are always in the coordinates of the uploaded (original) image
+def result_payload(scale: ImageScale, detections: list = (), masks: list = ()) -> dict:
+    width, height = scale.original_size
+    return {"width": width, "height": height, "detections": list(detections), "masks": list(masks)}
+
+def round_box(box: list) -> list:
+    return [round(v, 2) + 0.0 for v in box]  # + 0.0 turns -0.0 into 0.0
+
+def detection_entries(results: dict, scale: ImageScale, label_names: list = None) -> list:
+    """Boxes and scores of a detector result; `labels` index into `label_names` when given."""
+    labels = results["labels"].tolist() if label_names is not None else None
+    boxes = scale.boxes_to_original(results["boxes"].tolist())
+    entries = []
+    for i, (box, score) in enumerate(zip(boxes, results["scores"].tolist())):
+        entry = {"box": round_box(box), "score": round(score, 4)}
+        if labels is not None:
+            entry["label"] = label_names[int(labels[i])]
+        entries.append(entry)
+    return entries
+
+def mask_entry(mask: np.ndarray, scale: ImageScale, label: str = None) -> dict:
+    """A binary mask as COCO-style RLE, with its area and bounding box (x1, y1, x2, y2)."""
+    with metrics.stage("encode_rle"):
+        mask = scale.mask_to_original(mask)
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        box = [int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1] if len(rows) else None
+        entry = {"segmentation": encode_rle(mask), "area": int(mask.sum()), "box": box}
+    if label is not None:
+        entry["label"] = label
+    return entry
+
+def combined_payload(scale: ImageScale, detected_boxes: dict, segmentation_masks: dict) -> dict:
+    return result_payload(
+        scale,
+        detections=[{"box": round_box(box), "label": query}
+                    for query, box in zip(detected_boxes, scale.boxes_to_original(detected_boxes.values()))],
+        masks=[mask_entry(mask, scale, query) for query, mask in segmentation_masks.items()],
+    )
+
+# Decoding, inference, rendering and PNG encoding all run off the event loop so
+# concurrent requests are not serialized behind each other.
+
 @app.post("/detect-and-segment/")
 async def detect_and_segment(
     prompt: str = Form(...),
-    image_file: UploadFile = File(...)
+    image_file: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),  # Instead of image_file, an image uploaded to /images/
+    backbone: Optional[str] = Form(None),
+    options: ResponseOptions = Depends()
 ):
     """API endpoint for combined OWL-ViT detection and SAM segmentation."""
-    image_bytes = await image_file.read()
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    
+    backbone = backbone_field(backbone, SAM_BACKBONE)
+    image, scale = await load_image(image_file, image_id)
+
+    if options.as_json:
+        detected_boxes, segmentation_masks = await infer(combined_job, backbone, image, prompt, True)
+        return JSONResponse(await run_in_threadpool(combined_payload, scale, detected_boxes, segmentation_masks))
+
     # Run the combined pipeline
-    result_image, _, _ = combined_pipeline.run(image, prompt)
-    
-    # Convert result image to bytes to send back to the client
-    buffered = io.BytesIO()
-    result_image.save(buffered, format="PNG")
+    result_image = await infer(combined_job, backbone, image, prompt, False)
     
-    return Response(content=buffered.getvalue(), media_type="image/png")
+    return await run_in_threadpool(options.image_response, result_image, scale.original_size)
 
 @app.post("/detect-from-text/")
 async def detect_from_text(
-    text_prompt: str = Form(...),
-    image_file: UploadFile = File(...),
-    threshold: float = Form(...)  # Add threshold parameter
+    text_prompt: List[str] = Form(...),  # Repeat the field to detect several prompts in one pass
+    image_file: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),  # Instead of image_file, an image uploaded to /images/
+    threshold: float = Form(...),  # Add threshold parameter
+    options: ResponseOptions = Depends()
 ):
-    image_bytes = await image_file.read()
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    image, scale = await load_image(image_file, image_id)
 
-    # Use the threshold from the form
-    results = detector.detect_from_text(image, text_prompt, threshold=threshold)
-    
-    result_image = visualizer.draw_detections(image.copy(), results)
-    
-    buffered = io.BytesIO()
-    result_image.save(buffered, format="PNG")
+    results = await infer(detect_text_job, image, text_prompt, threshold)
+    if options.as_json:
+        return JSONResponse(result_payload(scale, detection_entries(results, scale, text_prompt)))
     
-    return Response(content=buffered.getvalue(), media_type="image/png")
+    return await run_in_threadpool(render_detections, image, results, options, scale)
 
 
 @app.post("/detect-from-image-prompt/")
 async def detect_from_image_prompt(
-    target_image_file: UploadFile = File(...),
-    query_image_file: UploadFile = File(...),
-    threshold: float = Form(...)  # Add threshold parameter
+    target_image_file: Optional[UploadFile] = File(None),
+    query_image_file: Optional[UploadFile] = File(None),
+    threshold: float = Form(...),  # Add threshold parameter
+    target_image_id: Optional[str] = Form(None),
+    query_image_id: Optional[str] = Form(None),
+    query_box: Optional[str] = Form(None),  # JSON [x1, y1, x2, y2] on the target: the query is that crop
+    options: ResponseOptions = Depends()
 ):
-    target_image_bytes = await target_image_file.read()
-    target_image = Image.open(io.BytesIO(target_image_bytes)).convert("RGB")
+    """Detect objects like a query image: an upload, a stored image, or a box on the target."""
+    target_image, scale = await load_image(target_image_file, target_image_id, "target_image")
+    if query_box is not None:
+        if query_image_file is not None or query_image_id is not None:
+            raise HTTPException(status_code=400, detail="Send one of query_image_file, query_image_id or query_box")
+        # The box is in original-image coordinates; crop it from the decoded target
+        x1, y1, x2, y2 = scale.box_to_decoded(parse_box(query_box, "query_box"))
+        crop = (max(0, round(x1)), max(0, round(y1)), min(target_image.width, round(x2)), min(target_image.height, round(y2)))
+        if crop[2] <= crop[0] or crop[3] <= crop[1]:
+            raise HTTPException(status_code=400, detail="query_box does not cover any of the target image")
+        query_image = target_image.crop(crop)
+    else:
+        query_image, _ = await load_image(query_image_file, query_image_id, "query_image")
 
-    query_image_bytes = await query_image_file.read()
-    query_image = Image.open(io.BytesIO(query_image_bytes)).convert("RGB")
-
-    # Use the threshold from the form
-    results = detector.detect_similar_objects(target_image, query_image, threshold=threshold)
+    results = await infer(detect_image_job, target_image, query_image, threshold)
+    if options.as_json:
+        return JSONResponse(result_payload(scale, detection_entries(results, scale)))
     
-    result_image = visualizer.draw_detections(target_image.copy(), results)
+    return await run_in_threadpool(render_detections, target_image, results, options, scale)
 
-    buffered = io.BytesIO()
-    result_image.save(buffered, format="PNG")
-    
-    return Response(content=buffered.getvalue(), media_type="image/png")
 @app.post("/segment-with-points/")
 async def segment_with_points_endpoint(
     points: str = Form(...), # JSON string of points
     labels: str = Form(...), # JSON string of labels
-    image_file: UploadFile = File(...)
+    image_file: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),  # Instead of image_file, an image uploaded to /images/
+    backbone: Optional[str] = Form(None),
+    options: ResponseOptions = Depends()
 ):
-    image = Image.open(io.BytesIO(await image_file.read())).convert("RGB")
-    result_image = segmentor.segment_with_points(image, json.loads(points), json.loads(labels))
+    # Point clicks are interactive, so they default to the fast backbone
+    backbone = backbone_field(backbone, INTERACTIVE_SAM_BACKBONE)
+    points, labels = parse_points(points, labels)
+    image, scale = await load_image(image_file, image_id)
+    # Points are given in original-image coordinates
+    points = scale.points_to_decoded(points)
+    if options.as_json:
+        mask = await infer(segment_points_job, backbone, image, points, labels, True)
+        return JSONResponse(result_payload(scale, masks=[await run_in_threadpool(mask_entry, mask, scale)]))
+    result_image = await infer(segment_points_job, backbone, image, points, labels, False)
     
-    buffered = io.BytesIO()
-    result_image.save(buffered, format="PNG")
-    return Response(content=buffered.getvalue(), media_type="image/png")
+    return await run_in_threadpool(options.image_response, result_image, scale.original_size)
 
 @app.post("/segment-with-box/")
 async def segment_with_box_endpoint(
     box: str = Form(...), # JSON string of the box
-    image_file: UploadFile = File(...)
+    image_file: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),  # Instead of image_file, an image uploaded to /images/
+    backbone: Optional[str] = Form(None),
+    options: ResponseOptions = Depends()
 ):
-    image = Image.open(io.BytesIO(await image_file.read())).convert("RGB")
-    result_image = segmentor.segment_with_box(image, json.loads(box))
+    backbone = backbone_field(backbone, SAM_BACKBONE)
+    image, scale = await load_image(image_file, image_id)
+    box = scale.box_to_decoded(parse_box(box))
+    if options.as_json:
+        mask = await infer(segment_box_job, backbone, image, box, True)
+        return JSONResponse(result_payload(scale, masks=[await run_in_threadpool(mask_entry, mask, scale)]))
+    result_image = await infer(segment_box_job, backbone, image, box, False)
 
-    buffered = io.BytesIO()
-    result_image.save(buffered, format="PNG")
-    return Response(content=buffered.getvalue(), media_type="image/png")
+    return await run_in_threadpool(options.image_response, result_image, scale.original_size)
 
 @app.post("/segment-with-text/")
 async def segment_with_text_endpoint(
     text_prompt: str = Form(...),
-    image_file: UploadFile = File(...)
+    image_file: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),  # Instead of image_file, an image uploaded to /images/
+    backbone: Optional[str] = Form(None),
+    options: ResponseOptions = Depends()
 ):
-    image = Image.open(io.BytesIO(await image_file.read())).convert("RGB")
-    result_image = segmentor.segment_with_text(image, text_prompt)
+    backbone = backbone_field(backbone, SAM_BACKBONE)
+    image, scale = await load_image(image_file, image_id)
+    if options.as_json:
+        prediction = await infer(segment_text_job, backbone, image, text_prompt, True)
+        if prediction is None:
+            return JSONResponse(result_payload(scale))
+        box, score, mask = prediction
+        detection = {"box": round_box(scale.boxes_to_original([box])[0]), "score": round(score, 4), "label": text_prompt}
+        return JSONResponse(result_payload(scale, [detection], [await run_in_threadpool(mask_entry, mask, scale, text_prompt)]))
+    result_image = await infer(segment_text_job, backbone, image, text_prompt, False)
+
+    return await run_in_threadpool(options.image_response, result_image, scale.original_size)
+
+
+@app.post("/images/")
+async def upload_image(image_file: UploadFile = File(...)):
+    """Store an image for use by id; every endpoint taking an image file also takes its `image_id`.
+
+    The id is a content hash, so uploading the same file again returns the same id.
+    """
+    with metrics.stage("upload_read"):
+        image_bytes = await image_file.read()
+    try:
+        stored = await run_in_threadpool(image_store.add, image_bytes, decode_image)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=400, detail="image_file is not a readable image")
+    return stored.info()
+
+
+@app.delete("/images/{image_id}")
+async def delete_image(image_id: str):
+    if not image_store.remove(image_id):
+        raise HTTPException(status_code=404, detail="Unknown or evicted image_id")
+    return {"deleted": image_id}
+
+
+@app.post("/sessions/")
+async def create_session(image_file: Optional[UploadFile] = File(None), backbone: Optional[str] = Form(None),
+                         image_id: Optional[str] = Form(None)):
+    """Upload an image once for interactive segmentation; prompts then go over the session's WebSocket."""
+    backbone = backbone_field(backbone, INTERACTIVE_SAM_BACKBONE)
+    image, scale = await load_image(image_file, image_id)
+    embedding = await infer(embed_job, backbone, image)
+    session = session_store.create(embedding, scale, image, backbone)
+    # Prompts use original-image coordinates; masks come back at the decoded (model) resolution
+    return {
+        "session_id": session.session_id,
+        "backbone": backbone,
+        "final_backbone": SAM_BACKBONE,
+        "width": scale.original_size[0],
+        "height": scale.original_size[1],
+        "mask_width": image.width,
+        "mask_height": image.height,
+        "idle_timeout_seconds": SESSION_IDLE_SECONDS,
+    }
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not session_store.remove(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"deleted": session_id}
+
+
+@app.websocket("/sessions/{session_id}/ws")
+async def session_socket(websocket: WebSocket, session_id: str):
+    """Streams point/box prompts in and RLE mask deltas out; only the SAM decoder runs per prompt.
+
+    `{"type": "final", "backbone"?: ...}` re-runs the prompts so far on the final backbone
+    (SAM_BACKBONE unless given) and replies with its mask.
+    """
+    if session_store.get(session_id) is None:
+        await websocket.close(code=4404, reason="Unknown or expired session")
+        return
+    await websocket.accept()
+    # Sessions live in this process, and so does their decoder; with WORKERS > 0 only the
+    # image encoder runs on the inference workers
+    svc = await services()
+    try:
+        while True:
+            text = await websocket.receive_text()
+            session = session_store.get(session_id)
+            if session is None:
+                await websocket.close(code=4404, reason="Session expired")
+                return
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("a message must be a JSON object")
+                if message.get("type") == "final":
+                    if not session.points and session.box is None:
+                        raise ValueError("Nothing to finalize: send a point or box first")
+                    backbone = check_backbone(message.get("backbone", SAM_BACKBONE))
+                    embedding = await infer(embed_job, backbone, session.image)
+                    tier = await run_in_threadpool(svc.tier, backbone)
+                    reply = await run_in_threadpool(session.finalize, tier.segmentor, embedding)
+                else:
+                    tier = await run_in_threadpool(svc.tier, session.backbone)
+                    reply = await run_in_threadpool(session.prompt, tier.segmentor, message)
+            except (ValueError, KeyError, TypeError) as exc:
+                reply = {"type": "error", "detail": f"Invalid prompt: {exc}"}
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/models/")
+async def loaded_models():
+    """Reports every model resident in this process and the memory it holds.
+
+    With WORKERS > 0 these are the weights the workers were forked with and share.
+    """
+    if _services is None and worker_pool is None:
+        return {"models": []}
+    from core.model_registry import model_registry
+    return {"models": model_registry.memory_report()}
+
+
+@app.get("/stats/")
+async def cache_stats():
+    """Cache hit/miss counters and memory use, scheduler queue depth and batch sizes, and the
+    resident memory and encoder/decoder latency of every SAM backbone in use.
+
+    With WORKERS > 0 every worker has its own caches and schedulers, reported under `workers`.
+    """
+    if worker_pool is None:
+        stats = await run_in_threadpool(stats_job)
+    else:
+        futures = worker_pool.broadcast(stats_job)
+        results = await asyncio.gather(*map(asyncio.wrap_future, futures), return_exceptions=True)
+        stats = {"workers": [
+            dict(worker, **(result if isinstance(result, dict) else {"error": str(result)}))
+            for worker, result in zip(worker_pool.stats(), results)
+        ]}
+    stats["admission"] = admission_controller.stats()
+    stats["coalescing"] = single_flight.stats()
+    stats["sessions"] = session_store.stats()
+    stats["image_store"] = image_store.stats()
+    return stats
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus histograms of request latency, per-stage time and queue depth, plus current queue depths."""
+    gauges = [metrics.gauge_exposition(
+        "vision_requests_in_progress", "HTTP requests being served.", (), {(): requests_in_progress})]
+    if worker_pool is not None:
+        gauges.append(metrics.gauge_exposition(
+            "vision_worker_in_flight", "Tasks queued on or running in each inference worker.", ("worker",),
+            {(str(w["worker"]),): w["in_flight"] for w in worker_pool.stats()}))
+    elif _services is not None:
+        gauges.append(metrics.gauge_exposition(
+            "vision_scheduler_queue_depth", "Requests waiting in each micro-batching scheduler.", ("scheduler",),
+            {(s.name,): s.queue_depth() for s in _services.schedulers}))
+    admission_stats = admission_controller.stats()
+    gauges.append(metrics.gauge_exposition(
+        "vision_admission_running", "Inference jobs running per priority class.", ("priority",),
+        {(p,): admission_stats[p]["running"] for p in admission.PRIORITIES}))
+    gauges.append(metrics.gauge_exposition(
+        "vision_admission_waiting", "Requests waiting for an inference slot per priority class.", ("priority",),
+        {(p,): admission_stats[p]["waiting"] for p in admission.PRIORITIES}))
+    coalescing_stats = single_flight.stats()["jobs"]
+    gauges.append(metrics.counter_exposition(
+        "vision_coalesced_requests_total", "Inference jobs served from an identical job already in flight.", ("job",),
+        {(job,): counts["coalesced"] for job, counts in coalescing_stats.items()}))
+    gauges.append(metrics.counter_exposition(
+        "vision_coalesced_seconds_total", "Inference time saved by coalescing identical jobs.", ("job",),
+        {(job,): counts["saved_seconds"] for job, counts in coalescing_stats.items()}))
+    gauges.append(metrics.gauge_exposition(
+        "vision_sessions", "Interactive segmentation sessions held.", (), {(): session_store.stats()["sessions"]}))
+    return PlainTextResponse(metrics.exposition(gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the models are loaded (always true without WARMUP=1), plus startup timings."""
+    return JSONResponse(status_code=200 if startup["ready"] else 503, content=startup)
 
-    buffered = io.BytesIO()
-    result_image.save(buffered, format="PNG")
-    return Response(content=buffered.getvalue(), media_type="image/png")
 
+startup["import_seconds"] = round(time.monotonic() - STARTED_AT, 3)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
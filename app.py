@@ -4,7 +4,13 @@ import requests
 from PIL import Image
 import io
 import json
+import time
+import hashlib
+from collections import OrderedDict
 from gradio_image_annotation import image_annotator
+from websockets.exceptions import ConnectionClosed
+from ui.session_client import SegmentationSessionClient
+from ui.visualizer import ResultsVisualizer
 
 # API Endpoints remain the same
 API_URL_TEXT = "http://127.0.0.1:8000/detect-from-text/"
@@ -13,16 +19,67 @@ API_URL_DETECT_SEGMENT = "http://127.0.0.1:8000/detect-and-segment/"
 API_URL_SEGMENT_POINTS = "http://127.0.0.1:8000/segment-with-points/"
 API_URL_SEGMENT_BOX = "http://127.0.0.1:8000/segment-with-box/"
 API_URL_SEGMENT_TEXT = "http://127.0.0.1:8000/segment-with-text/"
+API_URL = "http://127.0.0.1:8000"
+API_URL_IMAGES = "http://127.0.0.1:8000/images/"
+
+visualizer = ResultsVisualizer()
+
+# Uploads are sent as JPEG, downscaled to the largest size the models use (SAM resizes to
+# 1024 px on the long side, OWL-ViT to 768 px), and results come back as display-sized JPEGs
+UPLOAD_MAX_SIDE = 1024
+UPLOAD_QUALITY = 90
+RESPONSE_OPTIONS = {'image_format': 'jpeg', 'quality': 90, 'max_side': 1280}
+
+def encode_upload(image):
+    """JPEG bytes of `image` for upload, and the scale applied to fit UPLOAD_MAX_SIDE."""
+    image = image.convert("RGB")
+    scale = min(1.0, UPLOAD_MAX_SIDE / max(image.size))
+    if scale < 1.0:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='JPEG', quality=UPLOAD_QUALITY)
+    return img_byte_arr.getvalue(), scale
+
+# Images are uploaded to the API's image store once; requests then send only the image_id.
+# Keyed by a hash of the pixels, since Gradio hands every handler a fresh copy of the image.
+uploaded_images = OrderedDict()
+MAX_UPLOADED_IMAGES = 32
+
+def upload_image(image, refresh=False):
+    """The API image_id of `image`, uploading it only if it is new (or `refresh`), and the upload scale."""
+    key = hashlib.blake2b(f"{image.mode}:{image.size}".encode() + image.tobytes(), digest_size=16).hexdigest()
+    if not refresh and key in uploaded_images:
+        uploaded_images.move_to_end(key)
+        return uploaded_images[key]
+    image_bytes, scale = encode_upload(image)
+    response = requests.post(API_URL_IMAGES, files={'image_file': ('image.jpg', image_bytes, 'image/jpeg')})
+    if response.status_code != 200: raise gr.Error(f"API Error: {response.text}")
+    uploaded_images[key] = (response.json()['image_id'], scale)
+    while len(uploaded_images) > MAX_UPLOADED_IMAGES: uploaded_images.popitem(last=False)
+    return uploaded_images[key]
+
+def post_image(url, image, data, field='image_id'):
+    """POST `data` with `image` sent as its stored id; re-uploads once if the server evicted it."""
+    image_id, _ = upload_image(image)
+    response = requests.post(url, data={field: image_id, **data})
+    if response.status_code == 404:
+        image_id, _ = upload_image(image, refresh=True)
+        response = requests.post(url, data={field: image_id, **data})
+    return response
+# Point-prompt segmentation sessions, one per browser session: the image is uploaded once
+# and each click only sends the point and receives a mask update over a WebSocket.
+# Closed when the tab goes away, or after the server's idle timeout, which ends them anyway.
+point_sessions = {}
+POINT_SESSION_IDLE_SECONDS = 300
 
 # --- Handler Functions (no changes needed) ---
 def handle_text_detection(image, text_prompt, threshold):
     if image is None: raise gr.Error("Please upload an image.")
     if not text_prompt: raise gr.Error("Please provide a text prompt.")
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    data = {'text_prompt': text_prompt, 'threshold': threshold}
-    files = {'image_file': ('image.png', img_byte_arr.getvalue(), 'image/png')}
-    response = requests.post(API_URL_TEXT, files=files, data=data)
+    # Comma-separated prompts are sent as repeated fields and detected in a single pass
+    prompts = [p.strip() for p in text_prompt.split(",") if p.strip()]
+    data = {'text_prompt': prompts, 'threshold': threshold, **RESPONSE_OPTIONS}
+    response = post_image(API_URL_TEXT, image, data)
     if response.status_code == 200: return Image.open(io.BytesIO(response.content))
     else: raise gr.Error(f"API Error: {response.text}")
 
@@ -31,60 +88,86 @@ def handle_image_detection(annotated_data, threshold):
     if not annotated_data.get("boxes"): raise gr.Error("Please draw a bounding box.")
     image = annotated_data['image']
     box = annotated_data['boxes'][0]
-    bbox_coords = (box['xmin'], box['ymin'], box['xmax'], box['ymax'])
-    query_image = image.crop(bbox_coords)
-    target_byte_arr, query_byte_arr = io.BytesIO(), io.BytesIO()
-    image.save(target_byte_arr, format='PNG')
-    query_image.save(query_byte_arr, format='PNG')
-    data = {'threshold': threshold}
-    files = {'target_image_file': ('target.png', target_byte_arr.getvalue()), 'query_image_file': ('query.png', query_byte_arr.getvalue())}
-    response = requests.post(API_URL_IMAGE, files=files, data=data)
+    _, scale = upload_image(image)
+    # The query is the drawn box on the stored target, so no crop is uploaded
+    bbox_coords = [box[k] * scale for k in ('xmin', 'ymin', 'xmax', 'ymax')]
+    data = {'query_box': json.dumps(bbox_coords), 'threshold': threshold, **RESPONSE_OPTIONS}
+    response = post_image(API_URL_IMAGE, image, data, field='target_image_id')
     if response.status_code == 200: return Image.open(io.BytesIO(response.content))
     else: raise gr.Error(f"API Error: {response.text}")
 
 def handle_detect_and_segment(image, prompt):
     if image is None: raise gr.Error("Please upload an image.")
     if not prompt: raise gr.Error("Please provide a prompt.")
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    data = {'prompt': prompt}
-    files = {'image_file': ('image.png', img_byte_arr.getvalue())}
-    response = requests.post(API_URL_DETECT_SEGMENT, files=files, data=data)
+    data = {'prompt': prompt, **RESPONSE_OPTIONS}
+    response = post_image(API_URL_DETECT_SEGMENT, image, data)
     if response.status_code == 200: return Image.open(io.BytesIO(response.content))
     else: raise gr.Error(f"API Error: {response.text}")
 
-def handle_point_segmentation(image, evt: gr.SelectData):
-    points, labels = [evt.index], [1]
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    data = {'points': json.dumps(points), 'labels': json.dumps(labels)}
-    files = {'image_file': ('image.png', img_byte_arr.getvalue())}
-    response = requests.post(API_URL_SEGMENT_POINTS, files=files, data=data)
-    if response.status_code == 200: return Image.open(io.BytesIO(response.content))
-    else: raise gr.Error(f"API Error: {response.text}")
+def start_point_session(image, request: gr.Request):
+    close_point_session(request)
+    prune_point_sessions()
+    if image is None: return
+    image_id, scale = upload_image(image)
+    try:
+        client = SegmentationSessionClient(API_URL, image_id=image_id, scale=scale)
+    except requests.HTTPError as e:
+        if e.response.status_code != 404: raise gr.Error(f"API Error: {e.response.text}")
+        # The server evicted the stored image; upload it again
+        image_id, scale = upload_image(image, refresh=True)
+        client = SegmentationSessionClient(API_URL, image_id=image_id, scale=scale)
+    point_sessions[request.session_hash] = client
+
+def close_client(client):
+    try: client.close()
+    except (ConnectionClosed, OSError, requests.RequestException): pass
+
+def close_point_session(request: gr.Request):
+    client = point_sessions.pop(request.session_hash, None)
+    if client is not None: close_client(client)
+
+def prune_point_sessions():
+    """Close the sessions of browser tabs idle for longer than the server keeps them."""
+    cutoff = time.monotonic() - POINT_SESSION_IDLE_SECONDS
+    for session_hash, client in list(point_sessions.items()):
+        if client.last_used < cutoff and point_sessions.pop(session_hash, None) is client:
+            close_client(client)
+
+def handle_point_segmentation(image, evt: gr.SelectData, request: gr.Request):
+    if image is None: raise gr.Error("Please upload an image.")
+    if request.session_hash not in point_sessions: start_point_session(image, request)
+    try:
+        mask = point_sessions[request.session_hash].add_point(evt.index)
+    except ConnectionClosed:
+        # The session expired or the server restarted; upload the image again and retry
+        start_point_session(image, request)
+        mask = point_sessions[request.session_hash].add_point(evt.index)
+    except ValueError as e: raise gr.Error(f"API Error: {e}")
+    return visualizer.draw_mask(image, mask)
+
+def reset_point_session(image, request: gr.Request):
+    client = point_sessions.get(request.session_hash)
+    if client is not None: client.reset()
+    return image
 
 def handle_box_segmentation(annotated_data):
     if not annotated_data or not annotated_data.get("image"): raise gr.Error("Please upload an image.")
     if not annotated_data.get("boxes"): raise gr.Error("Please draw a bounding box.")
     image = annotated_data['image']
     box = annotated_data['boxes'][0]
-    bbox_coords = [box['xmin'], box['ymin'], box['xmax'], box['ymax']]
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    data = {'box': json.dumps(bbox_coords)}
-    files = {'image_file': ('image.png', img_byte_arr.getvalue())}
-    response = requests.post(API_URL_SEGMENT_BOX, files=files, data=data)
+    _, scale = upload_image(image)
+    # The box is drawn on the original image, so map it onto the downscaled upload
+    bbox_coords = [box[k] * scale for k in ('xmin', 'ymin', 'xmax', 'ymax')]
+    data = {'box': json.dumps(bbox_coords), **RESPONSE_OPTIONS}
+    response = post_image(API_URL_SEGMENT_BOX, image, data)
     if response.status_code == 200: return Image.open(io.BytesIO(response.content))
     else: raise gr.Error(f"API Error: {response.text}")
 
 def handle_text_segmentation(image, text_prompt):
     if image is None: raise gr.Error("Please upload an image.")
     if not text_prompt: raise gr.Error("Please provide a text prompt.")
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    data = {'text_prompt': text_prompt}
-    files = {'image_file': ('image.png', img_byte_arr.getvalue())}
-    response = requests.post(API_URL_SEGMENT_TEXT, files=files, data=data)
+    data = {'text_prompt': text_prompt, **RESPONSE_OPTIONS}
+    response = post_image(API_URL_SEGMENT_TEXT, image, data)
     if response.status_code == 200: return Image.open(io.BytesIO(response.content))
     else: raise gr.Error(f"API Error: {response.text}")
 
@@ -107,7 +190,7 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Interactive Vision Tasks") as demo
                 with gr.TabItem("🔎 Detection (OWL-ViT)"):
                     with gr.Tabs():
                         with gr.TabItem("Text Prompt"):
-                            gr.Markdown("1. Upload an image.\n2. Enter a text description.\n3. Click 'Detect'.")
+                            gr.Markdown("1. Upload an image.\n2. Enter one or more comma-separated descriptions.\n3. Click 'Detect'.")
                             text_det_input_image = gr.Image(type="pil", label="Input Image")
                             text_det_prompt = gr.Textbox(label="Text Prompt", placeholder="e.g., a cat, a blue car")
                             text_det_btn = gr.Button("Detect with Text", variant="primary")
@@ -121,8 +204,9 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Interactive Vision Tasks") as demo
                 with gr.TabItem("🎨 Segmentation (SAM)"):
                     with gr.Tabs():
                         with gr.TabItem("Point Prompt"):
-                            gr.Markdown("1. Upload an image.\n2. Click on an object to segment it.")
+                            gr.Markdown("1. Upload an image.\n2. Click on an object to segment it; further clicks refine the mask.\n3. Click 'New Object' to start over.")
                             point_seg_input_image = gr.Image(type="pil", label="Click on an object")
+                            point_seg_reset_btn = gr.Button("New Object")
                         
                         with gr.TabItem("Box Prompt"):
                             gr.Markdown("1. Upload, draw a box.\n2. Click 'Segment'.")
@@ -150,10 +234,15 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Interactive Vision Tasks") as demo
     # --- Event Handlers ---
     text_det_btn.click(handle_text_detection, [text_det_input_image, text_det_prompt, threshold_slider], output_image)
     img_det_btn.click(handle_image_detection, [img_det_annotator, threshold_slider], output_image)
+    point_seg_input_image.upload(start_point_session, [point_seg_input_image], None)
+    point_seg_input_image.clear(close_point_session, None, None)
     point_seg_input_image.select(handle_point_segmentation, [point_seg_input_image], output_image)
+    point_seg_reset_btn.click(reset_point_session, [point_seg_input_image], output_image)
     box_seg_btn.click(handle_box_segmentation, [box_seg_annotator], output_image)
     text_seg_btn.click(handle_text_segmentation, [text_seg_input_image, text_seg_prompt], output_image)
     combined_btn.click(handle_detect_and_segment, [combined_input_image, combined_prompt], output_image)
+    # A closed tab no longer holds its segmentation session
+    demo.unload(close_point_session)
 
 if __name__ == "__main__":
     demo.launch()
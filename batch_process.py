@@ -1,63 +1,161 @@
 # one_shot_object_detection/batch_process.py
 import os
+import json
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PIL import Image
-from core.pipeline import DetectionPipeline
-from ui.selector import BoundingBoxSelector
 from ui.visualizer import ResultsVisualizer
 
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
 def main(args):
-    if not os.path.exists(args.reference_image):
+    # Imported here so `--help` and argument errors do not pay for loading torch and transformers
+    from core.pipeline import DetectionPipeline
+    from core.detector import QueryEmbedding
+    has_saved_embedding = args.query_embedding and os.path.exists(args.query_embedding)
+    if not has_saved_embedding and not (args.reference_image and os.path.exists(args.reference_image)):
         print(f"Error: Reference image not found at {args.reference_image}")
         return
 
-    pipeline = DetectionPipeline()
+    pipeline = DetectionPipeline(precision=args.precision)
     visualizer = ResultsVisualizer()
 
-    # Select BBox on reference image
-    ref_image_for_selection = Image.open(args.reference_image).convert("RGB")
-    selector = BoundingBoxSelector(ref_image_for_selection)
-    reference_bbox = selector.select_bbox()
+    if has_saved_embedding:
+        # Reuse a saved query embedding instead of selecting and embedding the reference again
+        query_embedding = QueryEmbedding.load(args.query_embedding, device=pipeline.detector.device)
+        print(f"Loaded query embedding from {args.query_embedding}")
+    else:
+        # Select BBox on reference image
+        from ui.selector import BoundingBoxSelector
+        ref_image_for_selection = Image.open(args.reference_image).convert("RGB")
+        selector = BoundingBoxSelector(ref_image_for_selection)
+        reference_bbox = selector.select_bbox()
 
-    if not reference_bbox:
-        print("No bounding box selected. Aborting batch process.")
-        return
+        if not reference_bbox:
+            print("No bounding box selected. Aborting batch process.")
+            return
+
+        query_embedding = pipeline.embed_reference(args.reference_image, reference_bbox)
+        if args.query_embedding:
+            query_embedding.save(args.query_embedding)
+            print(f"Saved query embedding to {args.query_embedding}")
     
     # Prepare directories
     target_dir = Path(args.target_dir)
     output_dir = Path(args.output_dir)
-    output_dir.mkdir(exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
 
-    image_files = list(target_dir.glob("*.jpg")) + list(target_dir.glob("*.png"))
-    
-    if not image_files:
+    # Every finished image is appended to the manifest, so an interrupted run resumes where it stopped
+    manifest_path = output_dir / "results.jsonl"
+    completed = load_completed(manifest_path)
+    if completed:
+        print(f"Resuming: {len(completed)} images already processed according to {manifest_path}")
+
+    image_files = (str(p) for p in iter_image_files(target_dir) if str(p) not in completed)
+
+    print("\nStarting batch processing...")
+    manifest_lock = threading.Lock()
+    # Bounds the annotated images waiting on the writers so memory stays flat on any folder size
+    in_flight = threading.BoundedSemaphore(args.write_workers * 2)
+    processed = 0
+
+    def save(manifest, path_str, image, detections, scale):
+        try:
+            record = {"path": path_str}
+            if detections is None:
+                record["error"] = "unreadable image"
+            else:
+                annotated_image = visualizer.draw_detections(image, detections)
+                # Drawn on the decode; saved at the original size so it matches the manifest boxes
+                if annotated_image.size != scale.original_size:
+                    annotated_image = annotated_image.resize(scale.original_size, Image.BILINEAR)
+                output_filename = output_dir / f"annotated_{Path(path_str).name}"
+                annotated_image.save(output_filename)
+                # Boxes in the manifest are in original-image coordinates
+                record.update(
+                    output=str(output_filename),
+                    width=scale.original_size[0],
+                    height=scale.original_size[1],
+                    boxes=[[round(v, 2) for v in box] for box in scale.boxes_to_original(detections["boxes"].tolist())],
+                    scores=[round(v, 4) for v in detections["scores"].tolist()],
+                )
+            with manifest_lock:
+                manifest.write(json.dumps(record) + "\n")
+                manifest.flush()
+        finally:
+            in_flight.release()
+
+    with open(manifest_path, "a") as manifest, \
+            ThreadPoolExecutor(max_workers=args.write_workers) as writers:
+        stream = pipeline.iter_with_query_embedding(
+            query_embedding,
+            image_files,
+            threshold=args.threshold,
+            batch_size=args.batch_size,
+            decode_workers=args.decode_workers,
+            prefetch=args.batch_size * 2,
+            max_side=args.decode_max_side or None,
+        )
+        futures = []
+        for path_str, image, detections, scale in stream:
+            in_flight.acquire()
+            futures.append(writers.submit(save, manifest, path_str, image, detections, scale))
+            processed += 1
+            if processed % 100 == 0:
+                print(f"Processed {processed} images")
+            # Surface writer errors without keeping a future per image around
+            done = [f for f in futures if f.done()]
+            for future in done:
+                future.result()
+            futures = [f for f in futures if not f.done()]
+        for future in futures:
+            future.result()
+
+    if processed == 0 and not completed:
         print(f"No images found in {target_dir}")
         return
-        
-    print(f"\nStarting batch processing on {len(image_files)} images...")
-
-    # Process detections
-    results = pipeline.process_cross_image_detection(
-        reference_image_path=args.reference_image,
-        reference_bbox=reference_bbox,
-        target_image_paths=[str(p) for p in image_files],
-        threshold=args.threshold
-    )
-
-    # Save annotated images
-    for path_str, (image, detections) in results.items():
-        annotated_image = visualizer.draw_detections(image.copy(), detections)
-        output_filename = output_dir / f"annotated_{Path(path_str).name}"
-        annotated_image.save(output_filename)
-        print(f"Saved annotated image to {output_filename}")
+    print(f"Processed {processed} images; results in {manifest_path}")
+
+
+def iter_image_files(target_dir: Path):
+    """Lazily yield the image files in `target_dir`."""
+    for entry in os.scandir(target_dir):
+        if entry.is_file() and Path(entry.name).suffix.lower() in IMAGE_EXTENSIONS:
+            yield Path(entry.path)
+
+
+def load_completed(manifest_path: Path) -> set:
+    """Paths already recorded in a results manifest from an earlier run."""
+    completed = set()
+    if not manifest_path.exists():
+        return completed
+    with open(manifest_path, "rb+") as f:
+        data = f.read()
+        # A run killed mid-write can leave a partial last line; drop it so new records start cleanly
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].decode().splitlines():
+        try:
+            completed.add(json.loads(line)["path"])
+        except (ValueError, KeyError):
+            continue
+    return completed
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Batch process images for one-shot object detection.")
-    parser.add_argument("--reference_image", required=True, help="Path to the reference image containing the query object.")
+    parser.add_argument("--reference_image", help="Path to the reference image containing the query object (not needed with a saved --query_embedding).")
     parser.add_argument("--target_dir", default="data/target", help="Directory containing target images to process.")
     parser.add_argument("--output_dir", default="output/annotated_images", help="Directory to save annotated images.")
     parser.add_argument("--threshold", type=float, default=0.1, help="Detection confidence threshold.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Target images per OWL-ViT forward pass.")
+    parser.add_argument("--decode_workers", type=int, default=4, help="Threads decoding target images ahead of inference.")
+    parser.add_argument("--write_workers", type=int, default=2, help="Threads annotating and saving results.")
+    parser.add_argument("--decode_max_side", type=int, default=1024, help="Decode targets at most this many pixels on the long side, as the models see them (0 for full resolution). Annotated images and manifest boxes are always at the original size.")
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "bf16", "int8"], help="OWL-ViT inference precision (int8 is CPU only).")
+    parser.add_argument("--query_embedding", help="Path of a saved query embedding; reused if it exists, written otherwise.")
     
     args = parser.parse_args()
     main(args)
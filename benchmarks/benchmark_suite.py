@@ -0,0 +1,368 @@
+# benchmarks/benchmark_suite.py
+"""Offline benchmark suite for the detector, segmentor, combined pipeline and API.
+
+Sections (all run by default, or pick some with --sections):
+  latency     per-call latency of each operation, with its per-stage breakdown (core/metrics.py)
+  throughput  OWL-ViT text detection and SAM encoding at batch sizes 1-32
+  api         in-process load test of api.py through the FastAPI test client at several concurrencies
+The peak RSS after each section is recorded as well.
+
+--models tiny runs tiny randomly initialized networks (benchmarks/tiny_models.py), so a run
+takes seconds and needs no downloads; --models real uses the local checkpoints, and the
+default (auto) picks real when they are all present. Nothing is ever downloaded.
+
+Results are written to --output as JSON. Passing an earlier result file as --baseline compares
+every latency, memory and throughput figure with it and exits non-zero if one (other than a
+stage time) is worse by more than --tolerance, so a stored baseline can gate CI. Baselines are
+only comparable on the same machine; the tiny networks run in milliseconds, so their figures
+need a generous tolerance.
+
+Usage: python benchmarks/benchmark_suite.py --models tiny --output bench.json --baseline baseline.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+# Only local files: a missing checkpoint is an error rather than a download
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+SECTIONS = ("latency", "throughput", "api")
+COMBINED_PROMPT = "detect the cat and segment the dog"
+
+
+def percentile_ms(samples: list, q: float) -> float:
+    return round(float(np.percentile(samples, q)), 3)
+
+
+def rss_mb() -> dict:
+    """Current and peak resident memory of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    current_mb = None
+    try:
+        with open("/proc/self/status") as f:
+            current_mb = next(int(line.split()[1]) / 2**10 for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        pass
+    return {"rss_mb": round(current_mb, 1) if current_mb is not None else None, "peak_rss_mb": round(peak_mb, 1)}
+
+
+def unique_images(images: list, count: int, offset: int = 0) -> list:
+    """`count` images cycled from `images`, each with one pixel changed so no two hash alike."""
+    result = []
+    for i in range(offset, offset + count):
+        image = images[i % len(images)].copy()
+        image.putpixel((0, 0), (i % 256, i // 256 % 256, 255))
+        result.append(image)
+    return result
+
+
+def load_images(image_dir: str) -> list:
+    from core.image_handler import decode_image, MODEL_MAX_SIDE
+    if os.path.isdir(image_dir):
+        paths = sorted(p for p in os.listdir(image_dir) if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS)
+        if paths:
+            return [decode_image(os.path.join(image_dir, p), MODEL_MAX_SIDE)[0] for p in paths]
+    print(f"No images in {image_dir}, using synthetic ones")
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)) for _ in range(4)]
+
+
+def real_models_available(args) -> bool:
+    from huggingface_hub import try_to_load_from_cache
+    from core.backbones import sam_checkpoint
+    checkpoint = args.sam_checkpoint or sam_checkpoint(args.sam_model_type)
+    owlvit_cached = os.path.isdir(args.owlvit_model) or isinstance(try_to_load_from_cache(args.owlvit_model, "config.json"), str)
+    return owlvit_cached and os.path.exists(checkpoint)
+
+
+def clear_caches(detector) -> None:
+    from core.cache import sam_embedding_cache
+    for cache in (detector.result_cache, detector.text_embedding_cache, detector.query_embedding_cache, sam_embedding_cache):
+        cache.clear()
+
+
+def measure(fn, repeats: int, before=None) -> dict:
+    """Median and p95 latency of `fn()` and the median time of every stage it ran."""
+    from core import metrics
+    totals, stages = [], {}
+    for _ in range(repeats):
+        if before is not None:
+            before()
+        with metrics.collect() as timings:
+            start = time.perf_counter()
+            fn()
+            totals.append((time.perf_counter() - start) * 1000)
+        for stage, seconds in timings.snapshot()["stages"].items():
+            stages.setdefault(stage, []).append(seconds * 1000)
+    return {
+        "median_ms": percentile_ms(totals, 50),
+        "p95_ms": percentile_ms(totals, 95),
+        # A stage that did not run on every call (e.g. a cache hit) is the median of the calls it ran on
+        "stages": {f"{stage}_ms": percentile_ms(samples, 50) for stage, samples in stages.items()},
+    }
+
+
+def bench_latency(models: dict, images: list, args) -> dict:
+    detector, segmentor, pipeline = models["detector"], models["segmentor"], models["pipeline"]
+    image, query = images[0], images[-1].crop((0, 0, images[-1].width // 2, images[-1].height // 2))
+    box = [image.width * 0.25, image.height * 0.25, image.width * 0.75, image.height * 0.75]
+    cold = lambda: clear_caches(detector)
+    cases = {
+        "detect_text": (lambda: detector.detect_from_texts(image, args.prompts, threshold=args.threshold), cold),
+        "detect_image": (lambda: detector.detect_similar_objects(image, query, threshold=args.threshold), cold),
+        "segment_box": (lambda: segmentor.predict_mask_with_box(image, box), cold),
+        "segment_text": (lambda: segmentor.predict_mask_with_text(image, args.prompts[0], threshold=args.threshold), cold),
+        "detect_and_segment": (lambda: pipeline.detect_and_segment(image, COMBINED_PROMPT, args.threshold), cold),
+    }
+    results = {}
+    for name, (fn, before) in cases.items():
+        fn()  # Warm-up
+        results[name] = measure(fn, args.repeats, before)
+        print(f"  {name:<20} {results[name]['median_ms']:>9.2f} ms median  {results[name]['p95_ms']:>9.2f} ms p95")
+
+    # The decoder alone, on an embedding computed once
+    embedding = segmentor.embed_image(image)
+    results["sam_decoder"] = measure(lambda: segmentor.predict_mask_with_prompts(embedding, box=box), args.repeats)
+    print(f"  {'sam_decoder':<20} {results['sam_decoder']['median_ms']:>9.2f} ms median")
+    return results
+
+
+def bench_throughput(models: dict, images: list, args) -> dict:
+    detector, segmentor = models["detector"], models["segmentor"]
+    runs = {
+        "owlvit_text": lambda batch: detector.detect_from_texts_batch(
+            batch, [args.prompts] * len(batch), [args.threshold] * len(batch)),
+        "sam_encoder": segmentor.encode_images,
+    }
+    results = {}
+    offset = 0
+    for name, run in runs.items():
+        run(unique_images(images, 1, offset=10**6))  # Warm-up
+        results[name] = {}
+        for batch_size in args.batch_sizes:
+            batch_ms = []
+            for _ in range(args.repeats):
+                # Fresh images every time, so nothing is served from a cache
+                batch = unique_images(images, batch_size, offset)
+                offset += batch_size
+                start = time.perf_counter()
+                run(batch)
+                batch_ms.append((time.perf_counter() - start) * 1000)
+            median = float(np.median(batch_ms))
+            results[name][f"batch_{batch_size}"] = {
+                "batch_ms": round(median, 3),
+                "images_per_s": round(batch_size * 1000 / median, 2),
+            }
+            print(f"  {name:<12} batch {batch_size:>3}: {median:>9.2f} ms  {batch_size * 1000 / median:>8.2f} images/s")
+    return results
+
+
+def png_bytes(image: Image.Image) -> bytes:
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def bench_api(models: dict, images: list, args) -> dict:
+    import api
+    from fastapi.testclient import TestClient
+    if args.models == "tiny":
+        from tiny_models import install
+        from core.model_registry import default_device
+        from core.backbones import sam_checkpoint
+        if api.BACKEND != "torch":
+            raise SystemExit("The tiny models run on the torch backend; unset BACKEND")
+        backbones = {b: sam_checkpoint(b, api.SAM_CHECKPOINT_DIR) for b in {api.SAM_BACKBONE, api.INTERACTIVE_SAM_BACKBONE}}
+        install("google/owlvit-base-patch32", backbones, default_device(), api.PRECISION)
+
+    width, height = images[0].size
+    box = json.dumps([width * 0.25, height * 0.25, width * 0.75, height * 0.75])
+    endpoints = {
+        "detect_text": ("/detect-from-text/", {"text_prompt": args.prompts, "threshold": args.threshold}),
+        "segment_box": ("/segment-with-box/", {"box": box}),
+        "detect_and_segment": ("/detect-and-segment/", {"prompt": COMBINED_PROMPT}),
+    }
+    results = {}
+    with TestClient(api.app) as client:
+        def post(path: str, data: dict, upload: bytes) -> tuple:
+            start = time.perf_counter()
+            response = client.post(path, data=dict(data, output="json"), files={"image_file": ("image.png", upload)})
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+        offset = 2 * 10**6
+        for name, (path, data) in endpoints.items():
+            post(path, data, png_bytes(images[0]))  # Loads the models
+            results[name] = {}
+            for concurrency in args.concurrency:
+                count = max(args.requests, concurrency)
+                # Distinct images, so every request runs the models
+                uploads = [png_bytes(image) for image in unique_images(images, count, offset)]
+                offset += count
+                start = time.perf_counter()
+                with ThreadPoolExecutor(concurrency) as pool:
+                    replies = list(pool.map(lambda upload: post(path, data, upload), uploads))
+                elapsed = time.perf_counter() - start
+                latencies = [ms for ms, status in replies if status == 200]
+                row = {
+                    "requests_per_s": round(len(latencies) / elapsed, 2),
+                    "median_ms": percentile_ms(latencies, 50) if latencies else None,
+                    "p95_ms": percentile_ms(latencies, 95) if latencies else None,
+                    "errors": len(replies) - len(latencies),
+                }
+                results[name][f"concurrency_{concurrency}"] = row
+                print(f"  {name:<20} x{concurrency:<3} {row['requests_per_s']:>8.2f} req/s  "
+                      f"{row['median_ms'] or 0:>9.2f} ms median  {row['p95_ms'] or 0:>9.2f} ms p95  {row['errors']} errors")
+    return results
+
+
+def load_models(args) -> dict:
+    from core.detector import OWLViTDetector
+    from core.segmentor import Segmentor
+    from core.combined_pipeline import OwlViT_SAM_Pipeline
+    from core.backbones import sam_checkpoint
+    from core.model_registry import default_device
+    device = args.device or default_device()
+    checkpoint = args.sam_checkpoint or sam_checkpoint(args.sam_model_type)
+    if args.models == "tiny":
+        from tiny_models import install
+        install(args.owlvit_model, {args.sam_model_type: checkpoint}, device)
+    detector = OWLViTDetector(args.owlvit_model, device=device)
+    segmentor = Segmentor(checkpoint, args.sam_model_type, device=device, detector=detector)
+    pipeline = OwlViT_SAM_Pipeline(sam_checkpoint_path=checkpoint, sam_model_type=args.sam_model_type,
+                                   device=device, detector=detector)
+    # Loads both networks now, so the first measured call does not
+    detector.graphs
+    segmentor.sam_predictor
+    return {"detector": detector, "segmentor": segmentor, "pipeline": pipeline, "device": device}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print every figure against the baseline; returns the ones worse by more than `tolerance`.
+
+    Times (`_ms`) and memory (`_mb`) should not grow, throughput (`_per_s`) should not shrink.
+    Stage times are shown to locate a regression but do not count as one: stages of a few
+    milliseconds vary too much between runs.
+    """
+    current, previous = flatten(results["results"]), flatten(baseline["results"])
+    regressions = []
+    print(f"\n{'metric':<62} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(current.keys() & previous.keys()):
+        lower_is_better = name.endswith(("_ms", "_mb"))
+        if not (lower_is_better or name.endswith("_per_s")) or not previous[name]:
+            continue
+        change = current[name] / previous[name] - 1
+        worse = (change > tolerance if lower_is_better else change < -tolerance) and ".stages." not in name
+        if worse:
+            regressions.append(name)
+        print(f"{name:<62} {previous[name]:>10.2f} {current[name]:>10.2f} {change:>+7.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def environment(args, device: str) -> dict:
+    import torch
+    import transformers
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "models": args.models,
+        "owlvit_model": args.owlvit_model,
+        "sam_model_type": args.sam_model_type,
+        "device": device,
+        "torch_threads": torch.get_num_threads(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency, throughput, memory and API load benchmarks")
+    parser.add_argument("--models", choices=["auto", "tiny", "real"], default="auto",
+                        help="Tiny random networks, the local checkpoints, or real when they exist.")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--image_dir", default="data/target", help="Synthetic images are used if it has none.")
+    parser.add_argument("--prompts", nargs="+", default=["a cat", "a dog"])
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Detection threshold (default: 0 with tiny models so every path runs, else 0.1).")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per endpoint and concurrency level.")
+    parser.add_argument("--owlvit_model", default="google/owlvit-base-patch32")
+    parser.add_argument("--sam_checkpoint", default=None)
+    parser.add_argument("--sam_model_type", default="vit_b")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="An earlier result file to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing.")
+    args = parser.parse_args()
+
+    if args.models == "auto":
+        args.models = "real" if real_models_available(args) else "tiny"
+    if args.threshold is None:
+        args.threshold = 0.0 if args.models == "tiny" else 0.1
+    # tiny_models.py sits next to this script
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    images = load_images(args.image_dir)
+    print(f"{args.models} models, {len(images)} images")
+    models = load_models(args)
+    report = {"environment": environment(args, models["device"]), "results": {"memory": {"loaded": rss_mb()}}}
+    sections = {"latency": bench_latency, "throughput": bench_throughput, "api": bench_api}
+    for section in SECTIONS:
+        if section not in args.sections:
+            continue
+        print(f"{section}:")
+        report["results"][section] = sections[section](models, images, args)
+        report["results"]["memory"][section] = rss_mb()
+        print(f"  peak RSS {report['results']['memory'][section]['peak_rss_mb']:.1f} MB")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["environment"]["models"] != args.models:
+            print(f"Baseline ran {baseline['environment']['models']} models, this run {args.models}; not comparing")
+            return
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} figures regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/overlap_benchmark.py
+"""End-to-end latency of text-prompted segmentation with and without the SAM encode overlapped.
+
+For every image, the sequential path runs OWL-ViT, then the SAM encoder and decoder; the
+overlapped path (`Segmentor.predict_mask_with_text`) starts the encoder before OWL-ViT. The
+caches are cleared before every run, so each one pays for both models. Also reports each
+model alone, for comparison with max(OWL-ViT, SAM encoder).
+
+Usage: python benchmarks/overlap_benchmark.py --image_dir data/target --prompt "a cat"
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAM encoder / OWL-ViT overlap latency")
+    parser.add_argument("--image_dir", default="data/target")
+    parser.add_argument("--prompt", default="a cat")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sam_checkpoint", default=None)
+    parser.add_argument("--sam_model_type", default="vit_h")
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args()
+
+    from core.image_handler import decode_image, MODEL_MAX_SIDE
+    from core.segmentor import Segmentor
+    from core.cache import sam_embedding_cache
+    paths = sorted(p for p in os.listdir(args.image_dir) if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        return
+    images = [decode_image(os.path.join(args.image_dir, p), MODEL_MAX_SIDE)[0] for p in paths]
+    segmentor = Segmentor(args.sam_checkpoint, args.sam_model_type, device=args.device)
+    detector = segmentor.detector
+
+    def clear():
+        sam_embedding_cache.clear()
+        detector.result_cache.clear()
+
+    def sequential(image):
+        results = detector.detect_from_text(image, args.prompt, threshold=args.threshold)
+        if len(results["boxes"]):
+            box = results["boxes"][results["scores"].argmax()].tolist()
+            segmentor.predict_mask_with_box(image, box)
+
+    # Loads both models and warms up their kernels
+    sequential(images[0])
+    timings = {"owlvit": [], "sam_encoder": [], "sequential": [], "overlapped": []}
+    for _ in range(args.repeats):
+        for image in images:
+            clear()
+            timings["owlvit"].append(timed(lambda: detector.detect_from_text(image, args.prompt, threshold=args.threshold)))
+            timings["sam_encoder"].append(timed(lambda: segmentor.embed_image(image)))
+            clear()
+            timings["sequential"].append(timed(lambda: sequential(image)))
+            clear()
+            timings["overlapped"].append(timed(lambda: segmentor.predict_mask_with_text(image, args.prompt, args.threshold)))
+
+    median = {name: float(np.median(values)) for name, values in timings.items()}
+    print(f"{len(images)} images x {args.repeats}, device {segmentor.device}, SAM {args.sam_model_type}")
+    for name, value in median.items():
+        print(f"  {name:>12}: {value:8.1f} ms")
+    print(f"  max(owlvit, sam_encoder) = {max(median['owlvit'], median['sam_encoder']):.1f} ms, "
+          f"overlap saves {median['sequential'] - median['overlapped']:.1f} ms "
+          f"({median['sequential'] / median['overlapped']:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
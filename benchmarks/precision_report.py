@@ -0,0 +1,142 @@
+# benchmarks/precision_report.py
+"""Accuracy versus speed of the fp32, bf16 and int8 precision modes on a local image set.
+
+Every mode runs OWL-ViT text detection and SAM box segmentation over the same images.
+Boxes are compared with the fp32 boxes (mean IoU of each fp32 box with its best match),
+and masks are predicted from the fp32 boxes so mask IoU measures SAM's error alone.
+
+Usage: python benchmarks/precision_report.py --image_dir data/target --prompts "a cat" "a dog"
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def box_iou(a: list, b: list) -> float:
+    ix1, iy1, ix2, iy2 = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    if union <= 0:
+        # Degenerate (zero-area) boxes only match themselves
+        return 1.0 if list(a) == list(b) else 0.0
+    return inter / union
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def run_mode(precision: str, images: list, prompts: list, threshold: float, args, reference: dict = None) -> dict:
+    """Detections, masks and per-image latencies of one precision mode."""
+    from core.detector import OWLViTDetector
+    from core.segmentor import Segmentor
+    detector = OWLViTDetector(args.owlvit_model, device=args.device, precision=precision)
+    segmentor = Segmentor(args.sam_checkpoint, args.sam_model_type, device=args.device,
+                          detector=detector, precision=precision)
+
+    # Loads the models and warms up kernels on an image outside the set
+    warmup = Image.new("RGB", images[0].size, (127, 127, 127))
+    detector.detect_from_texts(warmup, prompts, threshold=threshold)
+    segmentor.embed_image(warmup)
+
+    boxes, masks, detect_ms, encode_ms = [], [], [], []
+    for i, image in enumerate(images):
+        start = time.perf_counter()
+        results = detector.detect_from_texts(image, prompts, threshold=threshold)
+        detect_ms.append((time.perf_counter() - start) * 1000)
+        boxes.append({query: r["boxes"].tolist() for query, r in results.items()})
+
+        start = time.perf_counter()
+        embedding = segmentor.embed_image(image)
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        # Segment the reference (fp32) boxes so mask differences come from SAM only
+        prompt_boxes = (reference or {"boxes": boxes})["boxes"][i]
+        masks.append([
+            segmentor.predict_mask_with_prompts(embedding, box=box)[0]
+            for query in prompts for box in prompt_boxes.get(query, [])
+        ])
+    segmentor.close()
+    detector.close()
+    return {"boxes": boxes, "masks": masks, "detect_ms": detect_ms, "encode_ms": encode_ms}
+
+
+def compare(mode: dict, reference: dict) -> dict:
+    box_ious, mask_ious, count_diff = [], [], 0
+    for boxes, ref_boxes in zip(mode["boxes"], reference["boxes"]):
+        for query, ref in ref_boxes.items():
+            found = boxes.get(query, [])
+            count_diff += abs(len(found) - len(ref))
+            box_ious += [max((box_iou(r, b) for b in found), default=0.0) for r in ref]
+    for masks, ref_masks in zip(mode["masks"], reference["masks"]):
+        mask_ious += [mask_iou(m, r) for m, r in zip(masks, ref_masks)]
+    return {
+        "box_iou": round(float(np.mean(box_ious)), 4) if box_ious else None,
+        "mask_iou": round(float(np.mean(mask_ious)), 4) if mask_ious else None,
+        "box_count_diff": count_diff,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare precision modes against fp32")
+    parser.add_argument("--image_dir", default="data/target")
+    parser.add_argument("--prompts", nargs="+", default=["a cat", "a dog"])
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--modes", nargs="+", default=["fp32", "bf16", "int8"])
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--owlvit_model", default="google/owlvit-base-patch32")
+    parser.add_argument("--sam_checkpoint", default="sam_vit_h_4b8939.pth")
+    parser.add_argument("--sam_model_type", default="vit_h")
+    parser.add_argument("--max_side", type=int, default=1024, help="Decode images at most this large, as the API does.")
+    parser.add_argument("--json", help="Also write the report to this path.")
+    args = parser.parse_args()
+
+    from core.image_handler import decode_image
+    paths = sorted(p for p in os.listdir(args.image_dir) if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        return
+    images = [decode_image(os.path.join(args.image_dir, p), args.max_side)[0] for p in paths]
+    print(f"{len(images)} images, prompts {args.prompts}, device {args.device}")
+
+    modes = ["fp32"] + [m for m in args.modes if m != "fp32"]
+    reference = run_mode("fp32", images, args.prompts, args.threshold, args)
+    runs = {"fp32": reference}
+    for precision in modes[1:]:
+        runs[precision] = run_mode(precision, images, args.prompts, args.threshold, args, reference)
+
+    report = []
+    base_detect, base_encode = np.median(reference["detect_ms"]), np.median(reference["encode_ms"])
+    for precision in modes:
+        run = runs[precision]
+        detect, encode = np.median(run["detect_ms"]), np.median(run["encode_ms"])
+        report.append(dict(
+            precision=precision,
+            owlvit_ms=round(float(detect), 1),
+            owlvit_speedup=round(float(base_detect / detect), 2),
+            sam_encode_ms=round(float(encode), 1),
+            sam_encode_speedup=round(float(base_encode / encode), 2),
+            **compare(run, reference),
+        ))
+
+    print(f"{'precision':>9} {'owlvit ms':>10} {'speedup':>8} {'sam ms':>9} {'speedup':>8} {'box IoU':>8} {'mask IoU':>9} {'box diff':>9}")
+    for row in report:
+        print(f"{row['precision']:>9} {row['owlvit_ms']:>10.1f} {row['owlvit_speedup']:>7.2f}x "
+              f"{row['sam_encode_ms']:>9.1f} {row['sam_encode_speedup']:>7.2f}x "
+              f"{str(row['box_iou']):>8} {str(row['mask_iou']):>9} {row['box_count_diff']:>9}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": paths, "prompts": args.prompts, "device": args.device, "modes": report}, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# benchmarks/priority_load.py
+"""Interactive latency under a bulk flood, with and without admission control.
+
+A client clicks points (`/segment-with-points/`, interactive) one request at a time while
+--bulk_clients threads send `/detect-and-segment/` (bulk) back to back. Three runs:
+  idle           no bulk traffic, the reference latency
+  flood          bulk traffic, admission control as configured in api.py
+  no_admission   bulk traffic, with every request admitted at once (the old behaviour)
+For each run it reports the interactive p50/p99 and the bulk requests served and rejected
+with 503. With admission control the interactive p99 should stay near the idle one.
+
+Runs in-process through the FastAPI test client; --models tiny (the default) needs no checkpoints.
+
+Usage: python benchmarks/priority_load.py --models tiny --clicks 60 --bulk_clients 8
+"""
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import threading
+import numpy as np
+from PIL import Image
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def png_bytes(seed: int, size: tuple) -> bytes:
+    # Distinct images, so caches never serve a request
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def run(client, args, bulk_clients: int) -> dict:
+    stop = threading.Event()
+    bulk = {"served": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    def flood(worker: int):
+        seed = 10**6 * (worker + 1)
+        while not stop.is_set():
+            seed += 1
+            response = client.post("/detect-and-segment/", data={"prompt": args.prompt, "output": "json"},
+                                   files={"image_file": ("image.png", png_bytes(seed, args.size))})
+            with lock:
+                bulk["served" if response.status_code == 200 else "rejected"] += 1
+            if response.status_code == 503:
+                time.sleep(float(response.headers.get("Retry-After", 1)) * args.retry_scale)
+
+    threads = [threading.Thread(target=flood, args=(i,), daemon=True) for i in range(bulk_clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup if bulk_clients else 0)
+
+    latencies, failed = [], 0
+    width, height = args.size
+    for click in range(args.clicks):
+        points = json.dumps([[width * (click % 7 + 1) / 8, height / 2]])
+        start = time.perf_counter()
+        response = client.post("/segment-with-points/", data={"points": points, "labels": "[1]", "output": "json"},
+                               files={"image_file": ("image.png", png_bytes(click, args.size))})
+        if response.status_code == 200:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            failed += 1
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        "interactive_p50_ms": round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+        "interactive_p99_ms": round(float(np.percentile(latencies, 99)), 1) if latencies else None,
+        "interactive_failed": failed,
+        "bulk_served": bulk["served"],
+        "bulk_rejected": bulk["rejected"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interactive latency under bulk load, with and without admission control")
+    parser.add_argument("--models", choices=["tiny", "real"], default="tiny")
+    parser.add_argument("--clicks", type=int, default=60, help="Interactive requests per run.")
+    parser.add_argument("--bulk_clients", type=int, default=8)
+    parser.add_argument("--prompt", default="detect the cat and segment the dog")
+    parser.add_argument("--size", type=int, nargs=2, default=[320, 240], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of bulk traffic before the clicks start.")
+    parser.add_argument("--retry_scale", type=float, default=0.1,
+                        help="Fraction of Retry-After a rejected bulk client waits, to keep the pressure on.")
+    parser.add_argument("--output", default=None, help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    import api
+    from core import admission
+    from fastapi.testclient import TestClient
+    if args.models == "tiny":
+        from tiny_models import install
+        from core.model_registry import default_device
+        from core.backbones import sam_checkpoint
+        if api.BACKEND != "torch":
+            raise SystemExit("The tiny models run on the torch backend; unset BACKEND")
+        backbones = {b: sam_checkpoint(b, api.SAM_CHECKPOINT_DIR) for b in {api.SAM_BACKBONE, api.INTERACTIVE_SAM_BACKBONE}}
+        install("google/owlvit-base-patch32", backbones, default_device(), api.PRECISION)
+
+    configured = api.admission_controller
+    # Everything admitted at once: no class limits, queues or deadlines
+    unlimited = admission.AdmissionController(10**6, 10**6)
+    results = {}
+    with TestClient(api.app) as client:
+        run(client, argparse.Namespace(**dict(vars(args), clicks=3)), 0)  # Loads the models
+        for name, bulk_clients, controller in (("idle", 0, configured), ("flood", args.bulk_clients, configured),
+                                               ("no_admission", args.bulk_clients, unlimited)):
+            api.admission_controller = controller
+            results[name] = run(client, args, bulk_clients)
+            print(f"{name:>13}: {results[name]}")
+    api.admission_controller = configured
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/render_benchmark.py
+"""Compares the shared renderer in core/render.py with the per-mask RGBA compositing it replaced.
+
+Usage: python benchmarks/render_benchmark.py [--sizes 1024x768 4000x3000] [--masks 1 5] [--boxes 10]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.render import render
+
+
+def legacy_render(image: Image.Image, masks: list, boxes: list, captions: list, font) -> Image.Image:
+    """The previous approach: one full-size RGBA layer and composite per mask, then a copy for boxes."""
+    annotated = image.copy().convert("RGBA")
+    for mask in masks:
+        color = np.random.randint(0, 255, 3)
+        mask_img = Image.new("RGBA", image.size, (color[0], color[1], color[2], 0))
+        mask_draw = ImageDraw.Draw(mask_img)
+        mask_draw.bitmap((0, 0), Image.fromarray((mask * 255).astype(np.uint8)), fill=(color[0], color[1], color[2], 128))
+        annotated.alpha_composite(mask_img)
+    annotated = annotated.copy()
+    draw = ImageDraw.Draw(annotated)
+    for box, caption in zip(boxes, captions):
+        draw.rectangle(box, outline="red", width=3)
+        draw.text((box[0], box[1] - 20), caption, fill="red", font=font)
+    return annotated
+
+
+def make_inputs(width: int, height: int, mask_count: int, box_count: int, rng) -> tuple:
+    image = Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8))
+    yy, xx = np.mgrid[:height, :width]
+    masks = []
+    for _ in range(mask_count):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        radius = rng.uniform(0.1, 0.3) * min(width, height)
+        masks.append((xx - cx) ** 2 + (yy - cy) ** 2 < radius ** 2)
+    boxes = []
+    for _ in range(box_count):
+        x1, y1 = rng.uniform(0, width * 0.8), rng.uniform(20, height * 0.8)
+        boxes.append([x1, y1, x1 + width * 0.1, y1 + height * 0.1])
+    captions = [f"Score: {score:.2f}" for score in rng.uniform(0, 1, box_count)]
+    return image, masks, boxes, captions
+
+
+def time_ms(fn, repeats: int) -> float:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mask and box rendering")
+    parser.add_argument("--sizes", nargs="+", default=["1024x768", "1920x1080", "4000x3000"])
+    parser.add_argument("--masks", nargs="+", type=int, default=[1, 5, 20])
+    parser.add_argument("--boxes", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    font = ImageFont.load_default()
+    print(f"{'size':>11} {'masks':>5} {'legacy ms/MP':>13} {'render ms/MP':>13} {'speedup':>8}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split("x"))
+        megapixels = width * height / 1e6
+        for mask_count in args.masks:
+            image, masks, boxes, captions = make_inputs(width, height, mask_count, args.boxes, rng)
+            legacy = time_ms(lambda: legacy_render(image, masks, boxes, captions, font), args.repeats)
+            current = time_ms(lambda: render(image, masks=masks, boxes=boxes, captions=captions, font=font), args.repeats)
+            print(f"{size:>11} {mask_count:>5} {legacy / megapixels:>13.1f} {current / megapixels:>13.1f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
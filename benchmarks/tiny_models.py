@@ -0,0 +1,77 @@
+# benchmarks/tiny_models.py
+"""Tiny randomly initialized OWL-ViT and SAM networks, for benchmarks that must run offline.
+
+The networks keep the real architectures (so every code path runs) at a fraction of the
+width and depth. `install` puts them in the model registry under the keys the detector,
+segmentors and API look up, so those load the tiny networks instead of reading checkpoints.
+Their outputs are meaningless; only their timings are of interest.
+"""
+from functools import partial
+import torch
+
+TINY_OWLVIT_IMAGE_SIZE = 96
+TINY_SAM_IMAGE_SIZE = 256
+
+
+def tiny_owlvit(image_size: int = TINY_OWLVIT_IMAGE_SIZE) -> tuple:
+    """An OWL-ViT processor (byte-level tokenizer, no merges) and a 2-layer, 32-wide model."""
+    from transformers import OwlViTConfig, OwlViTForObjectDetection, OwlViTProcessor, OwlViTImageProcessor, CLIPTokenizer
+    from transformers.convert_slow_tokenizer import bytes_to_unicode
+    torch.manual_seed(0)
+    chars = list(bytes_to_unicode().values())
+    vocab = {}
+    for suffix in ("", "</w>"):
+        for char in chars:
+            vocab.setdefault(char + suffix, len(vocab))
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+    tokenizer = CLIPTokenizer(vocab=vocab, merges=[], pad_token="!", model_max_length=16)
+    size = {"height": image_size, "width": image_size}
+    processor = OwlViTProcessor(image_processor=OwlViTImageProcessor(size=size, crop_size=size), tokenizer=tokenizer)
+    config = OwlViTConfig(
+        text_config=dict(vocab_size=len(vocab), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=2, max_position_embeddings=16),
+        vision_config=dict(hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=2,
+                           image_size=image_size, patch_size=32),
+        projection_dim=32,
+    )
+    return processor, OwlViTForObjectDetection(config).eval()
+
+
+def tiny_sam(image_size: int = TINY_SAM_IMAGE_SIZE):
+    """A SAM with a 1-block, 32-wide image encoder working at `image_size` px, and a 1-layer decoder."""
+    from segment_anything.modeling import Sam, ImageEncoderViT, PromptEncoder, MaskDecoder, TwoWayTransformer
+    torch.manual_seed(0)
+    embedding_size = image_size // 16
+    sam = Sam(
+        image_encoder=ImageEncoderViT(
+            depth=1, embed_dim=32, img_size=image_size, mlp_ratio=2, norm_layer=partial(torch.nn.LayerNorm, eps=1e-6),
+            num_heads=2, patch_size=16, qkv_bias=True, use_rel_pos=True, global_attn_indexes=[0],
+            window_size=embedding_size, out_chans=256),
+        prompt_encoder=PromptEncoder(embed_dim=256, image_embedding_size=(embedding_size, embedding_size),
+                                     input_image_size=(image_size, image_size), mask_in_chans=16),
+        mask_decoder=MaskDecoder(num_multimask_outputs=3, transformer_dim=256, iou_head_depth=1, iou_head_hidden_dim=32,
+                                 transformer=TwoWayTransformer(depth=1, embedding_dim=256, mlp_dim=64, num_heads=8)),
+        pixel_mean=[123.675, 116.28, 103.53],
+        pixel_std=[58.395, 57.12, 57.375],
+    )
+    return sam.eval()
+
+
+def install(owlvit_model: str, sam_backbones: dict, device: str, precision: str = "fp32") -> None:
+    """Register tiny networks under the torch-backend registry keys of `owlvit_model` and each SAM backbone.
+
+    `sam_backbones` maps backbone names to the checkpoint paths they would be loaded from.
+    The registry holds them (one reference each) for the life of the process.
+    """
+    from core.model_registry import model_registry, owlvit_key, sam_key
+    from core.graphs import OwlViTGraphs
+
+    def load_owlvit():
+        processor, model = tiny_owlvit()
+        return processor, OwlViTGraphs(model.to(device))
+
+    model_registry.acquire(owlvit_key(owlvit_model, device, precision), load_owlvit)
+    for backbone, checkpoint in sam_backbones.items():
+        model_registry.acquire(sam_key(backbone, checkpoint, device, precision),
+                               lambda: tiny_sam().to(device))
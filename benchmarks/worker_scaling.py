@@ -0,0 +1,140 @@
+# benchmarks/worker_scaling.py
+"""Throughput of the multi-process worker pool (core/workers.py) against worker count.
+
+The models are loaded once in this process, then each configuration forks a pool of N
+workers pinned to disjoint sets of --threads_per_worker cores and pushes a fixed number of
+requests per worker through it. A single worker using every core the largest pool uses is
+run first as the one-process reference. Every request gets a slightly different image so the
+detection and embedding caches never hit.
+
+Usage: python benchmarks/worker_scaling.py --model owlvit --workers 1 2 4 8 --threads_per_worker 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import wait
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+# Loaded before the pools fork, so every worker shares the weights
+detector = None
+segmentor = None
+
+
+def detect_job(image: Image.Image, prompts: list) -> float:
+    start = time.perf_counter()
+    detector.detect_from_texts(image, prompts)
+    return time.perf_counter() - start
+
+
+def encode_job(image: Image.Image) -> float:
+    start = time.perf_counter()
+    segmentor.embed_image(image)
+    return time.perf_counter() - start
+
+
+def unique_images(images: list, count: int) -> list:
+    """`count` images cycled from `images`, each with one pixel changed so no two hash alike."""
+    result = []
+    for i in range(count):
+        image = images[i % len(images)].copy()
+        image.putpixel((0, 0), (i % 256, i // 256 % 256, 255))
+        result.append(image)
+    return result
+
+
+def run_config(num_workers: int, threads: int, args, images: list) -> dict:
+    from core.workers import WorkerPool
+    job, job_args = (detect_job, (args.prompts,)) if args.model == "owlvit" else (encode_job, ())
+    pool = WorkerPool(num_workers, threads, concurrency=args.concurrency)
+    try:
+        # Warms up every worker's kernels on an image outside the measured set
+        warmup = unique_images(images, num_workers + 1)[-1]
+        wait([pool.submit(job, warmup, *job_args) for _ in range(num_workers)])
+        requests = unique_images(images, args.requests_per_worker * num_workers)
+        start = time.perf_counter()
+        futures = [pool.submit(job, image, *job_args) for image in requests]
+        latencies = [f.result() * 1000 for f in futures]
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.close()
+    return dict(
+        workers=num_workers,
+        threads_per_worker=threads,
+        requests=len(requests),
+        throughput=round(len(requests) / elapsed, 2),
+        median_ms=round(float(np.median(latencies)), 1),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker pool throughput against worker count")
+    parser.add_argument("--model", choices=["owlvit", "sam"], default="owlvit",
+                        help="OWL-ViT text detection or the SAM image encoder.")
+    parser.add_argument("--image_dir", default="data/target")
+    parser.add_argument("--prompts", nargs="+", default=["a cat", "a dog"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads_per_worker", type=int, default=None,
+                        help="Cores per worker (default: the available cores over the largest worker count).")
+    parser.add_argument("--requests_per_worker", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests each worker takes at a time.")
+    parser.add_argument("--owlvit_model", default="google/owlvit-base-patch32")
+    parser.add_argument("--sam_checkpoint", default=None)
+    parser.add_argument("--sam_model_type", default="vit_b")
+    parser.add_argument("--json", help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    import torch
+    from core.image_handler import decode_image, MODEL_MAX_SIDE
+    from core.detector import OWLViTDetector
+    from core.segmentor import Segmentor
+    global detector, segmentor
+
+    paths = sorted(p for p in os.listdir(args.image_dir) if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        return
+    images = [decode_image(os.path.join(args.image_dir, p), MODEL_MAX_SIDE)[0] for p in paths]
+
+    cores = len(os.sched_getaffinity(0))
+    threads = args.threads_per_worker or max(1, cores // max(args.workers))
+    # Nothing may run multi-threaded before the pools fork (see core/workers.py)
+    torch.set_num_threads(1)
+    if args.model == "owlvit":
+        detector = OWLViTDetector(args.owlvit_model, device="cpu")
+        detector.graphs  # loads the model
+    else:
+        segmentor = Segmentor(args.sam_checkpoint, args.sam_model_type, device="cpu")
+        segmentor.sam_predictor  # loads the model
+    print(f"{args.model}: {len(images)} images, {cores} cores, {threads} threads per worker")
+
+    configs = dict.fromkeys([(1, threads * max(args.workers))] + [(n, threads) for n in sorted(args.workers)])
+    report = []
+    for num_workers, worker_threads in configs:
+        if num_workers * worker_threads > cores:
+            print(f"Skipping {num_workers} x {worker_threads} threads: only {cores} cores")
+            continue
+        report.append(run_config(num_workers, worker_threads, args, images))
+
+    base = next((r for r in report if r["workers"] == 1 and r["threads_per_worker"] == threads), None)
+    print(f"{'workers':>7} {'threads':>7} {'req/s':>8} {'median ms':>10} {'speedup':>8} {'efficiency':>10}")
+    for row in report:
+        if base is not None:
+            row["speedup"] = round(row["throughput"] / base["throughput"], 2)
+            row["efficiency"] = round(row["speedup"] / row["workers"], 2)
+        print(f"{row['workers']:>7} {row['threads_per_worker']:>7} {row['throughput']:>8.2f} {row['median_ms']:>10.1f} "
+              f"{row.get('speedup', 0):>7.2f}x {row.get('efficiency', 0):>10.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"model": args.model, "cores": cores, "runs": report}, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
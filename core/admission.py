@@ -0,0 +1,202 @@
+# core/admission.py
+import asyncio
+import contextvars
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Admission control for the inference API. Every request belongs to a priority class:
+# interactive (clicks, boxes, threshold changes) or bulk (combined pipeline runs, batch and
+# corpus jobs). The controller bounds how many jobs run at once and keeps slots that bulk
+# work can never take, so a flood of bulk requests cannot delay interactive ones. Requests
+# carry a deadline, and work that can no longer finish in time is rejected up front or dropped
+# from the queues instead of being run for a client that has given up.
+
+PRIORITIES = ("interactive", "bulk")
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request cannot be served in time; `retry_after` is a hint in seconds."""
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(RuntimeError):
+    """Raised for a request whose client went away before it was served."""
+
+
+class Ticket:
+    """One request's priority class and deadline (wall-clock seconds), and whether its client has gone.
+
+    Plain attributes, so the ticket travels with a job to an inference worker; there,
+    `cancelled` is no longer updated, but the deadline still applies.
+    """
+    def __init__(self, priority: str = "interactive", deadline: float = None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        self.priority = priority
+        self.deadline = deadline
+        self.cancelled = False
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (infinite without one)."""
+        return math.inf if self.deadline is None else self.deadline - time.time()
+
+    def abandoned(self) -> bool:
+        """Whether running the request's work now would be wasted."""
+        return self.cancelled or self.remaining() <= 0
+
+
+_current = contextvars.ContextVar("admission_ticket", default=None)
+
+
+def current():
+    """The `Ticket` of the request being served in this context, or None."""
+    return _current.get()
+
+
+@contextmanager
+def bind(ticket: Ticket):
+    """Make `ticket` the current one for this context (and contexts copied from it)."""
+    token = _current.set(ticket)
+    try:
+        yield ticket
+    finally:
+        _current.reset(token)
+
+
+class AdmissionController:
+    """Bounds the inference jobs in flight, with slots held back for interactive requests.
+
+    At most `max_in_flight` jobs run at once, of which at most `bulk_slots` are bulk, so
+    interactive requests always have `max_in_flight - bulk_slots` slots to themselves. Waiting
+    requests are admitted interactive first, in arrival order within a class. Each class waits
+    in a queue of at most `max_waiting[priority]`; a request arriving to a full queue, or one
+    that would not start before its deadline at the current service rate, is rejected at once
+    with `Overloaded`. Runs on the event loop, so it needs no locks.
+    """
+    def __init__(self, max_in_flight: int = 8, bulk_slots: int = 1, max_waiting: dict = None,
+                 poll_interval: float = 0.1):
+        if not 0 < bulk_slots <= max_in_flight:
+            raise ValueError("bulk_slots must be between 1 and max_in_flight")
+        self.max_in_flight = max_in_flight
+        self.bulk_slots = bulk_slots
+        self.max_waiting = max_waiting or {"interactive": 64, "bulk": 16}
+        self.poll_interval = poll_interval
+        self._running = {p: 0 for p in PRIORITIES}
+        self._waiting = {p: deque() for p in PRIORITIES}
+        # Moving average of each class's job duration, used to estimate waits
+        self._service_seconds = {p: None for p in PRIORITIES}
+        self.counts = {p: {"admitted": 0, "rejected": 0, "expired": 0, "disconnected": 0} for p in PRIORITIES}
+
+    def _slots(self, priority: str) -> int:
+        return self.max_in_flight if priority == "interactive" else self.bulk_slots
+
+    def _can_start(self, priority: str) -> bool:
+        if sum(self._running.values()) >= self.max_in_flight:
+            return False
+        return priority == "interactive" or self._running["bulk"] < self.bulk_slots
+
+    def estimated_wait(self, priority: str) -> float:
+        """Seconds a request of `priority` arriving now would wait for a slot (0 if unknown)."""
+        service = self._service_seconds[priority]
+        if service is None:
+            return 0.0
+        ahead = len(self._waiting[priority]) + (len(self._waiting["interactive"]) if priority == "bulk" else 0)
+        if ahead == 0 and self._can_start(priority):
+            return 0.0
+        return (ahead + 1) * service / self._slots(priority)
+
+    def _reject(self, ticket: Ticket, reason: str):
+        self.counts[ticket.priority]["rejected"] += 1
+        retry_after = max(1.0, self.estimated_wait(ticket.priority))
+        raise Overloaded(f"Server busy: {reason}", retry_after)
+
+    def _wake(self) -> None:
+        for priority in PRIORITIES:
+            waiting = self._waiting[priority]
+            while waiting and self._can_start(priority):
+                future = waiting.popleft()
+                if future.done():
+                    continue
+                self._running[priority] += 1
+                future.set_result(None)
+
+    async def acquire(self, ticket: Ticket, disconnected=None) -> None:
+        """Wait for a slot for `ticket`; `disconnected` is an async callable checked while waiting."""
+        priority = ticket.priority
+        if not self._waiting[priority] and self._can_start(priority):
+            self._running[priority] += 1
+            self.counts[priority]["admitted"] += 1
+            return
+        if len(self._waiting[priority]) >= self.max_waiting[priority]:
+            self._reject(ticket, f"{priority} queue is full")
+        if self.estimated_wait(priority) > ticket.remaining():
+            self._reject(ticket, "the request would not start before its deadline")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[priority].append(future)
+        try:
+            while not future.done():
+                await asyncio.wait([future], timeout=min(self.poll_interval, max(0.0, ticket.remaining())))
+                if future.done():
+                    break
+                if ticket.remaining() <= 0:
+                    self.counts[priority]["expired"] += 1
+                    raise Overloaded("Server busy: the request's deadline passed while it was queued",
+                                     max(1.0, self.estimated_wait(priority)))
+                if disconnected is not None and await disconnected():
+                    ticket.cancelled = True
+                    self.counts[priority]["disconnected"] += 1
+                    raise ClientDisconnected("Client disconnected while queued")
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Admitted in the same instant; hand the slot on
+                self.release(ticket)
+            else:
+                future.cancel()
+                if future in self._waiting[priority]:
+                    self._waiting[priority].remove(future)
+            raise
+        self.counts[priority]["admitted"] += 1
+
+    def release(self, ticket: Ticket, seconds: float = None) -> None:
+        """Free `ticket`'s slot; `seconds` is how long its job ran, for the wait estimates."""
+        priority = ticket.priority
+        self._running[priority] -= 1
+        if seconds is not None:
+            previous = self._service_seconds[priority]
+            self._service_seconds[priority] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, ticket: Ticket, disconnected=None):
+        """Hold a slot for `ticket` for the duration of the block."""
+        await self.acquire(ticket, disconnected)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(ticket, time.perf_counter() - started)
+
+    def waiting(self, priority: str) -> int:
+        return len(self._waiting[priority])
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "bulk_slots": self.bulk_slots,
+            **{
+                priority: dict(
+                    self.counts[priority],
+                    running=self._running[priority],
+                    waiting=len(self._waiting[priority]),
+                    max_waiting=self.max_waiting[priority],
+                    mean_service_ms=round(self._service_seconds[priority] * 1000, 1)
+                    if self._service_seconds[priority] is not None else None,
+                )
+                for priority in PRIORITIES
+            },
+        }
@@ -0,0 +1,78 @@
+# core/backbones.py
+import os
+import threading
+from collections import deque
+import numpy as np
+
+# SAM's image encoders from lightest to heaviest, and the checkpoint file each is released as.
+# vit_b runs several times faster than vit_h at a small cost in mask quality.
+SAM_CHECKPOINTS = {
+    "vit_b": "sam_vit_b_01ec64.pth",
+    "vit_l": "sam_vit_l_0b3195.pth",
+    "vit_h": "sam_vit_h_4b8939.pth",
+}
+SAM_BACKBONES = tuple(SAM_CHECKPOINTS)
+
+
+def check_backbone(backbone: str) -> str:
+    if backbone not in SAM_CHECKPOINTS:
+        raise ValueError(f"Unknown SAM backbone '{backbone}', expected one of {', '.join(SAM_BACKBONES)}")
+    return backbone
+
+
+def sam_checkpoint(backbone: str, checkpoint_dir: str = "") -> str:
+    """Path of a backbone's released checkpoint inside `checkpoint_dir` (the working directory by default)."""
+    return os.path.join(checkpoint_dir, SAM_CHECKPOINTS[check_backbone(backbone)])
+
+
+class LatencyStats:
+    """Latency per item of one SAM stage over its last `window` calls.
+
+    Items are images for the encoder and prompt sets (one decoder call) for the decoder.
+    """
+    def __init__(self, window: int = 512):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.items = 0
+
+    def record(self, seconds: float, items: int = 1) -> None:
+        with self._lock:
+            self.calls += 1
+            self.items += items
+            self._samples.append(seconds * 1000 / items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = np.array(self._samples)
+            calls, items = self.calls, self.items
+        if not len(samples):
+            return {"calls": calls, "items": items, "mean_ms": None, "p50_ms": None, "p95_ms": None}
+        return {
+            "calls": calls,
+            "items": items,
+            "mean_ms": round(float(samples.mean()), 2),
+            "p50_ms": round(float(np.percentile(samples, 50)), 2),
+            "p95_ms": round(float(np.percentile(samples, 95)), 2),
+        }
+
+
+class TierLatency:
+    """Encoder and decoder latency of one SAM model (backbone, checkpoint, precision and backend)."""
+    def __init__(self):
+        self.encode = LatencyStats()
+        self.decode = LatencyStats()
+
+    def stats(self) -> dict:
+        return {"encode": self.encode.stats(), "decode": self.decode.stats()}
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+def tier_latency(model_key: str) -> TierLatency:
+    """The latency counters for a SAM model key, shared by every segmentor and pipeline using it."""
+    with _tiers_lock:
+        if model_key not in _tiers:
+            _tiers[model_key] = TierLatency()
+        return _tiers[model_key]
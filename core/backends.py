@@ -0,0 +1,29 @@
+# core/backends.py
+import os
+import torch
+
+# torch: the HuggingFace / segment_anything modules run eagerly.
+# onnx: the graphs written by export_models.py run on ONNX Runtime (CPU, fp32), without
+# loading the PyTorch model weights.
+BACKENDS = ("torch", "onnx")
+
+
+def check_backend(backend: str, precision: str, device: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == "onnx":
+        if torch.device(device).type != "cpu":
+            raise ValueError("The onnx backend runs on CPU only")
+        if precision != "fp32":
+            raise ValueError("The onnx backend runs the exported fp32 graphs; use precision='fp32'")
+    return backend
+
+
+def owlvit_export_path(export_dir: str, model_name: str) -> str:
+    """Where `export_models.py` writes (and the onnx backend reads) an OWL-ViT checkpoint's graphs."""
+    return os.path.join(export_dir, "owlvit", model_name.replace("/", "--"))
+
+
+def sam_export_path(export_dir: str, checkpoint: str) -> str:
+    """Where the graphs exported from a SAM checkpoint live, named after the checkpoint file."""
+    return os.path.join(export_dir, "sam", os.path.splitext(os.path.basename(checkpoint))[0])
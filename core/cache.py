@@ -0,0 +1,90 @@
+# core/cache.py
+import time
+import numpy as np
+import torch
+from PIL import Image
+from .backbones import tier_latency
+from .digest import image_digest
+from .lru import LRUCache, nbytes_of
+
+
+class SamEmbeddingCache:
+    """Caches SAM image-encoder outputs so repeated prompts on an image only run the mask decoder."""
+    def __init__(self, max_bytes: int = 512 * 2**20):
+        self._cache = LRUCache(max_bytes)
+
+    def set_image(self, predictor, image: Image.Image, model_key: str, digest: str = None) -> None:
+        """Prepare `predictor` for `image`, restoring a cached embedding instead of re-encoding when possible."""
+        self.restore(predictor, self.embed(predictor, image, model_key, digest))
+
+    def embed(self, predictor, image: Image.Image, model_key: str, digest: str = None) -> dict:
+        """The predictor state for `image` (features and sizes), encoding it only on a cache miss."""
+        key = (model_key, digest or image_digest(image))
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry
+
+        started = time.perf_counter()
+        predictor.set_image(np.array(image))
+        # Encoders may run under reduced precision; the mask decoder expects fp32 features
+        predictor.features = predictor.features.float()
+        tier_latency(model_key).encode.record(time.perf_counter() - started)
+        entry = {
+            "features": predictor.features,
+            "original_size": predictor.original_size,
+            "input_size": predictor.input_size,
+        }
+        self._cache.put(key, entry)
+        return entry
+
+    @staticmethod
+    def restore(predictor, entry: dict) -> None:
+        """Load an embedding returned by `embed` into `predictor` without running the encoder."""
+        if predictor.is_image_set and predictor.features is entry["features"]:
+            return
+        predictor.reset_image()
+        predictor.features = entry["features"]
+        predictor.original_size = entry["original_size"]
+        predictor.input_size = entry["input_size"]
+        predictor.is_image_set = True
+
+    def encode_batch(self, predictor, images: list, model_key: str) -> list:
+        """Run the SAM image encoder once over every image not cached yet; returns the image digests."""
+        digests = [image_digest(image) for image in images]
+        pending = {}
+        for digest, image in zip(digests, images):
+            if (model_key, digest) not in self._cache:
+                pending.setdefault(digest, image)
+        if not pending:
+            return digests
+
+        started = time.perf_counter()
+        sam = predictor.model
+        batch, input_sizes = [], []
+        for image in pending.values():
+            resized = predictor.transform.apply_image(np.array(image))
+            tensor = torch.as_tensor(resized, device=predictor.device).permute(2, 0, 1).contiguous()[None]
+            input_sizes.append(tuple(tensor.shape[-2:]))
+            batch.append(sam.preprocess(tensor))
+
+        with torch.no_grad():
+            features = sam.image_encoder(torch.cat(batch)).float()
+        tier_latency(model_key).encode.record(time.perf_counter() - started, len(pending))
+
+        for i, (digest, image) in enumerate(pending.items()):
+            self._cache.put((model_key, digest), {
+                "features": features[i:i + 1].clone(),
+                "original_size": image.size[::-1],
+                "input_size": input_sizes[i],
+            })
+        return digests
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+# Shared by every SAM consumer in the process, keyed by model so backbones never mix.
+sam_embedding_cache = SamEmbeddingCache()
@@ -0,0 +1,122 @@
+# core/coalescing.py
+import asyncio
+import hashlib
+import json
+import numpy as np
+from PIL import Image
+from .digest import image_digest
+
+# Single-flight coalescing of identical inference jobs. Double clicks in the UI and client
+# retries send the same image with the same parameters while the first request is still
+# running. The first one (the leader) runs the job; duplicates arriving before it finishes
+# await its result instead of running the models again.
+
+
+def _canonical(value):
+    if isinstance(value, Image.Image):
+        return ["image", image_digest(value)]
+    if isinstance(value, np.ndarray):
+        return ["array", value.dtype.str, list(value.shape), hashlib.blake2b(value.tobytes(), digest_size=16).hexdigest()]
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (bool, int, str)) or value is None:
+        return value
+    if isinstance(value, float):
+        # repr round-trips, so equal floats give equal keys and different ones never collide
+        return ["float", repr(value)]
+    return ["repr", repr(value)]
+
+
+def job_key(job, args: tuple, *extra) -> str:
+    """Content hash of a job and its arguments; images are hashed by their pixels."""
+    canonical = json.dumps([job.__module__, job.__qualname__, _canonical(args), _canonical(extra)],
+                           separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+class _Flight:
+    def __init__(self, loop):
+        self.future = loop.create_future()
+        self.followers = 0
+        self.seconds = None
+
+
+class SingleFlight:
+    """Runs at most one job per key at a time; callers with the same key share its result.
+
+    A follower gets the leader's result or exception, except for the exception types in
+    `leader_only` (such as the leader's client disconnecting) and cancellation: those end the
+    leader's request alone, and its followers retry, one of them leading. Runs on the event
+    loop, so it needs no locks.
+    """
+    def __init__(self, leader_only: tuple = ()):
+        self.leader_only = tuple(leader_only)
+        self._flights = {}
+        self.counts = {}
+
+    def _count(self, name: str) -> dict:
+        return self.counts.setdefault(name, {"executions": 0, "coalesced": 0, "saved_seconds": 0.0})
+
+    async def run(self, key: str, name: str, fn) -> tuple:
+        """Await `fn()` (a coroutine function returning `(result, seconds)`) or an identical flight.
+
+        `name` labels the counts. Returns the result and whether it was coalesced.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            if flight.future.get_loop() is not loop:
+                # A flight on another event loop cannot be awaited from this one
+                return (await fn())[0], False
+            flight.followers += 1
+            try:
+                result = await asyncio.shield(flight.future)
+            except BaseException as exc:
+                # A pending flight means this follower itself was cancelled
+                if flight.future.done() and (flight.future.cancelled() or isinstance(exc, self.leader_only)):
+                    continue
+                raise
+            finally:
+                flight.followers -= 1
+            counts = self._count(name)
+            counts["coalesced"] += 1
+            counts["saved_seconds"] += flight.seconds or 0.0
+            return result, True
+
+        flight = self._flights[key] = _Flight(loop)
+        self._count(name)["executions"] += 1
+        try:
+            result, flight.seconds = await fn()
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                flight.future.cancel()
+            else:
+                flight.future.set_exception(exc)
+                # Retrieved here, so an exception nobody followed is not reported as unhandled
+                flight.future.exception()
+            raise
+        else:
+            flight.future.set_result(result)
+        finally:
+            del self._flights[key]
+        return result, False
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> dict:
+        totals = {"executions": 0, "coalesced": 0, "saved_seconds": 0.0}
+        for counts in self.counts.values():
+            for field in totals:
+                totals[field] += counts[field]
+        return {
+            "in_flight": self.in_flight(),
+            "waiting": sum(flight.followers for flight in self._flights.values()),
+            **{field: round(value, 3) if isinstance(value, float) else value for field, value in totals.items()},
+            "jobs": {name: dict(counts, saved_seconds=round(counts["saved_seconds"], 3))
+                     for name, counts in sorted(self.counts.items())},
+        }
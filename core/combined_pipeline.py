@@ -1,28 +1,21 @@
 # core/combined_pipeline.py
 
+import time
 import torch
-from transformers import OwlViTProcessor, OwlViTForObjectDetection
-from segment_anything import sam_model_registry, SamPredictor
-from PIL import Image, ImageDraw, ImageFont
-import requests
-import numpy as np
-import io
+from PIL import Image, ImageFont
+from .precision import autocast
+from .cache import sam_embedding_cache
+from .render import render
+from .metrics import stage
+from .sam_model import SamModel
+from . import prefetch
 
-class OwlViT_SAM_Pipeline:
-    def __init__(self, owlvit_model_name="google/owlvit-base-patch32", sam_checkpoint_path="sam_vit_h_4b8939.pth", sam_model_type="vit_h"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+class OwlViT_SAM_Pipeline(SamModel):
+    def __init__(self, owlvit_model_name="google/owlvit-base-patch32", sam_checkpoint_path=None, sam_model_type="vit_h", device=None, detector=None, precision="fp32", backend="torch", export_dir="exported"):
+        super().__init__(sam_checkpoint_path, sam_model_type, owlvit_model_name, device=device, detector=detector,
+                         precision=precision, backend=backend, export_dir=export_dir)
         print(f"Using device: {self.device} for combined pipeline.")
 
-        print("Loading OWL-ViT model...")
-        self.owlvit_processor = OwlViTProcessor.from_pretrained(owlvit_model_name)
-        self.owlvit_model = OwlViTForObjectDetection.from_pretrained(owlvit_model_name).to(self.device)
-        
-        print("Loading SAM model...")
-        sam = sam_model_registry[sam_model_type](checkpoint=sam_checkpoint_path)
-        sam.to(device=self.device)
-        self.sam_predictor = SamPredictor(sam)
-        print("Combined pipeline models loaded.")
-
     def parse_prompt(self, prompt: str):
         detect_queries = []
         segment_queries = []
@@ -35,54 +28,96 @@ class OwlViT_SAM_Pipeline:
         return detect_queries, segment_queries
 
     def run(self, image: Image.Image, prompt: str, threshold: float = 0.1):
+        """Detect and segment the objects named in `prompt`.
+
+        Returns the annotated image, the boxes per detect query and the masks per segment query.
+        """
+        detected_boxes, segmentation_masks = self.detect_and_segment(image, prompt, threshold)
+        if not detected_boxes and not segmentation_masks:
+            return image, {}, {}
+        annotated_image = self.visualize_results(image, detected_boxes, segmentation_masks)
+        return annotated_image, detected_boxes, segmentation_masks
+
+    def detect_and_segment(self, image: Image.Image, prompt: str, threshold: float = 0.1) -> tuple:
+        """The boxes per detect query and the masks per segment query in `prompt`, without rendering."""
         detect_queries, segment_queries = self.parse_prompt(prompt)
         all_queries = list(set(detect_queries + segment_queries))
         
         if not all_queries:
-            return image, {}, {}
+            return {}, {}
 
-        inputs = self.owlvit_processor(text=all_queries, images=image, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            outputs = self.owlvit_model(**inputs)
-        
-        target_sizes = torch.Tensor([image.size[::-1]]).to(self.device)
-        results = self.owlvit_processor.post_process_object_detection(outputs=outputs, target_sizes=target_sizes, threshold=threshold)
+        embedding = self.prefetch_embedding(image) if segment_queries else None
+        # One vision-tower pass scores every query
+        try:
+            results = self.detector.detect_from_texts(image, all_queries, threshold=threshold)
+        except Exception:
+            if embedding is not None:
+                prefetch.discard(embedding)
+            raise
 
         detected_boxes = {}
-        segmentation_masks = {}
-        result_set = results[0]
+        segment_boxes = {}
 
-        for box, score, label_idx in zip(result_set["boxes"], result_set["scores"], result_set["labels"]):
-            query = all_queries[label_idx]
-            box_coords = [round(i, 2) for i in box.tolist()]
+        # Keep the best-scoring box for each query
+        for query, result_set in results.items():
+            if result_set["scores"].numel() == 0:
+                continue
+            best = result_set["scores"].argmax()
+            box_coords = [round(i, 2) for i in result_set["boxes"][best].tolist()]
             
-            if query in detect_queries and query not in detected_boxes:
+            if query in detect_queries:
                 detected_boxes[query] = box_coords
             
-            if query in segment_queries and query not in segmentation_masks:
-                self.sam_predictor.set_image(np.array(image))
-                masks, _, _ = self.sam_predictor.predict(box=np.array(box_coords)[None, :], multimask_output=False)
-                segmentation_masks[query] = masks[0]
+            if query in segment_queries:
+                segment_boxes[query] = box_coords
+
+        if embedding is None:
+            return detected_boxes, {}
+        if not segment_boxes:
+            # Nothing to segment: skip the encode if it has not started
+            prefetch.discard(embedding)
+            return detected_boxes, {}
+        return detected_boxes, self.segment_boxes(image, segment_boxes, prefetch.use(embedding))
+
+    def segment_boxes(self, image: Image.Image, boxes: dict, embedding: dict = None) -> dict:
+        """Segment every box in one batched SAM decoder call, encoding the image at most once.
+
+        `embedding` is the image's `embed_image` result when the caller already has it.
+        """
+        if not boxes:
+            return {}
 
-        return self.visualize_results(image, detected_boxes, segmentation_masks)
+        with self._lock:
+            if embedding is not None:
+                sam_embedding_cache.restore(self.sam_predictor, embedding)
+            else:
+                with stage("sam_set_image"), autocast(self.precision, self.device):
+                    sam_embedding_cache.set_image(self.sam_predictor, image, self.sam_model_key)
+            predictor = self.sam_predictor
+            box_tensor = torch.tensor(list(boxes.values()), dtype=torch.float, device=predictor.device)
+            box_tensor = predictor.transform.apply_boxes_torch(box_tensor, predictor.original_size)
+            with stage("sam_predict"):
+                started = time.perf_counter()
+                masks, _, _ = predictor.predict_torch(
+                    point_coords=None,
+                    point_labels=None,
+                    boxes=box_tensor,
+                    multimask_output=False,
+                )
+                self.latency.decode.record(time.perf_counter() - started)
+        masks = masks[:, 0].cpu().numpy()
+        return dict(zip(boxes.keys(), masks))
 
     def visualize_results(self, image, detected_boxes, segmentation_masks):
-        annotated_image = image.copy()
-        draw = ImageDraw.Draw(annotated_image, "RGBA")
         try:
             font = ImageFont.truetype("arial.ttf", 20)
         except IOError:
             font = ImageFont.load_default()
-
-        for query, mask in segmentation_masks.items():
-            color = np.random.randint(0, 255, 3)
-            mask_img = Image.new('RGBA', image.size, (color[0], color[1], color[2], 0))
-            mask_draw = ImageDraw.Draw(mask_img)
-            mask_draw.bitmap((0,0), Image.fromarray(mask * 255), fill=(color[0], color[1], color[2], 128))
-            annotated_image.paste(mask_img, (0,0), mask_img)
-
-        for query, box in detected_boxes.items():
-            draw.rectangle(box, outline="green", width=3)
-            draw.text((box[0], box[1] - 20), query, fill="green", font=font)
-        
-        return annotated_image
+        return render(
+            image,
+            masks=list(segmentation_masks.values()),
+            boxes=list(detected_boxes.values()),
+            captions=list(detected_boxes),
+            box_color="green",
+            font=font,
+        )
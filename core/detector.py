@@ -1,69 +1,306 @@
+import threading
 import torch
 from PIL import Image
-from transformers import OwlViTProcessor, OwlViTForObjectDetection
+from .model_registry import model_registry, owlvit_key, default_device
+from .precision import autocast, check_precision
+from .graphs import class_logits, select_query_embeddings
+from .backends import check_backend
+from .cache import LRUCache, image_digest, nbytes_of
+from .image_handler import InvalidInput
+from .metrics import stage
+
+
+class QueryEmbedding:
+    """An OWL-ViT class embedding for an image query, reusable across any number of targets."""
+    def __init__(self, embedding: torch.Tensor, model_name: str, digest: str):
+        self.embedding = embedding
+        self.model_name = model_name
+        # Hash of the query image, used to key cached detection outputs
+        self.digest = digest
+
+    def save(self, path: str) -> None:
+        torch.save({"embedding": self.embedding.cpu(), "model_name": self.model_name, "digest": self.digest}, path)
+
+    @classmethod
+    def load(cls, path: str, device: str = "cpu") -> "QueryEmbedding":
+        data = torch.load(path, map_location=device)
+        return cls(data["embedding"], data["model_name"], data["digest"])
+
 
 class OWLViTDetector:
-    def __init__(self, model_name: str = "google/owlvit-base-patch32"):
-        print("Loading OWL-ViT model...")
-        self.processor = OwlViTProcessor.from_pretrained(model_name)
-        self.model = OwlViTForObjectDetection.from_pretrained(model_name)
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model.to(self.device)
-        print("Model loaded successfully.")
+    def __init__(self, model_name: str = "google/owlvit-base-patch32", device: str = None,
+                 result_cache_bytes: int = 64 * 2**20, text_cache_bytes: int = 16 * 2**20,
+                 precision: str = "fp32", backend: str = "torch", export_dir: str = "exported"):
+        self.model_name = model_name
+        self.device = device or default_device()
+        # fp32, bf16 (autocast) or int8 (dynamically quantized); see core/precision.py
+        self.precision = check_precision(precision, self.device)
+        # "torch" runs the HuggingFace model eagerly, "onnx" the graphs written by export_models.py
+        self.backend = check_backend(backend, self.precision, self.device)
+        self.export_dir = export_dir
+        self._processor = None
+        self._graphs = None
+        self._load_lock = threading.Lock()
+        # Raw logits and boxes per (image, query); threshold and NMS are applied on top,
+        # so changing only the threshold never re-runs the model.
+        self.result_cache = LRUCache(result_cache_bytes)
+        # Normalized text embeddings per query string; our prompts repeat a small vocabulary
+        self.text_embedding_cache = LRUCache(text_cache_bytes)
+        # Class embeddings of query images, keyed by image hash
+        self.query_embedding_cache = LRUCache(text_cache_bytes, sizeof=lambda q: nbytes_of(q.embedding))
+
+    def _load(self):
+        """Fetch the shared OWL-ViT processor and graphs from the registry on first use."""
+        with self._load_lock:
+            if self._graphs is None:
+                self._processor, self._graphs = model_registry.acquire_owlvit(
+                    self.model_name, self.device, self.precision, self.backend, self.export_dir)
+
+    @property
+    def processor(self):
+        self._load()
+        return self._processor
+
+    @property
+    def graphs(self):
+        """The image and text graphs (`core/graphs.py`) of the configured backend."""
+        self._load()
+        return self._graphs
+
+    def close(self):
+        """Release this detector's reference to the shared model."""
+        if self._graphs is not None:
+            model_registry.release(owlvit_key(self.model_name, self.device, self.precision, self.backend, self.export_dir))
+            self._processor, self._graphs = None, None
 
     def detect_similar_objects(self, target_image: Image.Image, query_image: Image.Image,
                               threshold: float = 0.1, nms_threshold: float = 0.3) -> dict:
         """Detect objects in a target image that are similar to a query image."""
-        inputs = self.processor(
-            images=target_image,
-            query_images=query_image,
-            return_tensors="pt"
-        ).to(self.device)
+        return self.detect_similar_objects_batch(
+            [target_image], [query_image], [threshold], nms_threshold=nms_threshold)[0]
 
-        with torch.no_grad():
-            outputs = self.model.image_guided_detection(**inputs)
+    def detect_similar_objects_batch(self, target_images: list, query_images: list,
+                                     thresholds: list, nms_threshold: float = 0.3) -> list:
+        """Image-guided detection for several (target, query) pairs in one forward pass."""
+        query_embeddings = self.embed_query_images(query_images)
+        return self._detect_with_query_embeddings(target_images, query_embeddings, thresholds, nms_threshold)
 
-        target_sizes = torch.tensor([target_image.size[::-1]]).to(self.device)
-        processed_outputs = self.processor.post_process_image_guided_detection(
-            outputs=outputs,
-            target_sizes=target_sizes,
-            threshold=threshold,
-            nms_threshold=nms_threshold
-        )[0]
+    def detect_with_query_embedding(self, target_images: list, query_embedding: QueryEmbedding,
+                                    threshold: float = 0.1, nms_threshold: float = 0.3,
+                                    batch_size: int = 8) -> list:
+        """Image-guided detection of one precomputed query over many targets, `batch_size` targets per forward pass."""
+        results = []
+        for start in range(0, len(target_images), batch_size):
+            chunk = target_images[start:start + batch_size]
+            results.extend(self._detect_with_query_embeddings(
+                chunk, [query_embedding] * len(chunk), [threshold] * len(chunk), nms_threshold))
+        return results
 
-        if processed_outputs is None:
-            return {
-                "scores": torch.tensor([]),
-                "labels": torch.tensor([], dtype=torch.long),
-                "boxes": torch.tensor([])
-            }
+    def embed_query_image(self, query_image: Image.Image) -> QueryEmbedding:
+        """Compute the class embedding OWL-ViT uses to match a query image."""
+        return self.embed_query_images([query_image])[0]
 
-        return {
-            "scores": processed_outputs["scores"].cpu() if processed_outputs["scores"] is not None else torch.tensor([]),
-            "labels": processed_outputs["labels"].cpu() if processed_outputs.get("labels") is not None else torch.tensor([], dtype=torch.long),
-            "boxes": processed_outputs["boxes"].cpu() if processed_outputs["boxes"] is not None else torch.tensor([])
-        }
+    def embed_query_images(self, query_images: list) -> list:
+        """Query embeddings for several images, served from the cache or computed in one batch."""
+        digests = [image_digest(image) for image in query_images]
+        embeddings = [self.query_embedding_cache.get(digest) for digest in digests]
+        missing = {d: image for d, image, e in zip(digests, query_images, embeddings) if e is None}
+        if missing:
+            features = self._image_features(list(missing.values()))
+            query_embeds = select_query_embeddings(features["class_embeds"], features["pred_boxes"])
+            if any(embed is None for embed in query_embeds):
+                raise InvalidInput("Could not compute an OWL-ViT embedding for the query image")
+            for digest, embed in zip(missing, query_embeds):
+                self.query_embedding_cache.put(digest, QueryEmbedding(embed.reshape(-1).clone(), self.model_name, digest))
+            embeddings = [self.query_embedding_cache.get(digest) or e for digest, e in zip(digests, embeddings)]
+        return embeddings
+
+    def _detect_with_query_embeddings(self, target_images: list, query_embeddings: list,
+                                      thresholds: list, nms_threshold: float) -> list:
+        from transformers.models.owlvit.modeling_owlvit import OwlViTImageGuidedObjectDetectionOutput
+        keys = [("image", image_digest(target), query.digest)
+                for target, query in zip(target_images, query_embeddings)]
+        raw = self._cached_outputs(keys, lambda missing: self._image_guided_forward(
+            [target_images[i] for i in missing], [query_embeddings[i] for i in missing]))
+
+        results = []
+        with stage("owlvit_postprocess"):
+            for (logits, boxes), target_image, threshold in zip(raw, target_images, thresholds):
+                processed = self.processor.post_process_image_guided_detection(
+                    outputs=OwlViTImageGuidedObjectDetectionOutput(logits=logits, target_pred_boxes=boxes),
+                    target_sizes=torch.tensor([target_image.size[::-1]]).to(self.device),
+                    threshold=threshold,
+                    nms_threshold=nms_threshold
+                )
+                # The processor drops images without detections
+                results.append(self._to_result(processed[0] if processed else None))
+        return results
 
     def detect_from_text(self, target_image: Image.Image, query_text: str,
                         threshold: float = 0.1, nms_threshold: float = 0.3) -> dict:
         """Detect objects in a target image using a text prompt."""
-        inputs = self.processor(
-            text=query_text,
-            images=target_image,
-            return_tensors="pt"
-        ).to(self.device)
+        return self.detect_from_text_batch([target_image], [query_text], [threshold])[0]
+
+    def detect_from_text_batch(self, target_images: list, query_texts: list, thresholds: list) -> list:
+        """Text-prompted detection for several (image, prompt) pairs in one forward pass."""
+        per_label = self.detect_from_texts_batch(target_images, [[q] for q in query_texts], thresholds)
+        return [results[query_text] for results, query_text in zip(per_label, query_texts)]
+
+    def detect_from_texts(self, target_image: Image.Image, query_texts: list, threshold: float = 0.1) -> dict:
+        """Detect several text prompts in one image with a single vision-tower pass.
+
+        Returns a result dict per prompt; `labels` hold the prompt's index in `query_texts`. As in
+        OWL-ViT's own post-processing, each box is labelled with the prompt scoring it highest, so
+        it appears in that prompt's result only.
+        """
+        return self.detect_from_texts_batch([target_image], [query_texts], [threshold])[0]
+
+    def detect_from_texts_batch(self, target_images: list, query_lists: list, thresholds: list) -> list:
+        """Multi-prompt detection for several images, batching the vision tower across images."""
+        from transformers.models.owlvit.modeling_owlvit import OwlViTObjectDetectionOutput
+        digests = [image_digest(image) for image in target_images]
+        pairs = [(i, query) for i, queries in enumerate(query_lists) for query in queries]
+        keys = [("text", digests[i], query) for i, query in pairs]
+        raw = self._cached_outputs(keys, lambda missing: self._text_forward_pairs(
+            target_images, [pairs[k] for k in missing]))
+        raw = self._best_query_only(raw, pairs)
+
+        results = [{} for _ in target_images]
+        with stage("owlvit_postprocess"):
+            for (i, query), (logits, boxes) in zip(pairs, raw):
+                processed = self.processor.post_process_grounded_object_detection(
+                    outputs=OwlViTObjectDetectionOutput(logits=logits, pred_boxes=boxes),
+                    target_sizes=torch.tensor([target_images[i].size[::-1]]).to(self.device),
+                    threshold=thresholds[i]
+                )
+                result = self._to_result(processed[0] if processed else None)
+                result["labels"] = torch.full_like(result["labels"], query_lists[i].index(query))
+                results[i][query] = result
+        return results
+
+    @staticmethod
+    def merge_results(per_label: dict) -> dict:
+        """Concatenate per-prompt results into one result dict (e.g. for drawing)."""
+        results = [r for r in per_label.values() if r["scores"].numel()]
+        if not results:
+            return OWLViTDetector._to_result(None)
+        return {key: torch.cat([r[key] for r in results]) for key in ("scores", "labels", "boxes")}
+
+    def embed_texts(self, query_texts: list) -> torch.Tensor:
+        """Normalized OWL-ViT text embeddings for each query, served from the text-embedding cache."""
+        embeds = [self.text_embedding_cache.get(query) for query in query_texts]
+        missing = list(dict.fromkeys(q for q, e in zip(query_texts, embeds) if e is None))
+        if missing:
+            with stage("owlvit_text"), torch.no_grad(), autocast(self.precision, self.device):
+                tokens = self.processor.tokenizer(missing, padding="max_length", return_tensors="pt").to(self.device)
+                text_embeds = self.graphs.text(tokens["input_ids"], tokens["attention_mask"])
+            text_embeds = text_embeds.float()
+            text_embeds = text_embeds / torch.linalg.norm(text_embeds, ord=2, dim=-1, keepdim=True)
+            computed = {query: embed.clone() for query, embed in zip(missing, text_embeds)}
+            for query, embed in computed.items():
+                self.text_embedding_cache.put(query, embed)
+            embeds = [e if e is not None else computed[q] for q, e in zip(query_texts, embeds)]
+        return torch.stack(embeds)
 
+    def _text_forward_pairs(self, target_images: list, pairs: list) -> list:
+        """Raw outputs for (image index, query) pairs, running the vision tower once per distinct image."""
+        image_indices = list(dict.fromkeys(i for i, _ in pairs))
+        query_lists = [[q for j, q in pairs if j == i] for i in image_indices]
+        outputs = self._text_forward([target_images[i] for i in image_indices], query_lists)
+        by_pair = {}
+        for i, queries, per_query in zip(image_indices, query_lists, outputs):
+            by_pair.update({(i, q): entry for q, entry in zip(queries, per_query)})
+        return [by_pair[pair] for pair in pairs]
+
+    def patch_embeddings(self, images: list) -> list:
+        """Per-patch class embeddings, logit shift/scale and boxes, everything needed to score queries later.
+
+        Boxes are normalized (x1, y1, x2, y2) corners; class embeddings are L2-normalized.
+        """
+        from transformers.image_transforms import center_to_corners_format
+        features = self._image_features(images)
+        class_embeds = features["class_embeds"]
+        class_embeds = class_embeds / (torch.linalg.norm(class_embeds, dim=-1, keepdim=True) + 1e-6)
+        logit_shift = features["logit_shift"][..., 0]
+        logit_scale = features["logit_scale"][..., 0]
+        boxes = center_to_corners_format(features["pred_boxes"])
+        return [
+            {
+                "class_embeds": class_embeds[i].cpu(),
+                "logit_shift": logit_shift[i].cpu(),
+                "logit_scale": logit_scale[i].cpu(),
+                "boxes": boxes[i].cpu(),
+            }
+            for i in range(len(images))
+        ]
+
+    def _image_features(self, images: list) -> dict:
+        """Run the image graph once over a batch: per-patch boxes, class embeddings and logit shift/scale."""
+        with stage("owlvit_preprocess"):
+            pixel_values = self.processor(images=images, return_tensors="pt")["pixel_values"].to(self.device)
+        with stage("owlvit_forward"), torch.no_grad(), autocast(self.precision, self.device):
+            outputs = self.graphs.image(pixel_values)
+        names = ("pred_boxes", "class_embeds", "logit_shift", "logit_scale")
+        return {name: output.float() for name, output in zip(names, outputs)}
+
+    def _class_logits(self, features: dict, index: slice, query_embeds: torch.Tensor) -> torch.Tensor:
+        return class_logits(features["class_embeds"][index], features["logit_shift"][index],
+                            features["logit_scale"][index], query_embeds)
+
+    def _text_forward(self, target_images: list, query_lists: list) -> list:
+        """Score each image's queries against its patch features; returns per-query (logits, boxes)."""
+        features = self._image_features(target_images)
+        outputs = []
         with torch.no_grad():
-            outputs = self.model(**inputs)
+            for i, queries in enumerate(query_lists):
+                query_embeds = self.embed_texts(queries)[None]
+                logits = self._class_logits(features, slice(i, i + 1), query_embeds)
+                boxes = features["pred_boxes"][i:i + 1].clone()
+                outputs.append([(logits[..., q:q + 1].clone(), boxes) for q in range(len(queries))])
+        return outputs
+
+    @staticmethod
+    def _best_query_only(raw: list, pairs: list) -> list:
+        """Mask each (image, query) pair's logits to the boxes that query scores highest among the image's queries.
 
-        target_sizes = torch.tensor([target_image.size[::-1]]).to(self.device)
-        processed_outputs = self.processor.post_process_grounded_object_detection(
-            outputs=outputs,
-            target_sizes=target_sizes,
-            threshold=threshold
-        )[0]
+        Results are cached per query, so the assignment is made here, after the cache lookup.
+        """
+        by_image = {}
+        for k, (i, query) in enumerate(pairs):
+            by_image.setdefault(i, {}).setdefault(query, []).append(k)
+        raw = list(raw)
+        for by_query in by_image.values():
+            if len(by_query) < 2:
+                continue
+            firsts = [ks[0] for ks in by_query.values()]
+            best = torch.cat([raw[k][0] for k in firsts], dim=-1).argmax(dim=-1, keepdim=True)
+            for q, ks in enumerate(by_query.values()):
+                logits, boxes = raw[ks[0]]
+                masked = (logits.masked_fill(best != q, float("-inf")), boxes)
+                for k in ks:
+                    raw[k] = masked
+        return raw
 
+    def _cached_outputs(self, keys: list, forward) -> list:
+        """Look up raw (logits, boxes) per key, running `forward` once over the indices that miss."""
+        raw = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, entry in enumerate(raw) if entry is None]
+        if missing:
+            for i, entry in zip(missing, forward(missing)):
+                self.result_cache.put(keys[i], entry)
+                raw[i] = entry
+        return raw
+
+    def _image_guided_forward(self, target_images: list, query_embeddings: list) -> list:
+        features = self._image_features(target_images)
+        query_embeds = torch.stack([q.embedding.to(self.device) for q in query_embeddings])[:, None]
+        with torch.no_grad():
+            logits = self._class_logits(features, slice(None), query_embeds)
+        pred_boxes = features["pred_boxes"]
+        return [(logits[i:i + 1].clone(), pred_boxes[i:i + 1].clone()) for i in range(len(target_images))]
 
+    @staticmethod
+    def _to_result(processed_outputs) -> dict:
         if processed_outputs is None:
             return {
                 "scores": torch.tensor([]),
@@ -0,0 +1,26 @@
+# core/digest.py
+import hashlib
+from PIL import Image
+
+# Content hashes that key the model caches. Kept apart from core/cache.py, which imports torch,
+# so the API can hash images (for the image store and request coalescing) at import time.
+
+
+def image_digest(image: Image.Image) -> str:
+    """Content hash of an image's decoded pixels, mode and size."""
+    pinned = getattr(image, "_pixel_digest", None)
+    if pinned is not None:
+        return pinned
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def pin_digest(image: Image.Image) -> str:
+    """Hash `image` once and reuse the hash for every later cache lookup on it.
+
+    Only for images that are never modified in place afterwards; copies are hashed afresh.
+    """
+    image._pixel_digest = image_digest(image)
+    return image._pixel_digest
@@ -0,0 +1,191 @@
+# core/embedding_index.py
+import json
+import os
+import numpy as np
+import torch
+
+
+class EmbeddingIndex:
+    """On-disk index of per-patch OWL-ViT class embeddings and boxes for an image corpus.
+
+    Each image contributes one row per patch to three append-only float16 files
+    (class embeddings, logit shift/scale, normalized boxes) that are memory-mapped
+    for search; `manifest.json` maps image paths to their rows. Re-indexing only
+    processes files that are new or changed since they were added.
+
+    The manifest is written after the rows, so it is the record of what was indexed: on
+    open, rows appended by an interrupted `add` are cut off the files.
+    """
+    MANIFEST = "manifest.json"
+    FILES = {"class_embeds": "class_embeds.f16", "logit_params": "logit_params.f16", "boxes": "boxes.f16"}
+    ROW_WIDTHS = {"logit_params": 2, "boxes": 4}  # class_embeds rows are embed_dim wide
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        manifest_path = os.path.join(index_dir, self.MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {"model_name": None, "embed_dim": None, "patches_per_image": None,
+                             "total_rows": 0, "images": {}}
+        self._truncate_to_manifest()
+
+    def _truncate_to_manifest(self) -> None:
+        """Cut every file to the manifest's rows; raises ValueError if one holds fewer."""
+        rows = self.manifest["total_rows"]
+        for name, filename in self.FILES.items():
+            path = os.path.join(self.index_dir, filename)
+            if not os.path.exists(path):
+                if rows:
+                    raise ValueError(f"Index {self.index_dir} is missing {filename}")
+                continue
+            width = self.ROW_WIDTHS.get(name, self.manifest["embed_dim"] or 0)
+            expected = rows * width * np.dtype(np.float16).itemsize
+            actual = os.path.getsize(path)
+            if actual < expected:
+                raise ValueError(f"Index {self.index_dir} is corrupt: {filename} holds {actual} bytes, "
+                                 f"the manifest needs {expected}")
+            if actual > expected:
+                print(f"Dropping {actual - expected} bytes of an interrupted update from {filename}")
+                os.truncate(path, expected)
+
+    def __len__(self):
+        return len(self.manifest["images"])
+
+    def needs_indexing(self, path: str) -> bool:
+        """True if `path` is not in the index or changed since it was indexed."""
+        entry = self.manifest["images"].get(str(path))
+        if entry is None:
+            return True
+        stat = os.stat(path)
+        return entry["mtime"] != stat.st_mtime or entry["bytes"] != stat.st_size
+
+    def add(self, paths: list, image_sizes: list, patch_embeddings: list, model_name: str) -> None:
+        """Append the patch embeddings of newly indexed images (see `OWLViTDetector.patch_embeddings`)."""
+        if not paths:
+            return
+        first = patch_embeddings[0]
+        patches, embed_dim = first["class_embeds"].shape
+        if self.manifest["model_name"] is None:
+            self.manifest.update(model_name=model_name, embed_dim=embed_dim, patches_per_image=patches)
+        elif (self.manifest["model_name"], self.manifest["embed_dim"]) != (model_name, embed_dim):
+            raise ValueError(f"Index was built with {self.manifest['model_name']}, not {model_name}")
+
+        arrays = {
+            "class_embeds": np.concatenate([e["class_embeds"].numpy() for e in patch_embeddings]),
+            "logit_params": np.concatenate([
+                torch.stack([e["logit_shift"], e["logit_scale"]], dim=-1).numpy() for e in patch_embeddings]),
+            "boxes": np.concatenate([e["boxes"].numpy() for e in patch_embeddings]),
+        }
+        try:
+            for name, array in arrays.items():
+                with open(os.path.join(self.index_dir, self.FILES[name]), "ab") as f:
+                    f.write(array.astype(np.float16).tobytes())
+        except BaseException:
+            # Undo a partial append, so the files stay aligned with the manifest
+            self._truncate_to_manifest()
+            raise
+
+        row = self.manifest["total_rows"]
+        for path, size in zip(paths, image_sizes):
+            stat = os.stat(path)
+            # A changed file gets new rows; its old rows are simply no longer referenced
+            self.manifest["images"][str(path)] = {
+                "row": row, "size": list(size), "mtime": stat.st_mtime, "bytes": stat.st_size}
+            row += patches
+        self.manifest["total_rows"] = row
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        tmp_path = os.path.join(self.index_dir, self.MANIFEST + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, self.MANIFEST))
+
+    def _memmap(self, name: str, width: int) -> np.memmap:
+        return np.memmap(os.path.join(self.index_dir, self.FILES[name]), dtype=np.float16, mode="r",
+                         shape=(self.manifest["total_rows"], width))
+
+    def search(self, query_embedding: torch.Tensor, top_k: int = 20, threshold: float = 0.1,
+               chunk_images: int = 64, nms_threshold: float = 0.3, image_guided: bool = False) -> list:
+        """Rank indexed images by their best-matching patch for a text or image query embedding.
+
+        Scores every patch with OWL-ViT's class head arithmetic (cosine similarity, then the
+        per-patch shift and scale and a sigmoid), streaming the memory-mapped rows in chunks.
+        Returns up to `top_k` images with their boxes and scores above `threshold`, in pixels.
+
+        Boxes overlapping a better one by more than `nms_threshold` IoU are dropped. With
+        `image_guided` (an image query), box scores are rescaled as by
+        `OWLViTDetector.detect_similar_objects`: 1.0 for the image's best box, down to 0 at a
+        tenth of it. `threshold` applies to the raw scores, before rescaling, in both cases.
+        Images are ranked by their best raw score.
+        """
+        if not self.manifest["images"]:
+            return []
+        query = query_embedding.detach().float().cpu().numpy().reshape(-1)
+        query = query / (np.linalg.norm(query) + 1e-6)
+
+        patches = self.manifest["patches_per_image"]
+        class_embeds = self._memmap("class_embeds", self.manifest["embed_dim"])
+        logit_params = self._memmap("logit_params", 2)
+        paths = list(self.manifest["images"])
+        rows = np.array([self.manifest["images"][p]["row"] for p in paths])
+
+        best_scores = np.empty(len(paths), dtype=np.float32)
+        for start in range(0, len(paths), chunk_images):
+            chunk_rows = rows[start:start + chunk_images]
+            # Rows of one image are contiguous, so gather whole image blocks at once
+            index = (chunk_rows[:, None] + np.arange(patches)[None, :]).reshape(-1)
+            scores = self._patch_scores(class_embeds[index], logit_params[index], query)
+            best_scores[start:start + len(chunk_rows)] = scores.reshape(len(chunk_rows), patches).max(axis=1)
+
+        boxes = self._memmap("boxes", 4)
+        ranked = []
+        for i in np.argsort(-best_scores)[:top_k]:
+            if best_scores[i] < threshold:
+                break
+            entry = self.manifest["images"][paths[i]]
+            block = slice(entry["row"], entry["row"] + patches)
+            scores = self._patch_scores(class_embeds[block], logit_params[block], query)
+            image_boxes = boxes[block].astype(np.float32)
+            keep = nms(image_boxes, scores, nms_threshold)
+            keep = keep[scores[keep] >= threshold]
+            box_scores = scores[keep]
+            if image_guided:
+                best = box_scores.max() + 1e-6
+                box_scores = np.clip((box_scores - best * 0.1) / (best * 0.9), 0.0, 1.0)
+                keep, box_scores = keep[box_scores > 0], box_scores[box_scores > 0]
+            width, height = entry["size"]
+            ranked.append({
+                "path": paths[i],
+                "score": float(best_scores[i]),
+                "scores": box_scores.round(4).tolist(),
+                "boxes": (image_boxes[keep] * np.array([width, height, width, height])).round(2).tolist(),
+            })
+        return ranked
+
+    @staticmethod
+    def _patch_scores(class_embeds: np.ndarray, logit_params: np.ndarray, query: np.ndarray) -> np.ndarray:
+        logit_params = logit_params.astype(np.float32)
+        logits = (class_embeds.astype(np.float32) @ query + logit_params[:, 0]) * logit_params[:, 1]
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Indices of `boxes` (x1, y1, x2, y2) kept by greedy non-maximum suppression, best score first."""
+    order = np.argsort(-scores)
+    if iou_threshold >= 1.0:
+        return order
+    areas = (boxes[:, 2] - boxes[:, 0]).clip(0) * (boxes[:, 3] - boxes[:, 1]).clip(0)
+    keep = []
+    while len(order):
+        best, order = order[0], order[1:]
+        keep.append(best)
+        top_left = np.maximum(boxes[best, :2], boxes[order, :2])
+        bottom_right = np.minimum(boxes[best, 2:], boxes[order, 2:])
+        inter = (bottom_right - top_left).clip(0).prod(axis=1)
+        iou = inter / (areas[best] + areas[order] - inter + 1e-9)
+        order = order[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
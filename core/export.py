@@ -0,0 +1,122 @@
+# core/export.py
+import os
+import json
+import torch
+from segment_anything.utils.onnx import SamOnnxModel
+from .graphs import OwlViTGraphs
+from .backends import owlvit_export_path, sam_export_path
+
+OPSET = 18
+# Largest batch the exported graphs are specialized for
+MAX_BATCH = 64
+
+
+class SamDecoderGraph(SamOnnxModel):
+    """SAM's prompt encoder and mask decoder as one graph, returning every mask token.
+
+    Unlike `SamOnnxModel` it leaves token selection and upscaling to the predictor, so the
+    onnx backend returns exactly what `SamPredictor` does. Boxes are passed as two corner
+    points labelled 2 and 3.
+    """
+    def __init__(self, sam):
+        super().__init__(sam, return_single_mask=False)
+
+    @torch.no_grad()
+    def forward(self, image_embeddings, point_coords, point_labels, mask_input, has_mask_input):
+        sparse_embedding = self._embed_points(point_coords, point_labels)
+        dense_embedding = self._embed_masks(mask_input, has_mask_input)
+        return self.model.mask_decoder.predict_masks(
+            image_embeddings=image_embeddings,
+            image_pe=self.model.prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embedding,
+            dense_prompt_embeddings=dense_embedding,
+        )
+
+
+def export_graph(module: torch.nn.Module, args: tuple, path: str, input_names: list,
+                 output_names: list, dynamic_shapes: dict) -> None:
+    print(f"Exporting {path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            module.eval(), args, path,
+            input_names=input_names,
+            output_names=output_names,
+            # By position, since input names need not match the forward() argument names
+            dynamic_shapes=tuple(dynamic_shapes.get(name) for name in input_names),
+            opset_version=OPSET,
+            dynamo=True,
+        )
+
+
+def write_manifest(path: str, **info) -> None:
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(dict(info, opset=OPSET, torch_version=torch.__version__), f, indent=2)
+
+
+def export_owlvit(model, processor, model_name: str, export_dir: str) -> str:
+    """Write OWL-ViT's image and text graphs and its processor; returns the export directory."""
+    path = owlvit_export_path(export_dir, model_name)
+    os.makedirs(path, exist_ok=True)
+    graphs = OwlViTGraphs(model).cpu().eval()
+    batch = torch.export.Dim("batch", min=1, max=MAX_BATCH)
+
+    size = processor.image_processor.size
+    pixel_values = torch.zeros(2, 3, size["height"], size["width"])
+    export_graph(graphs.image, (pixel_values,), os.path.join(path, "image.onnx"),
+                 ["pixel_values"], ["pred_boxes", "class_embeds", "logit_shift", "logit_scale"],
+                 {"pixel_values": {0: batch}})
+
+    tokens = processor.tokenizer(["a photo of a cat", "a dog"], padding="max_length", return_tensors="pt")
+    export_graph(graphs.text, (tokens["input_ids"], tokens["attention_mask"]), os.path.join(path, "text.onnx"),
+                 ["input_ids", "attention_mask"], ["text_embeds"],
+                 {"input_ids": {0: batch}, "attention_mask": {0: batch}})
+
+    # The onnx backend loads the processor from here, so it never needs the checkpoint
+    processor.save_pretrained(path)
+    write_manifest(path, model_name=model_name)
+    return path
+
+
+def export_sam(sam, model_type: str, checkpoint: str, export_dir: str) -> str:
+    """Write SAM's image encoder and prompt/mask decoder graphs; returns the export directory."""
+    path = sam_export_path(export_dir, checkpoint)
+    os.makedirs(path, exist_ok=True)
+    sam = sam.cpu().eval()
+    img_size = sam.image_encoder.img_size
+    batch = torch.export.Dim("batch", min=1, max=MAX_BATCH)
+
+    images = torch.zeros(2, 3, img_size, img_size)
+    export_graph(sam.image_encoder, (images,), os.path.join(path, "encoder.onnx"),
+                 ["images"], ["image_embeddings"], {"images": {0: batch}})
+
+    embed_dim = sam.prompt_encoder.embed_dim
+    embedding_size = sam.prompt_encoder.image_embedding_size
+    mask_size = [4 * side for side in embedding_size]
+    points = torch.export.Dim("points", min=1, max=64)
+    export_graph(
+        SamDecoderGraph(sam),
+        (
+            torch.zeros(1, embed_dim, *embedding_size),
+            torch.randint(0, img_size, (2, 3, 2), dtype=torch.float),
+            torch.tensor([[1.0, 0.0, -1.0], [2.0, 3.0, 1.0]]),
+            torch.zeros(1, 1, *mask_size),
+            torch.ones(1),
+        ),
+        os.path.join(path, "decoder.onnx"),
+        ["image_embeddings", "point_coords", "point_labels", "mask_input", "has_mask_input"],
+        ["low_res_masks", "iou_predictions"],
+        {
+            "point_coords": {0: batch, 1: points},
+            "point_labels": {0: batch, 1: points},
+        },
+    )
+    write_manifest(
+        path,
+        model_type=model_type,
+        checkpoint=os.path.basename(checkpoint),
+        img_size=img_size,
+        mask_threshold=sam.mask_threshold,
+        pixel_mean=sam.pixel_mean.flatten().tolist(),
+        pixel_std=sam.pixel_std.flatten().tolist(),
+    )
+    return path
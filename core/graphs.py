@@ -0,0 +1,81 @@
+# core/graphs.py
+import torch
+from torch import nn
+
+# The OWL-ViT computations the detector runs, split into the two graphs it needs: one
+# per image and one per text prompt. Eagerly they wrap the HuggingFace model; the same
+# modules are what `export_models.py` writes to ONNX, so both backends compute the same thing.
+
+
+class OwlViTImageGraph(nn.Module):
+    """Vision tower, box head and the image side of the class head, for a batch of images.
+
+    Returns `(pred_boxes, class_embeds, logit_shift, logit_scale)` per patch.
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> tuple:
+        feature_map = self.model.image_embedder(pixel_values=pixel_values)[0]
+        batch_size, height, width, hidden_dim = feature_map.shape
+        image_feats = feature_map.reshape(batch_size, height * width, hidden_dim)
+        pred_boxes = self.model.box_predictor(image_feats, feature_map)
+        class_head = self.model.class_head
+        class_embeds = class_head.dense0(image_feats)
+        logit_shift = class_head.logit_shift(image_feats)
+        logit_scale = class_head.elu(class_head.logit_scale(image_feats)) + 1
+        return pred_boxes, class_embeds, logit_shift, logit_scale
+
+
+class OwlViTTextGraph(nn.Module):
+    """Text tower: projected (unnormalized) embeddings of tokenized prompts."""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self.model.owlvit.get_text_features(input_ids=input_ids, attention_mask=attention_mask).pooler_output
+
+
+class OwlViTGraphs(nn.Module):
+    """The eager (PyTorch) OWL-ViT backend."""
+    def __init__(self, model):
+        super().__init__()
+        self.image = OwlViTImageGraph(model)
+        self.text = OwlViTTextGraph(model)
+
+
+def class_logits(class_embeds: torch.Tensor, logit_shift: torch.Tensor, logit_scale: torch.Tensor,
+                 query_embeds: torch.Tensor) -> torch.Tensor:
+    """OWL-ViT's class head: per-patch logits for each query embedding ([batch, queries, dim])."""
+    class_embeds = class_embeds / (torch.linalg.norm(class_embeds, dim=-1, keepdim=True) + 1e-6)
+    query_embeds = query_embeds / (torch.linalg.norm(query_embeds, dim=-1, keepdim=True) + 1e-6)
+    logits = torch.einsum("...pd,...qd->...pq", class_embeds, query_embeds)
+    return (logits + logit_shift) * logit_scale
+
+
+def select_query_embeddings(class_embeds: torch.Tensor, pred_boxes: torch.Tensor) -> list:
+    """The class embedding of the box that best covers each query image, or None if there is none.
+
+    Same selection as `OwlViTForObjectDetection.embed_image_query`.
+    """
+    from transformers.image_transforms import center_to_corners_format
+    from transformers.models.owlvit.modeling_owlvit import box_iou, generalized_box_iou
+    corners = center_to_corners_format(pred_boxes)
+    whole_image = torch.tensor([[0, 0, 1, 1]], device=corners.device)
+    selected = []
+    for i in range(len(class_embeds)):
+        ious, _ = box_iou(whole_image, corners[i])
+        # If there are no overlapping boxes, fall back to generalized IoU
+        if torch.all(ious[0] == 0.0):
+            ious = generalized_box_iou(whole_image, corners[i])
+        # Boxes within 80% of the best IoU, of which the one least like the image's mean embedding
+        candidates = (ious[0] >= torch.max(ious) * 0.8).nonzero()
+        if not candidates.numel():
+            selected.append(None)
+            continue
+        candidate_embeds = class_embeds[i][candidates.squeeze(1)]
+        mean_sim = torch.einsum("d,id->i", torch.mean(class_embeds[i], dim=0), candidate_embeds)
+        selected.append(class_embeds[i][candidates[torch.argmin(mean_sim)]])
+    return selected
@@ -1,5 +1,70 @@
 # one_shot_object_detection/core/image_handler.py
+import numpy as np
 from PIL import Image
+from .metrics import stage
+
+# SAM's ResizeLongestSide works at 1024 px and OWL-ViT at 768 px, so nothing above 1024 px
+# on the long side ever reaches a model.
+MODEL_MAX_SIDE = 1024
+
+
+class InvalidInput(ValueError):
+    """An input image the models cannot use, such as a query crop OWL-ViT finds no object in."""
+
+
+class ImageScale:
+    """Maps coordinates between a downscaled decode and the original image."""
+    def __init__(self, original_size: tuple, size: tuple):
+        self.original_size = original_size  # (width, height) of the encoded image
+        self.size = size  # (width, height) actually decoded
+        self.x = original_size[0] / size[0]
+        self.y = original_size[1] / size[1]
+
+    @property
+    def is_identity(self) -> bool:
+        return self.size == self.original_size
+
+    def boxes_to_original(self, boxes: list) -> list:
+        return [[x1 * self.x, y1 * self.y, x2 * self.x, y2 * self.y] for x1, y1, x2, y2 in boxes]
+
+    def box_to_decoded(self, box: list) -> list:
+        x1, y1, x2, y2 = box
+        return [x1 / self.x, y1 / self.y, x2 / self.x, y2 / self.y]
+
+    def points_to_decoded(self, points: list) -> list:
+        return [[x / self.x, y / self.y] for x, y in points]
+
+    def mask_to_original(self, mask: np.ndarray) -> np.ndarray:
+        if self.is_identity:
+            return mask
+        resized = Image.fromarray(np.asarray(mask, dtype=np.uint8)).resize(self.original_size, Image.NEAREST)
+        return np.asarray(resized, dtype=bool)
+
+
+def decode_image(source, max_side: int = None) -> tuple:
+    """Decode an image file or file object to RGB, at most `max_side` px on its longer side.
+
+    JPEGs are decoded at a reduced DCT scale (draft mode), so a large photo is never
+    materialized at full size; other formats are downscaled after decoding. Returns the
+    image and the `ImageScale` mapping it back to the original coordinates.
+    """
+    # Opening only parses the header; the pixels are decoded by convert()
+    with stage("image_open"):
+        image = Image.open(source)
+    original_size = image.size
+    with stage("image_decode"):
+        if max_side is None or max(original_size) <= max_side:
+            return image.convert("RGB"), ImageScale(original_size, original_size)
+
+        ratio = max_side / max(original_size)
+        target_size = (max(1, round(original_size[0] * ratio)), max(1, round(original_size[1] * ratio)))
+        # Picks the smallest DCT scale that still decodes to at least the target size
+        image.draft("RGB", target_size)
+        image = image.convert("RGB")
+        if image.size != target_size:
+            image = image.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
+    return image, ImageScale(original_size, image.size)
+
 
 class ImageHandler:
     """Handles loading and cropping of images."""
@@ -11,6 +76,10 @@ class ImageHandler:
         self.current_image = Image.open(image_path).convert("RGB")
         return self.current_image
 
+    def load_image_for_models(self, image_path: str, max_side: int = MODEL_MAX_SIDE) -> tuple:
+        """Load an image no larger than the models use; returns the image and its `ImageScale`."""
+        return decode_image(image_path, max_side)
+
     def crop_bbox_region(self, image: Image.Image, bbox: list) -> Image.Image:
         """Crop a bounding box region from an image."""
         x1, y1, x2, y2 = [int(coord) for coord in bbox]
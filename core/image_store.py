@@ -0,0 +1,79 @@
+# core/image_store.py
+import hashlib
+import threading
+import time
+from .digest import pin_digest
+from .lru import LRUCache
+
+# Uploaded images by id, so a client uploads an image once and then sends only its id to
+# every endpoint. The id is a content hash of the uploaded bytes: uploading the same file
+# again returns the same id without decoding it again.
+
+
+class StoredImage:
+    """One upload, decoded at model resolution, with the `ImageScale` back to the original."""
+    def __init__(self, image_id: str, image, scale):
+        self.image_id = image_id
+        self.image = image
+        self.scale = scale
+        # Hashed once here, so the model caches look the image up without hashing its pixels again
+        self.digest = pin_digest(image)
+        self.nbytes = image.width * image.height * len(image.getbands())
+        self.created = time.time()
+
+    def info(self) -> dict:
+        return {
+            "image_id": self.image_id,
+            "width": self.scale.original_size[0],
+            "height": self.scale.original_size[1],
+            "decoded_width": self.image.width,
+            "decoded_height": self.image.height,
+        }
+
+
+class ImageStore:
+    """Decoded uploads by id, in a least-recently-used store bounded by their pixel memory.
+
+    Only the decoded image is stored. Its SAM embeddings and OWL-ViT detections live in the
+    content-keyed model caches, under the pixel digest computed at upload; a detection query
+    not asked before still runs the OWL-ViT vision tower, and evicted entries are recomputed.
+    """
+    def __init__(self, max_bytes: int = 256 * 2**20):
+        self._images = LRUCache(max_bytes, sizeof=lambda stored: stored.nbytes)
+        # Uploads are added from the threadpool, so the counters are updated under a lock
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.duplicate_uploads = 0
+
+    @staticmethod
+    def image_id(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def add(self, data: bytes, decode) -> StoredImage:
+        """Store the upload `data`, decoded by `decode(data) -> (image, scale)` unless already stored."""
+        image_id = self.image_id(data)
+        stored = self._images.get(image_id)
+        with self._lock:
+            self.uploads += 1
+            if stored is not None:
+                self.duplicate_uploads += 1
+        if stored is not None:
+            return stored
+        stored = StoredImage(image_id, *decode(data))
+        self._images.put(image_id, stored)
+        return stored
+
+    def get(self, image_id: str) -> StoredImage:
+        """The stored image (marking it used), or None if it was never uploaded or was evicted."""
+        return self._images.get(image_id)
+
+    def remove(self, image_id: str) -> bool:
+        return self._images.remove(image_id)
+
+    def __len__(self):
+        return len(self._images)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(uploads=self.uploads, duplicate_uploads=self.duplicate_uploads)
+        return dict(self._images.stats(), **counts)
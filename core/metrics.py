@@ -0,0 +1,211 @@
+# core/metrics.py
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-request stage timings and process-wide histograms in the Prometheus text format.
+#
+# Code marks its expensive steps with `stage(name)`. Inside a request (see `collect`) the
+# duration is added to that request's `RequestTimings`. Outside a request nothing is recorded,
+# so scripts and warm-up pay only a context-variable lookup. The server observes a request's
+# timings into the histograms once it completes, so they are the same whether the work ran in
+# this process, a scheduler thread or an inference worker.
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class RequestTimings:
+    """Seconds spent per stage, and the queue depths seen, while serving one request."""
+    def __init__(self, profile_path: str = None):
+        self.stages = {}
+        self.queue_depths = {}
+        # Where to write a torch profiler trace of the request's inference, and the trace written
+        self.profile_path = profile_path
+        self.trace = None
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        # A stage that runs more than once (e.g. two uploads decoded) is summed
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def note_queue_depth(self, queue: str, depth: int) -> None:
+        with self._lock:
+            self.queue_depths[queue] = max(depth, self.queue_depths.get(queue, 0))
+
+    def merge(self, snapshot: dict) -> None:
+        """Add the stages and queue depths of another request's `snapshot`."""
+        for stage, seconds in snapshot["stages"].items():
+            self.add(stage, seconds)
+        for queue, depth in snapshot["queue_depths"].items():
+            self.note_queue_depth(queue, depth)
+
+    def snapshot(self) -> dict:
+        """Plain-dict copy, picklable so inference workers can send it back."""
+        with self._lock:
+            return {"stages": dict(self.stages), "queue_depths": dict(self.queue_depths)}
+
+    def server_timing(self, total: float) -> str:
+        """A Server-Timing header value, durations in milliseconds."""
+        with self._lock:
+            stages = list(self.stages.items())
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages + [("total", total)])
+
+
+_current = contextvars.ContextVar("request_timings", default=None)
+_profiling = contextvars.ContextVar("profiling", default=False)
+
+
+def current():
+    """The `RequestTimings` of the request being served in this context, or None."""
+    return _current.get()
+
+
+@contextmanager
+def collect(timings: RequestTimings = None):
+    """Record the stages run in this context (and contexts copied from it) into `timings`."""
+    timings = timings or RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into the current request's timings; a no-op outside a request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def profiling() -> bool:
+    """Whether this context is being traced by `profile`.
+
+    The torch profiler only sees ops on the thread that started it, so schedulers and the
+    SAM prefetch run a traced request's work inline instead of on their own threads.
+    """
+    return _profiling.get()
+
+
+_profile_lock = threading.Lock()
+
+@contextmanager
+def profile(path: str = None):
+    """Trace the block with the torch profiler and write a Chrome trace to `path`.
+
+    Yields the path written, or None when `path` is None or another trace is running (the
+    profiler is process-wide, so traces do not overlap).
+    """
+    if path is None or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    import torch
+    from torch.profiler import ProfilerActivity
+    activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if torch.cuda.is_available() else [])
+    token = _profiling.set(True)
+    try:
+        with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+            yield path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        prof.export_chrome_trace(path)
+        print(f"Profiler trace written to {path}")
+    finally:
+        _profiling.reset(token)
+        _profile_lock.release()
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """A labelled Prometheus histogram: cumulative bucket counts, sum and count per label set."""
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def exposition(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def gauge_exposition(name: str, help: str, labelnames: tuple, samples: dict, kind: str = "gauge") -> list:
+    """Exposition lines of a gauge read at scrape time; `samples` maps label tuples to values."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in sorted(samples.items()):
+        lines.append(f"{name}{_format_labels(labelnames, labels)} {value}")
+    return lines
+
+
+def counter_exposition(name: str, help: str, labelnames: tuple, samples: dict) -> list:
+    """Like `gauge_exposition`, for a total kept elsewhere that only ever increases."""
+    return gauge_exposition(name, help, labelnames, samples, kind="counter")
+
+
+# Observed by the server for every completed HTTP request
+request_seconds = Histogram("vision_request_seconds", "HTTP request latency.", ("endpoint", "method", "status"))
+stage_seconds = Histogram("vision_stage_seconds", "Time a request spent in each pipeline stage.", ("endpoint", "stage"))
+queue_depth = Histogram("vision_queue_depth", "Requests already queued when a request joined a queue.",
+                        ("queue",), DEPTH_BUCKETS)
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float, timings: RequestTimings) -> None:
+    request_seconds.observe(seconds, endpoint, method, str(status))
+    snapshot = timings.snapshot()
+    for name, stage_time in snapshot["stages"].items():
+        stage_seconds.observe(stage_time, endpoint, name)
+    for queue, depth in snapshot["queue_depths"].items():
+        queue_depth.observe(depth, queue)
+
+
+def exposition(gauges: list = ()) -> str:
+    """The histograms above plus `gauges` (lists of lines from `gauge_exposition`), as /metrics text."""
+    lines = []
+    for histogram in (request_seconds, stage_seconds, queue_depth):
+        lines.extend(histogram.exposition())
+    for gauge in gauges:
+        lines.extend(gauge)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,185 @@
+# core/model_registry.py
+import threading
+import torch
+from .precision import weight_format, quantize_linear
+from .backends import owlvit_export_path, sam_export_path
+
+# transformers and segment_anything are imported by the loaders below, so importing
+# this module (and everything built on it) stays cheap until a model is first used.
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def module_nbytes(module: torch.nn.Module) -> int:
+    """Bytes held by a module's parameters and buffers."""
+    tensors = list(module.parameters()) + list(module.buffers())
+    # Dynamically quantized layers keep their int8 weights in packed params instead
+    tensors += [m.weight() for m in module.modules() if isinstance(m, torch.ao.nn.quantized.dynamic.Linear)]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _Entry:
+    def __init__(self, value, nbytes: int):
+        self.value = value
+        self.nbytes = nbytes
+        self.refcount = 0
+
+
+class ModelRegistry:
+    """Process-wide store of loaded networks, shared by every detector and segmentor.
+
+    Models are loaded lazily on the first `acquire` of their key and dropped again
+    once every holder has called `release`.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+
+    def acquire(self, key: tuple, loader):
+        """Return the value stored under `key`, calling `loader()` to build it on first use."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                value = loader()
+                nbytes = _nbytes_of(value)
+                entry = self._entries[key] = _Entry(value, nbytes)
+            entry.refcount += 1
+            return entry.value
+
+    def release(self, key: tuple) -> None:
+        """Drop one reference to `key`, unloading the model when nobody holds it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refcount -= 1
+            if entry.refcount <= 0:
+                del self._entries[key]
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
+    def is_loaded(self, key: tuple) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def resident_bytes(self, key: tuple) -> int:
+        """Memory held by the model under `key`, or 0 if it is not loaded."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.nbytes if entry is not None else 0
+
+    def memory_report(self) -> list:
+        """Resident parameter/buffer memory and reference count of every loaded model."""
+        with self._lock:
+            return [
+                {
+                    "key": list(key),
+                    "refcount": entry.refcount,
+                    "resident_bytes": entry.nbytes,
+                    "resident_mb": round(entry.nbytes / 2**20, 1),
+                }
+                for key, entry in self._entries.items()
+            ]
+
+    # --- Typed accessors for the networks used in this project ---
+
+    def acquire_owlvit(self, model_name: str, device: str, precision: str = "fp32",
+                       backend: str = "torch", export_dir: str = "exported") -> tuple:
+        """Return the shared `(processor, graphs)` pair for an OWL-ViT checkpoint (see `core/graphs.py`)."""
+        def load():
+            from transformers import OwlViTProcessor, OwlViTForObjectDetection
+            if backend == "onnx":
+                from .onnx_backend import OnnxOwlViTGraphs
+                path = owlvit_export_path(export_dir, model_name)
+                print(f"Loading exported OWL-ViT graphs from {path}...")
+                return OwlViTProcessor.from_pretrained(path), OnnxOwlViTGraphs(path)
+            from .graphs import OwlViTGraphs
+            print(f"Loading OWL-ViT model '{model_name}' ({weight_format(precision)}) on {device}...")
+            processor = OwlViTProcessor.from_pretrained(model_name)
+            # Prefers the memory-mapped model.safetensors weights when the checkpoint has them
+            model = OwlViTForObjectDetection.from_pretrained(model_name).to(device)
+            model.eval()
+            if weight_format(precision) == "int8":
+                quantize_linear(model.owlvit)
+            return processor, OwlViTGraphs(model)
+        return self.acquire(owlvit_key(model_name, device, precision, backend, export_dir), load)
+
+    def acquire_sam(self, model_type: str, checkpoint: str, device: str, precision: str = "fp32",
+                    backend: str = "torch", export_dir: str = "exported"):
+        """Return the shared SAM network for a model type and checkpoint."""
+        def load():
+            if backend == "onnx":
+                from .onnx_backend import OnnxSam
+                path = sam_export_path(export_dir, checkpoint)
+                print(f"Loading exported SAM graphs from {path}...")
+                return OnnxSam(path)
+            print(f"Loading SAM model '{model_type}' ({weight_format(precision)}) from {checkpoint} on {device}...")
+            sam = load_sam(model_type, checkpoint).to(device=device)
+            if weight_format(precision) == "int8":
+                quantize_linear(sam.image_encoder)
+            return sam
+        return self.acquire(sam_key(model_type, checkpoint, device, precision, backend, export_dir), load)
+
+    def acquire_sam_predictor(self, model_type: str, checkpoint: str, device: str, precision: str = "fp32",
+                              backend: str = "torch", export_dir: str = "exported"):
+        """Return a new `SamPredictor` bound to the shared SAM network.
+
+        Predictors only hold the per-image embedding state, so each caller gets its own
+        while the network weights stay shared.
+        """
+        sam = self.acquire_sam(model_type, checkpoint, device, precision, backend, export_dir)
+        if backend == "onnx":
+            from .onnx_backend import OnnxSamPredictor
+            return OnnxSamPredictor(sam)
+        from segment_anything import SamPredictor
+        return SamPredictor(sam)
+
+
+def load_state_dict(checkpoint: str) -> dict:
+    """Load a checkpoint's tensors memory-mapped rather than read into fresh buffers.
+
+    `.safetensors` files and zip-format `torch.save` checkpoints are mapped from the page
+    cache, so worker processes loading the same file share its pages.
+    """
+    if checkpoint.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(checkpoint)
+    try:
+        return torch.load(checkpoint, map_location="cpu", mmap=True, weights_only=True)
+    except RuntimeError:
+        # Legacy (non-zip) checkpoints cannot be memory-mapped
+        return torch.load(checkpoint, map_location="cpu", weights_only=True)
+
+
+def load_sam(model_type: str, checkpoint: str):
+    """Build a SAM network with its checkpoint weights, skipping the random initialization."""
+    from segment_anything import sam_model_registry
+    # Parameters are created on the meta device and then take the checkpoint tensors as-is
+    with torch.device("meta"):
+        sam = sam_model_registry[model_type]()
+    sam.load_state_dict(load_state_dict(checkpoint), assign=True)
+    return sam.eval()
+
+
+def owlvit_key(model_name: str, device: str, precision: str = "fp32",
+               backend: str = "torch", export_dir: str = "exported") -> tuple:
+    weights = owlvit_export_path(export_dir, model_name) if backend == "onnx" else weight_format(precision)
+    return ("owlvit", model_name, str(device), backend, weights)
+
+
+def sam_key(model_type: str, checkpoint: str, device: str, precision: str = "fp32",
+            backend: str = "torch", export_dir: str = "exported") -> tuple:
+    weights = sam_export_path(export_dir, checkpoint) if backend == "onnx" else weight_format(precision)
+    return ("sam", model_type, checkpoint, str(device), backend, weights)
+
+
+def _nbytes_of(value) -> int:
+    """Resident size of a registry value: module parameters, or the `nbytes` of exported graphs."""
+    values = value if isinstance(value, (tuple, list)) else (value,)
+    return sum(module_nbytes(v) if isinstance(v, torch.nn.Module) else getattr(v, "nbytes", 0) for v in values)
+
+
+# The registry every component in this process shares.
+model_registry = ModelRegistry()
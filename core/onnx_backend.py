@@ -0,0 +1,105 @@
+# core/onnx_backend.py
+import os
+import json
+import torch
+from torch.nn import functional as F
+from segment_anything import SamPredictor
+
+# Runs the graphs written by export_models.py on ONNX Runtime. Only the registry imports
+# this module, and only for the onnx backend.
+
+
+class OnnxGraph:
+    """An exported graph on ONNX Runtime, called with and returning torch tensors like its module."""
+    def __init__(self, path: str):
+        import onnxruntime as ort
+        self.path = path
+        options = ort.SessionOptions()
+        # The arena keeps the peak of every run reserved (gigabytes for SAM's encoder);
+        # memory patterns already reuse buffers between runs of the same shape
+        options.enable_cpu_mem_arena = False
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        # Weights beyond 2 GB are stored next to the graph
+        self.nbytes = sum(os.path.getsize(p) for p in (path, path + ".data") if os.path.exists(p))
+
+    def __call__(self, *inputs):
+        feeds = {name: tensor.detach().cpu().numpy() for name, tensor in zip(self.input_names, inputs)}
+        outputs = tuple(torch.from_numpy(output) for output in self.session.run(None, feeds))
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+class OnnxOwlViTGraphs:
+    """The onnx OWL-ViT backend: same image and text graphs as `core.graphs.OwlViTGraphs`."""
+    def __init__(self, path: str):
+        self.image = OnnxGraph(os.path.join(path, "image.onnx"))
+        self.text = OnnxGraph(os.path.join(path, "text.onnx"))
+        self.nbytes = self.image.nbytes + self.text.nbytes
+
+
+class OnnxSam:
+    """Stands in for `segment_anything`'s `Sam` inside a predictor, running the exported encoder and decoder."""
+    image_format = "RGB"
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        self.image_encoder = OnnxGraph(os.path.join(path, "encoder.onnx"))
+        self.image_encoder.img_size = manifest["img_size"]
+        self.decoder = OnnxGraph(os.path.join(path, "decoder.onnx"))
+        self.mask_threshold = manifest["mask_threshold"]
+        self.pixel_mean = torch.tensor(manifest["pixel_mean"]).view(-1, 1, 1)
+        self.pixel_std = torch.tensor(manifest["pixel_std"]).view(-1, 1, 1)
+        self.device = torch.device("cpu")
+        self.nbytes = self.image_encoder.nbytes + self.decoder.nbytes
+
+    def preprocess(self, x: torch.Tensor) -> torch.Tensor:
+        """Normalize pixel values and pad to a square input, as `Sam.preprocess` does."""
+        x = (x - self.pixel_mean) / self.pixel_std
+        h, w = x.shape[-2:]
+        img_size = self.image_encoder.img_size
+        return F.pad(x, (0, img_size - w, 0, img_size - h))
+
+    def postprocess_masks(self, masks: torch.Tensor, input_size: tuple, original_size: tuple) -> torch.Tensor:
+        """Upscale decoder masks to the original image size, as `Sam.postprocess_masks` does."""
+        img_size = self.image_encoder.img_size
+        masks = F.interpolate(masks, (img_size, img_size), mode="bilinear", align_corners=False)
+        masks = masks[..., : input_size[0], : input_size[1]]
+        return F.interpolate(masks, original_size, mode="bilinear", align_corners=False)
+
+
+class OnnxSamPredictor(SamPredictor):
+    """A `SamPredictor` whose prompt encoder and mask decoder run as one exported graph."""
+    @torch.no_grad()
+    def predict_torch(self, point_coords, point_labels, boxes=None, mask_input=None,
+                      multimask_output: bool = True, return_logits: bool = False) -> tuple:
+        if not self.is_image_set:
+            raise RuntimeError("An image must be set with .set_image(...) before mask prediction.")
+        coords, labels = [], []
+        if point_coords is not None:
+            coords.append(point_coords.float())
+            labels.append(point_labels.float())
+        if boxes is not None:
+            # Boxes go in as their two corners, labelled 2 and 3
+            coords.append(boxes.float().reshape(-1, 2, 2))
+            labels.append(torch.tensor([[2.0, 3.0]]).expand(len(boxes), -1))
+        else:
+            # Without a box SAM pads the prompt with one "not a point" entry
+            batch_size = len(coords[0])
+            coords.append(torch.zeros(batch_size, 1, 2))
+            labels.append(-torch.ones(batch_size, 1))
+
+        if mask_input is None:
+            mask_input, has_mask_input = torch.zeros(1, 1, 256, 256), torch.zeros(1)
+        else:
+            has_mask_input = torch.ones(1)
+        low_res_masks, iou_predictions = self.model.decoder(
+            self.features, torch.cat(coords, dim=1), torch.cat(labels, dim=1), mask_input.float(), has_mask_input)
+
+        # Same choice of output tokens as SAM's mask decoder
+        tokens = slice(1, None) if multimask_output else slice(0, 1)
+        low_res_masks, iou_predictions = low_res_masks[:, tokens], iou_predictions[:, tokens]
+        masks = self.model.postprocess_masks(low_res_masks, self.input_size, self.original_size)
+        if not return_logits:
+            masks = masks > self.model.mask_threshold
+        return masks, iou_predictions, low_res_masks
@@ -1,12 +1,14 @@
 # one_shot_object_detection/core/pipeline.py
-from typing import List
-from .image_handler import ImageHandler
-from .detector import OWLViTDetector
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List
+from .image_handler import ImageHandler, MODEL_MAX_SIDE
+from .detector import OWLViTDetector, QueryEmbedding
 
 class DetectionPipeline:
     """Orchestrates the detection workflow."""
-    def __init__(self):
-        self.detector = OWLViTDetector()
+    def __init__(self, precision: str = "fp32"):
+        self.detector = OWLViTDetector(precision=precision)
         self.image_handler = ImageHandler()
 
     def process_same_image_detection(self, image_path: str, bbox: list, threshold: float = 0.1) -> tuple:
@@ -26,22 +28,75 @@ class DetectionPipeline:
         return image, results
 
     def process_cross_image_detection(self, reference_image_path: str, reference_bbox: list,
-                                      target_image_paths: List[str], threshold: float = 0.1) -> dict:
+                                      target_image_paths: List[str], threshold: float = 0.1,
+                                      batch_size: int = 8) -> dict:
         """Find similar objects across a list of different images."""
+        query_embedding = self.embed_reference(reference_image_path, reference_bbox)
+        return self.process_with_query_embedding(query_embedding, target_image_paths, threshold, batch_size)
+
+    def embed_reference(self, reference_image_path: str, reference_bbox: list) -> QueryEmbedding:
+        """Compute the reusable query embedding for a box on a reference image."""
         ref_image = self.image_handler.load_image(reference_image_path)
         query_image = self.image_handler.crop_bbox_region(ref_image, reference_bbox)
+        return self.detector.embed_query_image(query_image)
 
+    def process_with_query_embedding(self, query_embedding: QueryEmbedding, target_image_paths: List[str],
+                                     threshold: float = 0.1, batch_size: int = 8) -> dict:
+        """Find a precomputed query in every target, running targets through the vision tower in batches."""
         all_results = {}
-        for target_path in target_image_paths:
-            target_image = self.image_handler.load_image(target_path)
-            detection_results = self.detector.detect_similar_objects(
-                target_image=target_image,
-                query_image=query_image,
-                threshold=threshold
-            )
-            all_results[target_path] = (target_image, detection_results)
+        for start in range(0, len(target_image_paths), batch_size):
+            paths = target_image_paths[start:start + batch_size]
+            target_images = [self.image_handler.load_image(path) for path in paths]
+            detections = self.detector.detect_with_query_embedding(
+                target_images, query_embedding, threshold=threshold, batch_size=batch_size)
+            for path, target_image, detection_results in zip(paths, target_images, detections):
+                all_results[path] = (target_image, detection_results)
 
         return all_results
+
+    def iter_with_query_embedding(self, query_embedding: QueryEmbedding, target_image_paths: Iterable[str],
+                                  threshold: float = 0.1, batch_size: int = 8,
+                                  decode_workers: int = 4, prefetch: int = 32,
+                                  max_side: int = MODEL_MAX_SIDE) -> Iterator[tuple]:
+        """Stream (path, image, results, scale) for each target, decoding ahead on a thread pool.
+
+        Images are decoded at most `max_side` px on the long side (None for full resolution);
+        `results` are in the decoded image's coordinates and `scale` maps them to the original.
+        At most `prefetch` decoded images are held at once, so memory stays constant
+        regardless of how many paths are given. Unreadable images yield `None` results.
+        """
+        def flush(batch):
+            images = [image for _, (image, _) in batch]
+            detections = self.detector.detect_with_query_embedding(
+                images, query_embedding, threshold=threshold, batch_size=batch_size)
+            for (path, (image, scale)), detection_results in zip(batch, detections):
+                yield path, image, detection_results, scale
+
+        with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+            pending = deque()
+            paths = iter(target_image_paths)
+            batch = []
+            while True:
+                while len(pending) < prefetch:
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    pending.append((path, pool.submit(self.image_handler.load_image_for_models, path, max_side)))
+                if not pending:
+                    break
+
+                path, future = pending.popleft()
+                try:
+                    batch.append((path, future.result()))
+                except OSError as exc:
+                    print(f"Skipping {path}: {exc}")
+                    yield path, None, None, None
+                if len(batch) >= batch_size:
+                    yield from flush(batch)
+                    batch = []
+            if batch:
+                yield from flush(batch)
+
     def process_text_prompt(self, image_path: str, query_text: str, threshold: float = 0.1) -> tuple:
         """Find objects in an image using a text prompt."""
         image = self.image_handler.load_image(image_path)
@@ -0,0 +1,34 @@
+# core/precision.py
+import contextlib
+import torch
+
+# fp32: full precision.
+# bf16: the image/text encoders run under bfloat16 autocast on the fp32 weights.
+# int8: the encoders' linear layers are dynamically quantized (CPU only).
+# In every mode the light prediction heads (box/class heads, SAM mask decoder) stay fp32.
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def check_precision(precision: str, device: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {', '.join(PRECISIONS)}")
+    if precision == "int8" and torch.device(device).type != "cpu":
+        raise ValueError("int8 dynamic quantization is only supported on CPU")
+    return precision
+
+
+def weight_format(precision: str) -> str:
+    """The weights a precision mode runs on; bf16 autocasts the shared fp32 weights."""
+    return "int8" if precision == "int8" else "fp32"
+
+
+def autocast(precision: str, device: str):
+    """Context that runs the enclosed encoder pass in `precision`."""
+    if precision == "bf16":
+        return torch.autocast(torch.device(device).type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def quantize_linear(module: torch.nn.Module) -> torch.nn.Module:
+    """Swap a module's `nn.Linear` layers for dynamically quantized int8 ones, in place."""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
@@ -0,0 +1,66 @@
+# core/prefetch.py
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+import torch
+from . import metrics
+
+# SAM image encodes started ahead of time, so they overlap with the OWL-ViT pass whose
+# boxes they will be prompted with. They run on one background thread (on its own CUDA
+# stream on a GPU, so the two models' kernels can run concurrently), and a prefetch that
+# turns out not to be needed is cancelled if it has not started yet.
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sam-prefetch")
+_streams = {}
+_lock = threading.Lock()
+_counts = {"started": 0, "used": 0, "cancelled": 0, "unused": 0}
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counts[name] += 1
+
+
+def _run(fn, args: tuple, device: str):
+    device = torch.device(device)
+    if device.type != "cuda":
+        return fn(*args)
+    if device not in _streams:
+        _streams[device] = torch.cuda.Stream(device)
+    stream = _streams[device]
+    with torch.cuda.stream(stream):
+        result = fn(*args)
+    # The caller's stream reads the result, so it must be complete when the future resolves
+    stream.synchronize()
+    return result
+
+
+def start(fn, *args, device: str = "cpu") -> Future:
+    """Run `fn(*args)` on the prefetch thread; hand the future to `use` or `discard`."""
+    _count("started")
+    if metrics.profiling():
+        # A traced request runs everything on its own thread (see core/metrics.py)
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+    # The encode's stages are timed into the request that started it
+    return _executor.submit(contextvars.copy_context().run, _run, fn, args, device)
+
+
+def use(future: Future):
+    """Wait for a prefetch the caller needs and return its result."""
+    _count("used")
+    return future.result()
+
+
+def discard(future: Future) -> None:
+    """Drop a prefetch that is not needed: cancelled if still queued, otherwise left to finish."""
+    _count("cancelled" if future.cancel() else "unused")
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_counts)
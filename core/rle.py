@@ -0,0 +1,38 @@
+# core/rle.py
+import numpy as np
+
+
+def encode_rle(mask: np.ndarray) -> dict:
+    """COCO-style uncompressed RLE of a binary mask: column-major run lengths, starting with a zero run."""
+    mask = np.asarray(mask, dtype=bool)
+    flat = mask.ravel(order="F")
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": list(mask.shape), "counts": counts.tolist()}
+
+
+def decode_rle(rle: dict) -> np.ndarray:
+    """Inverse of `encode_rle`."""
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape((height, width), order="F")
+
+
+def encode_mask_delta(mask: np.ndarray, previous: np.ndarray = None) -> dict:
+    """RLE of what changed since `previous` (XOR), or of the whole mask when that is shorter."""
+    full = dict(encode_rle(mask), encoding="full")
+    if previous is None or previous.shape != mask.shape:
+        return full
+    delta = dict(encode_rle(np.logical_xor(mask, previous)), encoding="delta")
+    return delta if len(delta["counts"]) < len(full["counts"]) else full
+
+
+def apply_mask_delta(previous: np.ndarray, update: dict) -> np.ndarray:
+    """Rebuild the current mask from the previous one and an `encode_mask_delta` update."""
+    mask = decode_rle(update)
+    if update.get("encoding") == "delta":
+        return np.logical_xor(previous, mask)
+    return mask
@@ -0,0 +1,77 @@
+# core/sam_model.py
+import threading
+from PIL import Image
+from .model_registry import model_registry, sam_key, default_device
+from .precision import autocast, check_precision
+from .backends import check_backend
+from .backbones import check_backbone, sam_checkpoint, tier_latency
+from .detector import OWLViTDetector
+from .cache import sam_embedding_cache
+from .metrics import stage
+from . import prefetch
+
+# The SAM state shared by the segmentor and the combined pipeline: the configuration, the
+# predictor acquired from the model registry, the embedding cache key and the detector used
+# for text-to-box queries.
+
+
+class SamModel:
+    """A SAM backbone from the shared registry, plus an OWL-ViT detector for text prompts."""
+    def __init__(self, sam_checkpoint_path=None, sam_model_type="vit_h", owlvit_model_name="google/owlvit-base-patch32",
+                 device=None, detector=None, precision="fp32", backend="torch", export_dir="exported"):
+        self.device = device or default_device()
+        self.precision = check_precision(precision, self.device)
+        self.backend = check_backend(backend, self.precision, self.device)
+        self.export_dir = export_dir
+        self.sam_model_type = check_backbone(sam_model_type)
+        # Without a checkpoint path, the backbone's released checkpoint in the working directory
+        self.sam_checkpoint_path = sam_checkpoint_path or sam_checkpoint(sam_model_type)
+        self.owlvit_model_name = owlvit_model_name
+        self._sam_predictor = None
+        # Encoder and decoder latency, shared with everything else using this SAM model
+        self.latency = tier_latency(self.sam_model_key)
+        # Text-to-box queries go through the detector so they share its text-embedding and result caches.
+        # An injected detector belongs to the caller, who closes it.
+        self._owns_detector = detector is None
+        self.detector = detector or OWLViTDetector(owlvit_model_name, device=self.device, precision=precision,
+                                                   backend=backend, export_dir=export_dir)
+        # The predictor holds per-image state, so set_image + predict must not interleave across threads
+        self._lock = threading.RLock()
+
+    @property
+    def sam_registry_key(self) -> tuple:
+        return sam_key(self.sam_model_type, self.sam_checkpoint_path, self.device,
+                       self.precision, self.backend, self.export_dir)
+
+    @property
+    def sam_predictor(self):
+        # SAM comes from the shared registry, loaded on first use
+        with self._lock:
+            if self._sam_predictor is None:
+                self._sam_predictor = model_registry.acquire_sam_predictor(
+                    self.sam_model_type, self.sam_checkpoint_path, self.device, self.precision,
+                    self.backend, self.export_dir)
+            return self._sam_predictor
+
+    @property
+    def sam_model_key(self) -> str:
+        # Embeddings from different precisions and backends differ slightly, so they are cached apart
+        return f"{self.sam_model_type}:{self.sam_checkpoint_path}:{self.precision}:{self.backend}"
+
+    def close(self):
+        """Release this object's references to the shared models, and its detector if it created it."""
+        if self._sam_predictor is not None:
+            model_registry.release(self.sam_registry_key)
+            self._sam_predictor = None
+        if self._owns_detector:
+            self.detector.close()
+
+    def embed_image(self, image: Image.Image) -> dict:
+        """The SAM embedding of `image` (features and sizes), from the shared cache when available."""
+        with self._lock, stage("sam_set_image"), autocast(self.precision, self.device):
+            return sam_embedding_cache.embed(self.sam_predictor, image, self.sam_model_key)
+
+    def prefetch_embedding(self, image: Image.Image):
+        """Start encoding `image` in the background; pass the handle to `prefetch.use` or `prefetch.discard`."""
+        # The SAM embedding does not depend on the boxes, so encode while OWL-ViT runs
+        return prefetch.start(self.embed_image, image, device=self.device)
@@ -0,0 +1,165 @@
+# core/scheduler.py
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from . import metrics
+from .admission import PRIORITIES, Overloaded, current as current_ticket
+
+
+class QueueFullError(Overloaded):
+    """Raised when a scheduler's request queue is at capacity."""
+
+
+class _Request:
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = Future()
+        # The submitting request's timings; the batch's stages are added to them
+        self.timings = metrics.current()
+        # Its priority class and deadline (core/admission.py)
+        self.ticket = current_ticket()
+        self.priority = self.ticket.priority if self.ticket is not None else "interactive"
+        self.submitted = time.perf_counter()
+
+
+class BatchScheduler:
+    """Groups requests for one model into micro-batches run by a dedicated worker thread.
+
+    The worker waits up to `batch_window_ms` after the first queued request for more to
+    arrive, then calls `batch_fn` with at most `max_batch_size` payloads. `batch_fn` must
+    return one result per payload, in order.
+
+    Requests take the priority class and deadline of the request that submitted them
+    (core/admission.py). Each class queues at most `max_queue_size` requests. A batch comes
+    from the interactive queue whenever it has requests, and an interactive request arriving
+    while a bulk batch is being collected goes first. Requests whose deadline passed or whose
+    client went away while queued are dropped instead of run.
+
+    If `batch_fn` raises on a batch, each of its requests is rerun alone, so only the
+    requests that fail on their own get the exception.
+
+    Each request's timings get its queue wait and the stages of the batch it ran in.
+    """
+    def __init__(self, name: str, batch_fn, max_batch_size: int = 8,
+                 batch_window_ms: float = 10.0, max_queue_size: int = 64):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._cond = threading.Condition()
+        self.batches_run = 0
+        self.requests_run = 0
+        self.dropped = 0
+        self._worker = threading.Thread(target=self._run_worker, name=f"{name}-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, payload) -> Future:
+        """Queue a payload and return a future for its result."""
+        request = _Request(payload)
+        if metrics.profiling():
+            # The profiler only traces this thread, so a traced request runs alone, inline
+            return self._run_inline(request)
+        with self._cond:
+            pending = self._queues[request.priority]
+            if len(pending) >= self.max_queue_size:
+                raise QueueFullError(f"{self.name} {request.priority} queue is full ({self.max_queue_size} pending requests)")
+            if request.timings is not None:
+                request.timings.note_queue_depth(self.name, len(pending))
+            pending.append(request)
+            self._cond.notify()
+        return request.future
+
+    def _run_inline(self, request: _Request) -> Future:
+        try:
+            request.future.set_result(self.batch_fn([request.payload])[0])
+        except Exception as exc:
+            request.future.set_exception(exc)
+        return request.future
+
+    async def run(self, payload):
+        """Queue a payload and await its result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(payload))
+
+    def queue_depth(self, priority: str = None) -> int:
+        """Requests waiting, in one priority class or all of them."""
+        with self._cond:
+            if priority is not None:
+                return len(self._queues[priority])
+            return sum(len(pending) for pending in self._queues.values())
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            **{f"{priority}_queue_depth": self.queue_depth(priority) for priority in PRIORITIES},
+            "batches_run": self.batches_run,
+            "requests_run": self.requests_run,
+            "dropped": self.dropped,
+            "mean_batch_size": round(self.requests_run / self.batches_run, 2) if self.batches_run else 0.0,
+        }
+
+    def _collect_batch(self) -> list:
+        with self._cond:
+            while True:
+                while not any(self._queues.values()):
+                    self._cond.wait()
+                priority = "interactive" if self._queues["interactive"] else "bulk"
+                pending = self._queues[priority]
+                batch = []
+                deadline = time.monotonic() + self.batch_window
+                while len(batch) < self.max_batch_size:
+                    if priority == "bulk" and self._queues["interactive"]:
+                        break
+                    if pending:
+                        batch.append(pending.popleft())
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return batch
+                    self._cond.wait(remaining)
+                else:
+                    return batch
+                # An interactive request arrived while this bulk batch was collected: it goes first
+                pending.extendleft(reversed(batch))
+
+    def _admit(self, request: _Request) -> bool:
+        """Whether to run a collected request; abandoned ones are failed here instead."""
+        if not request.future.set_running_or_notify_cancel():
+            return False
+        if request.ticket is not None and request.ticket.abandoned():
+            self.dropped += 1
+            request.future.set_exception(Overloaded(
+                f"{self.name}: dropped, the request's deadline passed or its client went away while queued"))
+            return False
+        return True
+
+    def _run_worker(self):
+        while True:
+            batch = [r for r in self._collect_batch() if self._admit(r)]
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch: list) -> None:
+        started = time.perf_counter()
+        try:
+            with metrics.collect() as timings:
+                results = self.batch_fn([r.payload for r in batch])
+        except Exception as exc:
+            if len(batch) > 1:
+                # One bad payload must not fail the requests batched with it: rerun each alone
+                for request in batch:
+                    self._run_batch([request])
+            else:
+                batch[0].future.set_exception(exc)
+            return
+        self.batches_run += 1
+        self.requests_run += len(batch)
+        batch_timings = timings.snapshot()
+        for request, result in zip(batch, results):
+            if request.timings is not None:
+                request.timings.add("queue_wait", started - request.submitted)
+                request.timings.merge(batch_timings)
+            request.future.set_result(result)
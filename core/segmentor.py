@@ -1,69 +1,128 @@
 # core/segmentor.py
-import torch
+import time
 import numpy as np
-from PIL import Image, ImageDraw
-from segment_anything import sam_model_registry, SamPredictor
-from transformers import OwlViTProcessor, OwlViTForObjectDetection
+from PIL import Image
+from .model_registry import model_registry
+from .precision import autocast
+from .cache import sam_embedding_cache
+from .render import render
+from .metrics import stage
+from .sam_model import SamModel
+from . import prefetch
 
-class Segmentor:
-    def __init__(self, sam_checkpoint_path="sam_vit_h_4b8939.pth", sam_model_type="vit_h", owlvit_model_name="google/owlvit-base-patch32"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        
-        # Load SAM model
-        sam = sam_model_registry[sam_model_type](checkpoint=sam_checkpoint_path)
-        sam.to(device=self.device)
-        self.sam_predictor = SamPredictor(sam)
+class Segmentor(SamModel):
+    def __init__(self, sam_checkpoint_path=None, sam_model_type="vit_h", owlvit_model_name="google/owlvit-base-patch32", device=None, detector=None, precision="fp32", backend="torch", export_dir="exported"):
+        super().__init__(sam_checkpoint_path, sam_model_type, owlvit_model_name, device=device, detector=detector,
+                         precision=precision, backend=backend, export_dir=export_dir)
 
-        # Load OWL-ViT for text-to-box conversion
-        self.owlvit_processor = OwlViTProcessor.from_pretrained(owlvit_model_name)
-        self.owlvit_model = OwlViTForObjectDetection.from_pretrained(owlvit_model_name).to(self.device)
+    def tier_stats(self) -> dict:
+        """This backbone's checkpoint, resident memory and encoder/decoder latency."""
+        key = self.sam_registry_key
+        resident = model_registry.resident_bytes(key)
+        return dict(
+            checkpoint=self.sam_checkpoint_path,
+            loaded=model_registry.is_loaded(key),
+            resident_mb=round(resident / 2**20, 1),
+            **self.latency.stats(),
+        )
+
+    def _set_image(self, image: Image.Image):
+        """Load the image embedding into the predictor, reusing a cached encoder pass if available."""
+        with stage("sam_set_image"), autocast(self.precision, self.device):
+            sam_embedding_cache.set_image(self.sam_predictor, image, self.sam_model_key)
+
+    def encode_images(self, images: list) -> list:
+        """Batch-encode images with the SAM image encoder so later prompts hit the embedding cache."""
+        with stage("sam_encode"), autocast(self.precision, self.device):
+            return sam_embedding_cache.encode_batch(self.sam_predictor, images, self.sam_model_key)
 
     def _visualize_mask(self, image: Image.Image, mask: np.ndarray) -> Image.Image:
         """Applies a segmentation mask to an image."""
-        
-        annotated_image = image.copy().convert("RGBA")
-        
-        color = np.random.randint(0, 255, 3)
-        mask_img = Image.new('RGBA', image.size, (color[0], color[1], color[2], 0))
-        mask_draw = ImageDraw.Draw(mask_img)
+        return render(image, masks=[mask])
+
+    def predict_mask_with_points(self, image: Image.Image, points: list, labels: list) -> np.ndarray:
+        """Returns the SAM mask for point prompts."""
+        with self._lock:
+            self._set_image(image)
+            with stage("sam_predict"):
+                started = time.perf_counter()
+                masks, _, _ = self.sam_predictor.predict(
+                    point_coords=np.array(points),
+                    point_labels=np.array(labels),
+                    multimask_output=False,
+                )
+                self.latency.decode.record(time.perf_counter() - started)
+        return masks[0]
 
-        bitmap = Image.fromarray((mask * 255).astype(np.uint8))
-        mask_draw.bitmap((0, 0), bitmap, fill=(color[0], color[1], color[2], 128))
-        
-        annotated_image.alpha_composite(mask_img)
-        return annotated_image
+    def predict_mask_with_box(self, image: Image.Image, box: list) -> np.ndarray:
+        """Returns the SAM mask for a bounding box prompt."""
+        with self._lock:
+            self._set_image(image)
+            with stage("sam_predict"):
+                started = time.perf_counter()
+                masks, _, _ = self.sam_predictor.predict(
+                    box=np.array(box),
+                    multimask_output=False,
+                )
+                self.latency.decode.record(time.perf_counter() - started)
+        return masks[0]
+
+    def predict_mask_with_prompts(self, embedding: dict, points: list = None, labels: list = None,
+                                  box: list = None, mask_input: np.ndarray = None,
+                                  multimask_output: bool = False) -> tuple:
+        """Run only the SAM mask decoder on a precomputed embedding (see `embed_image`).
+
+        Returns the best mask, its score and its low-res logits, which can be passed back as
+        `mask_input` to refine the mask with further prompts.
+        """
+        with self._lock:
+            sam_embedding_cache.restore(self.sam_predictor, embedding)
+            with stage("sam_predict"):
+                started = time.perf_counter()
+                masks, scores, low_res_logits = self.sam_predictor.predict(
+                    point_coords=np.array(points) if points else None,
+                    point_labels=np.array(labels) if labels else None,
+                    box=np.array(box) if box is not None else None,
+                    mask_input=mask_input,
+                    multimask_output=multimask_output,
+                )
+                self.latency.decode.record(time.perf_counter() - started)
+        best = int(scores.argmax())
+        return masks[best], float(scores[best]), low_res_logits[best:best + 1]
 
     def segment_with_points(self, image: Image.Image, points: list, labels: list) -> Image.Image:
         """Segments an object using point prompts."""
-        self.sam_predictor.set_image(np.array(image))
-        masks, _, _ = self.sam_predictor.predict(
-            point_coords=np.array(points),
-            point_labels=np.array(labels),
-            multimask_output=False,
-        )
-        return self._visualize_mask(image, masks[0])
+        return self._visualize_mask(image, self.predict_mask_with_points(image, points, labels))
 
     def segment_with_box(self, image: Image.Image, box: list) -> Image.Image:
         """Segments an object using a bounding box prompt."""
-        self.sam_predictor.set_image(np.array(image))
-        masks, _, _ = self.sam_predictor.predict(
-            box=np.array(box),
-            multimask_output=False,
-        )
-        return self._visualize_mask(image, masks[0])
+        return self._visualize_mask(image, self.predict_mask_with_box(image, box))
 
-    def segment_with_text(self, image: Image.Image, text_prompt: str) -> Image.Image:
-        """Segments an object using a text prompt by first detecting it with OWL-ViT."""
-        inputs = self.owlvit_processor(text=[text_prompt], images=image, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            outputs = self.owlvit_model(**inputs)
-        
-        target_sizes = torch.Tensor([image.size[::-1]]).to(self.device)
-        results = self.owlvit_processor.post_process_object_detection(outputs=outputs, target_sizes=target_sizes, threshold=0.1)[0]
-        
+    def predict_mask_with_text(self, image: Image.Image, text_prompt: str, threshold: float = 0.1):
+        """Detects `text_prompt` with OWL-ViT and segments the best box.
+
+        Returns `(box, score, mask)`, or None if nothing was detected.
+        """
+        embedding = self.prefetch_embedding(image)
+        try:
+            results = self.detector.detect_from_text(image, text_prompt, threshold=threshold)
+        except Exception:
+            prefetch.discard(embedding)
+            raise
         if len(results["boxes"]) == 0:
-            return image # Return original image if no object is detected
+            # Nothing to segment: skip the encode if it has not started
+            prefetch.discard(embedding)
+            return None
 
         # Use the box with the highest score as the prompt for SAM
-        best_box = results["boxes"][0].tolist()
-        return self.segment_with_box(image, best_box)
+        best = results["scores"].argmax()
+        best_box = results["boxes"][best].tolist()
+        mask, _, _ = self.predict_mask_with_prompts(prefetch.use(embedding), box=best_box)
+        return best_box, float(results["scores"][best]), mask
+
+    def segment_with_text(self, image: Image.Image, text_prompt: str) -> Image.Image:
+        """Segments an object using a text prompt by first detecting it with OWL-ViT."""
+        prediction = self.predict_mask_with_text(image, text_prompt)
+        if prediction is None:
+            return image # Return original image if no object is detected
+        return self._visualize_mask(image, prediction[2])
@@ -0,0 +1,170 @@
+# core/sessions.py
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from .rle import encode_mask_delta
+
+
+class SegmentationSession:
+    """One uploaded image's SAM embedding, plus the prompts and mask of the object being segmented.
+
+    Prompts accumulate until a reset, and every prediction feeds the previous low-res mask
+    logits back to SAM as `mask_input`, so each click refines the current mask. Prompts are in
+    original-image coordinates; masks are at the resolution the image was decoded at.
+
+    The embedding is from the session's `backbone`; the decoded image is kept so `finalize`
+    can re-run the prompts on another (usually heavier) backbone.
+    """
+    def __init__(self, session_id: str, embedding: dict, scale, image=None, backbone: str = None):
+        self.session_id = session_id
+        self.embedding = embedding
+        self.scale = scale  # ImageScale from the decoded image back to the original
+        self.image = image
+        self.backbone = backbone
+        self.last_used = time.monotonic()
+        self.prompts_run = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new object: forget the prompts, logits and last mask."""
+        self.points = []
+        self.labels = []
+        self.box = None
+        self.low_res_logits = None
+        self.mask = None
+
+    def prompt(self, segmentor, message: dict) -> dict:
+        """Apply one prompt message and return the reply to send back to the client.
+
+        Messages are `{"type": "point", "point": [x, y], "label": 1}`, `{"type": "box",
+        "box": [x1, y1, x2, y2]}` or `{"type": "reset"}`; `{"type": "final"}` is handled by
+        `finalize`. Masks come back as RLE of the
+        change from the previously sent mask (see `core.rle.apply_mask_delta`).
+        """
+        kind = message.get("type")
+        with self._lock:
+            if kind == "reset":
+                self.reset()
+                return {"type": "reset"}
+            if kind == "point":
+                x, y = message["point"]
+                self.points.extend(self.scale.points_to_decoded([[float(x), float(y)]]))
+                self.labels.append(int(message.get("label", 1)))
+            elif kind == "box":
+                if len(message["box"]) != 4:
+                    raise ValueError("box must be [x1, y1, x2, y2]")
+                self.box = self.scale.box_to_decoded([float(v) for v in message["box"]])
+            else:
+                raise ValueError(f"Unknown prompt type: {kind!r}")
+
+            started = time.perf_counter()
+            # A lone first click is ambiguous, so let SAM propose several masks and keep the best
+            multimask = self.low_res_logits is None and self.box is None and len(self.points) == 1
+            mask, score, self.low_res_logits = segmentor.predict_mask_with_prompts(
+                self.embedding,
+                points=self.points or None,
+                labels=self.labels or None,
+                box=self.box,
+                mask_input=self.low_res_logits,
+                multimask_output=multimask,
+            )
+            return self._mask_reply(mask, score, started)
+
+    def finalize(self, segmentor, embedding: dict) -> dict:
+        """Re-run the current prompts on `segmentor`'s backbone and return its mask.
+
+        Used to get the final mask from a heavier backbone than the one the clicks ran on;
+        `embedding` is the session image's embedding from that backbone.
+        """
+        with self._lock:
+            if not self.points and self.box is None:
+                raise ValueError("Nothing to finalize: send a point or box first")
+            started = time.perf_counter()
+            # The interactive logits come from another backbone, so the prompts start afresh
+            mask, score, _ = segmentor.predict_mask_with_prompts(
+                embedding,
+                points=self.points or None,
+                labels=self.labels or None,
+                box=self.box,
+                multimask_output=self.box is None and len(self.points) == 1,
+            )
+            reply = self._mask_reply(mask, score, started)
+            reply.update(final=True, backbone=segmentor.sam_model_type)
+            return reply
+
+    def _mask_reply(self, mask, score: float, started: float) -> dict:
+        reply = encode_mask_delta(mask, self.mask)
+        self.mask = mask
+        self.prompts_run += 1
+        reply.update(
+            type="mask",
+            seq=self.prompts_run,
+            score=round(score, 4),
+            area=int(mask.sum()),
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+        return reply
+
+
+class SessionStore:
+    """Live segmentation sessions by id.
+
+    Sessions unused for `idle_timeout` seconds are dropped by `evict_idle`; beyond
+    `max_sessions`, the least recently used session is dropped to make room.
+    """
+    def __init__(self, idle_timeout: float = 300.0, max_sessions: int = 32):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def create(self, embedding: dict, scale, image=None, backbone: str = None) -> SegmentationSession:
+        session = SegmentationSession(uuid.uuid4().hex, embedding, scale, image, backbone)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def get(self, session_id: str) -> SegmentationSession:
+        """The session with `session_id` (marking it used), or None if it does not exist or expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.monotonic() - session.last_used > self.idle_timeout:
+                del self._sessions[session_id]
+                self.evictions += 1
+                return None
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def evict_idle(self) -> int:
+        """Drop every session idle for longer than the timeout; returns how many were dropped."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session.last_used < cutoff]
+            for session_id in expired:
+                del self._sessions[session_id]
+            self.evictions += len(expired)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_timeout_seconds": self.idle_timeout,
+            "evictions": self.evictions,
+        }
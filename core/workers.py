@@ -0,0 +1,209 @@
+# core/workers.py
+import os
+import asyncio
+import itertools
+import pickle
+import queue
+import threading
+import time
+import traceback
+import multiprocessing as mp
+from concurrent.futures import Future
+
+# Inference worker processes for CPU serving. The pool forks its workers from a process that
+# has already loaded the models, so every worker shares the weight pages copy-on-write, and
+# pins each worker to its own cores with a matching intra-op thread count.
+#
+# OpenMP's thread pool does not survive a fork: the forking process must not have run a
+# multi-threaded torch op before the pool starts (`torch.set_num_threads(1)` while loading).
+
+
+class WorkerError(RuntimeError):
+    """Raised for a task whose worker process died, or whose exception could not be sent back."""
+
+
+def core_sets(num_workers: int, threads_per_worker: int = None, cores: list = None) -> list:
+    """Split the cores this process may run on into `num_workers` disjoint sets."""
+    cores = sorted(cores or os.sched_getaffinity(0))
+    threads = threads_per_worker or max(1, len(cores) // num_workers)
+    if threads * num_workers > len(cores):
+        raise ValueError(f"{num_workers} workers x {threads} threads need more than the {len(cores)} available cores")
+    return [cores[i * threads:(i + 1) * threads] for i in range(num_workers)]
+
+
+def _send(results, message: tuple) -> None:
+    # Pickled here rather than in the queue's feeder thread, so a result that cannot be
+    # pickled fails its own task instead of being dropped
+    try:
+        results.put(pickle.dumps(message))
+    except Exception as exc:
+        task_id, index = message[:2]
+        error = WorkerError(f"Could not send the result back: {exc}")
+        results.put(pickle.dumps((task_id, index, False, error)))
+
+
+def _worker_main(index: int, cores: list, tasks, results, initializer, concurrency: int) -> None:
+    import torch
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    try:
+        if initializer is not None:
+            initializer()
+    except Exception:
+        results.put(pickle.dumps(("ready", index, False, traceback.format_exc())))
+        return
+    results.put(pickle.dumps(("ready", index, True, os.getpid())))
+
+    def serve():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            task_id, fn, args = task
+            try:
+                _send(results, (task_id, index, True, fn(*args)))
+            except Exception as exc:
+                traceback.print_exc()
+                _send(results, (task_id, index, False, exc))
+
+    # A few tasks in flight per worker let its micro-batching schedulers group them
+    threads = [threading.Thread(target=serve, daemon=True) for _ in range(concurrency - 1)]
+    for thread in threads:
+        thread.start()
+    serve()
+    for thread in threads:
+        thread.join()
+
+
+class _Worker:
+    def __init__(self, index: int, cores: list, process, tasks):
+        self.index = index
+        self.cores = cores
+        self.process = process
+        self.tasks = tasks
+        self.pending = {}
+        self.tasks_run = 0
+
+
+class WorkerPool:
+    """Forked inference processes, each pinned to a disjoint core set, fed over local queues.
+
+    `submit(fn, *args)` sends the call to the worker with the fewest tasks in flight; `fn`
+    must be a module-level function and its arguments and result picklable. `initializer`
+    runs once in each worker before it takes tasks.
+    """
+    def __init__(self, num_workers: int, threads_per_worker: int = None, initializer=None,
+                 concurrency: int = 1, start_timeout: float = 600.0):
+        context = mp.get_context("fork")
+        self._results = context.Queue()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.workers = []
+        for index, cores in enumerate(core_sets(num_workers, threads_per_worker)):
+            tasks = context.Queue()
+            process = context.Process(
+                target=_worker_main, name=f"inference-worker-{index}", daemon=True,
+                args=(index, cores, tasks, self._results, initializer, concurrency))
+            process.start()
+            self.workers.append(_Worker(index, cores, process, tasks))
+        self._concurrency = concurrency
+
+        # Wait for every worker's initializer before taking requests
+        for _ in self.workers:
+            _, index, ok, pid = pickle.loads(self._results.get(timeout=start_timeout))
+            if not ok:
+                self.close()
+                raise WorkerError(f"Inference worker {index} failed to start:\n{pid}")
+            print(f"Inference worker {index} (pid {pid}) ready on cores {self.workers[index].cores}")
+        self._collector = threading.Thread(target=self._collect, name="worker-results", daemon=True)
+        self._collector.start()
+
+    def submit(self, fn, *args) -> Future:
+        """Queue `fn(*args)` on the least busy live worker and return a future for its result."""
+        future = Future()
+        with self._lock:
+            live = [w for w in self.workers if w.process.is_alive()]
+            if not live:
+                raise WorkerError("No inference worker is running")
+            worker = min(live, key=lambda w: len(w.pending))
+            task_id = next(self._ids)
+            worker.pending[task_id] = future
+        worker.tasks.put((task_id, fn, args))
+        return future
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on a worker and await its result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def broadcast(self, fn, *args) -> list:
+        """Run `fn(*args)` once on every worker; returns their futures in worker order."""
+        futures = []
+        for worker in self.workers:
+            future = Future()
+            futures.append(future)
+            if not worker.process.is_alive():
+                future.set_exception(WorkerError(f"Inference worker {worker.index} is not running"))
+                continue
+            with self._lock:
+                task_id = next(self._ids)
+                worker.pending[task_id] = future
+            worker.tasks.put((task_id, fn, args))
+        return futures
+
+    def _collect(self):
+        checked = time.monotonic()
+        while True:
+            if time.monotonic() - checked > 1.0:
+                self._fail_dead_workers()
+                checked = time.monotonic()
+            try:
+                task_id, index, ok, value = pickle.loads(self._results.get(timeout=1.0))
+            except queue.Empty:
+                continue
+            worker = self.workers[index]
+            with self._lock:
+                future = worker.pending.pop(task_id, None)
+                worker.tasks_run += 1
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _fail_dead_workers(self):
+        for worker in self.workers:
+            if worker.pending and not worker.process.is_alive():
+                with self._lock:
+                    pending, worker.pending = worker.pending, {}
+                for future in pending.values():
+                    future.set_exception(WorkerError(
+                        f"Inference worker {worker.index} exited with code {worker.process.exitcode}"))
+
+    def close(self, timeout: float = 10.0) -> None:
+        for worker in self.workers:
+            for _ in range(self._concurrency):
+                worker.tasks.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def in_flight(self) -> int:
+        """Tasks submitted and not yet finished, across every worker."""
+        with self._lock:
+            return sum(len(worker.pending) for worker in self.workers)
+
+    def stats(self) -> list:
+        with self._lock:
+            return [
+                {
+                    "worker": worker.index,
+                    "pid": worker.process.pid,
+                    "alive": worker.process.is_alive(),
+                    "cores": worker.cores,
+                    "in_flight": len(worker.pending),
+                    "tasks_run": worker.tasks_run,
+                }
+                for worker in self.workers
+            ]
@@ -0,0 +1,87 @@
+# corpus_search.py
+import argparse
+import json
+import time
+from pathlib import Path
+from core.detector import OWLViTDetector
+from core.embedding_index import EmbeddingIndex
+from core.image_handler import ImageHandler
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+def build_index(args):
+    index = EmbeddingIndex(args.index_dir)
+    detector = OWLViTDetector()
+    image_handler = ImageHandler()
+
+    image_files = sorted(p for pattern in IMAGE_PATTERNS for p in Path(args.image_dir).rglob(pattern))
+    pending = [str(p) for p in image_files if index.needs_indexing(str(p))]
+    print(f"{len(image_files)} images found, {len(pending)} new or changed.")
+
+    start = time.perf_counter()
+    for i in range(0, len(pending), args.batch_size):
+        paths = pending[i:i + args.batch_size]
+        # Boxes are stored normalized, so decoding at model resolution loses nothing
+        images, scales = zip(*(image_handler.load_image_for_models(path) for path in paths))
+        embeddings = detector.patch_embeddings(list(images))
+        index.add(paths, [scale.original_size for scale in scales], embeddings, detector.model_name)
+        print(f"Indexed {min(i + args.batch_size, len(pending))}/{len(pending)} images")
+    print(f"Index at {args.index_dir} holds {len(index)} images ({time.perf_counter() - start:.1f}s).")
+
+def search_index(args):
+    index = EmbeddingIndex(args.index_dir)
+    detector = OWLViTDetector(model_name=index.manifest["model_name"] or "google/owlvit-base-patch32")
+
+    if args.text:
+        query_embedding = detector.embed_texts([args.text])[0]
+    else:
+        reference = ImageHandler().load_image(args.reference_image)
+        bbox = args.bbox
+        if bbox is None:
+            from ui.selector import BoundingBoxSelector
+            bbox = BoundingBoxSelector(reference).select_bbox()
+            if not bbox:
+                print("No bounding box selected. Aborting search.")
+                return
+        crop = ImageHandler().crop_bbox_region(reference, bbox)
+        query_embedding = detector.embed_query_image(crop).embedding
+
+    start = time.perf_counter()
+    results = index.search(query_embedding, top_k=args.top_k, threshold=args.threshold,
+                           nms_threshold=args.nms_threshold, image_guided=not args.text)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    for rank, result in enumerate(results, 1):
+        print(f"{rank:3d}. {result['score']:.3f}  {result['path']}  ({len(result['boxes'])} boxes)")
+    print(f"Searched {len(index)} images in {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index an image folder once, then search it for objects by text or example.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="Add new or changed images of a folder to the index.")
+    index_parser.add_argument("--image_dir", required=True, help="Folder of images to index (searched recursively).")
+    index_parser.add_argument("--index_dir", default="output/index", help="Directory holding the index files.")
+    index_parser.add_argument("--batch_size", type=int, default=8, help="Images per OWL-ViT forward pass.")
+    index_parser.set_defaults(func=build_index)
+
+    search_parser = subparsers.add_parser("search", help="Rank indexed images for a text or reference-crop query.")
+    search_parser.add_argument("--index_dir", default="output/index", help="Directory holding the index files.")
+    query_group = search_parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument("--text", help="Text description of the object to find.")
+    query_group.add_argument("--reference_image", help="Image containing the object to find.")
+    search_parser.add_argument("--bbox", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                               help="Box of the object on the reference image; selected interactively if omitted.")
+    search_parser.add_argument("--top_k", type=int, default=20, help="Number of images to return.")
+    search_parser.add_argument("--threshold", type=float, default=0.1,
+                               help="Minimum patch score for a match, as the detector's --threshold.")
+    search_parser.add_argument("--nms_threshold", type=float, default=0.3,
+                               help="Drop boxes overlapping a better one by more than this IoU (1 keeps all).")
+    search_parser.add_argument("--output", help="Optional JSON file for the ranked results.")
+    search_parser.set_defaults(func=search_index)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,164 @@
+# export_models.py
+"""Export OWL-ViT and SAM to ONNX for the onnx backend, then check it against the PyTorch path.
+
+Usage: python export_models.py --sam_model_type vit_h [--sam_checkpoint sam_vit_h_4b8939.pth]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+class ParityReport:
+    """Collects the comparisons between the torch and onnx backends."""
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name: str, passed: bool, detail: str) -> None:
+        self.failures += not passed
+        print(f"  {'PASS' if passed else 'FAIL'}  {name}: {detail}")
+
+    def compare_tensors(self, name: str, expected, actual, atol: float, rtol: float = 1e-3) -> None:
+        import torch
+        diff = (expected - actual).abs().max().item()
+        self.check(name, torch.allclose(expected, actual, atol=atol, rtol=rtol), f"max abs diff {diff:.2e}")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def check_owlvit(args, images: list, report: ParityReport) -> None:
+    import torch
+    from core.detector import OWLViTDetector
+    reference = OWLViTDetector(args.owlvit_model, device="cpu")
+    exported = OWLViTDetector(args.owlvit_model, device="cpu", backend="onnx", export_dir=args.export_dir)
+    print(f"OWL-ViT parity ({len(images)} images, prompts {args.prompts}):")
+
+    torch_ms, onnx_ms = [], []
+    for i, image in enumerate(images):
+        pixel_values = reference.processor(images=[image], return_tensors="pt")["pixel_values"]
+        with torch.no_grad():
+            expected, elapsed = timed(lambda: reference.graphs.image(pixel_values))
+        torch_ms.append(elapsed)
+        actual, elapsed = timed(lambda: exported.graphs.image(pixel_values))
+        onnx_ms.append(elapsed)
+        for name, e, a in zip(("pred_boxes", "class_embeds", "logit_shift", "logit_scale"), expected, actual):
+            report.compare_tensors(f"image {i} {name}", e, a, args.atol)
+
+        expected = reference.detect_from_texts(image, args.prompts, threshold=args.threshold)
+        actual = exported.detect_from_texts(image, args.prompts, threshold=args.threshold)
+        for query in args.prompts:
+            e, a = expected[query], actual[query]
+            if len(e["boxes"]) != len(a["boxes"]):
+                report.check(f"image {i} '{query}' detections", False, f"{len(e['boxes'])} vs {len(a['boxes'])} boxes")
+                continue
+            box_diff = (e["boxes"] - a["boxes"]).abs().max().item() if len(e["boxes"]) else 0.0
+            score_diff = (e["scores"] - a["scores"]).abs().max().item() if len(e["scores"]) else 0.0
+            report.check(f"image {i} '{query}' detections", box_diff <= args.box_tolerance and score_diff <= args.atol,
+                         f"{len(e['boxes'])} boxes, max corner diff {box_diff:.2f} px, max score diff {score_diff:.2e}")
+
+    tokens = reference.processor.tokenizer(args.prompts, padding="max_length", return_tensors="pt")
+    with torch.no_grad():
+        expected = reference.graphs.text(tokens["input_ids"], tokens["attention_mask"])
+    report.compare_tensors("text embeddings", expected, exported.graphs.text(tokens["input_ids"], tokens["attention_mask"]), args.atol)
+    print(f"  image graph median latency: torch {np.median(torch_ms):.1f} ms, onnx {np.median(onnx_ms):.1f} ms")
+    reference.close()
+    exported.close()
+
+
+def check_sam(args, images: list, report: ParityReport) -> None:
+    from core.segmentor import Segmentor
+    reference = Segmentor(args.sam_checkpoint, args.sam_model_type, device="cpu")
+    exported = Segmentor(args.sam_checkpoint, args.sam_model_type, device="cpu", backend="onnx", export_dir=args.export_dir)
+    print(f"SAM parity ({len(images)} images):")
+
+    torch_ms, onnx_ms = [], []
+    for i, image in enumerate(images):
+        expected, elapsed = timed(lambda: reference.embed_image(image))
+        torch_ms.append(elapsed)
+        actual, elapsed = timed(lambda: exported.embed_image(image))
+        onnx_ms.append(elapsed)
+        report.compare_tensors(f"image {i} embedding", expected["features"], actual["features"], args.atol)
+
+        width, height = image.size
+        prompts = {
+            "point": dict(points=[[width / 2, height / 2]], labels=[1]),
+            "box": dict(box=[width / 4, height / 4, 3 * width / 4, 3 * height / 4]),
+            "point+box": dict(points=[[width / 2, height / 2]], labels=[1], box=[width / 4, height / 4, 3 * width / 4, 3 * height / 4]),
+            "multimask": dict(points=[[width / 2, height / 2]], labels=[1], multimask_output=True),
+        }
+        # A follow-up click refining the previous mask, as interactive sessions send it
+        _, _, logits = reference.predict_mask_with_prompts(expected, **prompts["multimask"])
+        prompts["refine"] = dict(points=[[width / 2, height / 2], [width / 3, height / 3]], labels=[1, 0], mask_input=logits)
+        for name, prompt in prompts.items():
+            # Both decoders get the reference embedding, so this compares the decoders alone
+            e_mask, e_score, _ = reference.predict_mask_with_prompts(expected, **prompt)
+            a_mask, a_score, _ = exported.predict_mask_with_prompts(expected, **prompt)
+            union = np.logical_or(e_mask, a_mask).sum()
+            iou = np.logical_and(e_mask, a_mask).sum() / union if union else 1.0
+            report.check(f"image {i} {name} mask", iou >= args.min_iou and abs(e_score - a_score) <= args.atol,
+                         f"IoU {iou:.4f}, score diff {abs(e_score - a_score):.2e}")
+    print(f"  image encoder median latency: torch {np.median(torch_ms):.1f} ms, onnx {np.median(onnx_ms):.1f} ms")
+    reference.close()
+    exported.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export OWL-ViT and SAM graphs for the onnx backend")
+    parser.add_argument("--export_dir", default="exported", help="Directory the onnx backend reads the graphs from.")
+    parser.add_argument("--owlvit_model", default="google/owlvit-base-patch32")
+    parser.add_argument("--sam_checkpoint", default=None, help="Defaults to the model type's released checkpoint.")
+    parser.add_argument("--sam_model_type", default="vit_h", choices=["vit_b", "vit_l", "vit_h"])
+    parser.add_argument("--skip_owlvit", action="store_true")
+    parser.add_argument("--skip_sam", action="store_true")
+    parser.add_argument("--check_only", action="store_true", help="Only run the parity checks on an existing export.")
+    parser.add_argument("--no_check", action="store_true", help="Export without running the parity checks.")
+    parser.add_argument("--check_dir", default="data/target", help="Images used for the parity checks.")
+    parser.add_argument("--prompts", nargs="+", default=["a cat", "a dog"])
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--atol", type=float, default=1e-3, help="Absolute tolerance on graph outputs and scores.")
+    parser.add_argument("--box_tolerance", type=float, default=1.0, help="Largest box-corner difference from the PyTorch result, in pixels.")
+    parser.add_argument("--min_iou", type=float, default=0.99, help="Minimum mask IoU with the PyTorch result.")
+    args = parser.parse_args()
+    if args.sam_checkpoint is None:
+        from core.backbones import sam_checkpoint
+        args.sam_checkpoint = sam_checkpoint(args.sam_model_type)
+
+    from core.model_registry import model_registry, owlvit_key, sam_key
+    if not args.check_only:
+        from core.export import export_owlvit, export_sam
+        if not args.skip_owlvit:
+            processor, graphs = model_registry.acquire_owlvit(args.owlvit_model, "cpu")
+            print(f"Wrote {export_owlvit(graphs.image.model, processor, args.owlvit_model, args.export_dir)}")
+            model_registry.release(owlvit_key(args.owlvit_model, "cpu"))
+        if not args.skip_sam:
+            sam = model_registry.acquire_sam(args.sam_model_type, args.sam_checkpoint, "cpu")
+            print(f"Wrote {export_sam(sam, args.sam_model_type, args.sam_checkpoint, args.export_dir)}")
+            model_registry.release(sam_key(args.sam_model_type, args.sam_checkpoint, "cpu"))
+    if args.no_check:
+        return
+
+    from core.image_handler import decode_image, MODEL_MAX_SIDE
+    paths = sorted(p for p in os.listdir(args.check_dir) if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS)
+    images = [decode_image(os.path.join(args.check_dir, p), MODEL_MAX_SIDE)[0] for p in paths]
+    if not images:
+        print(f"No images in {args.check_dir} to check parity on")
+        sys.exit(1)
+
+    report = ParityReport()
+    if not args.skip_owlvit:
+        check_owlvit(args, images, report)
+    if not args.skip_sam:
+        check_sam(args, images, report)
+    print("Parity checks passed" if not report.failures else f"{report.failures} parity checks failed")
+    sys.exit(1 if report.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 # one_shot_object_detection/main.py
 import os
-from core.pipeline import DetectionPipeline
-from ui.selector import BoundingBoxSelector
-from ui.visualizer import ResultsVisualizer
 from PIL import Image
+# core.pipeline (torch, transformers) and ui.selector (matplotlib) are imported by the
+# scenarios that use them, so the menu comes up immediately
 
 def run_same_image_scenario():
+    from core.pipeline import DetectionPipeline
+    from ui.selector import BoundingBoxSelector
+    from ui.visualizer import ResultsVisualizer
     print("\n--- Running Same-Image Detection Scenario ---")
     image_path = "data/target/jar.jpg" # Make sure this image exists
     
@@ -33,10 +35,13 @@ def run_same_image_scenario():
     )
 
     # Visualize results
-    result_image = visualizer.draw_detections(original_image.copy(), results)
+    result_image = visualizer.draw_detections(original_image, results)
     visualizer.display_image(result_image, "Detections in the Same Image")
 
 def run_cross_image_scenario():
+    from core.pipeline import DetectionPipeline
+    from ui.selector import BoundingBoxSelector
+    from ui.visualizer import ResultsVisualizer
     print("\n--- Running Cross-Image Detection Scenario ---")
     reference_image_path = "data/reference/coke.jpeg" # Make sure this exists
     target_image_paths = ["data/target/test.jpg"] # Make sure these exist
@@ -68,12 +73,14 @@ def run_cross_image_scenario():
     # Visualize results
     images_to_display = []
     for path, (image, detections) in all_results.items():
-        result_image = visualizer.draw_detections(image.copy(), detections)
+        result_image = visualizer.draw_detections(image, detections)
         images_to_display.append((result_image, f"Detections in {os.path.basename(path)}"))
     
     visualizer.display_results_grid(images_to_display)
 
 def run_text_prompt_scenario():
+    from core.pipeline import DetectionPipeline
+    from ui.visualizer import ResultsVisualizer
     print("\n--- Running Text-Prompt Detection Scenario ---")
     image_path = "data/target/jar.jpg"  # or prompt user for image path
     query_text = input("Enter your text prompt (e.g., 'a jar', 'cat', 'person'): ")
@@ -82,7 +89,7 @@ def run_text_prompt_scenario():
     visualizer = ResultsVisualizer()
 
     original_image, results = pipeline.process_text_prompt(image_path, query_text)
-    result_image = visualizer.draw_detections(original_image.copy(), results)
+    result_image = visualizer.draw_detections(original_image, results)
     visualizer.display_image(result_image, f"Detections for prompt: '{query_text}'")
 
 
@@ -0,0 +1,73 @@
+# one_shot_object_detection/ui/session_client.py
+import io
+import json
+import time
+import numpy as np
+import requests
+from PIL import Image
+from websockets.sync.client import connect
+from core.rle import apply_mask_delta
+
+
+class SegmentationSessionClient:
+    """Client for the API's interactive segmentation sessions.
+
+    The image is uploaded once, or an image already in the API's image store is named by
+    `image_id`; each prompt then goes over the session's WebSocket and only a mask update
+    comes back, which is applied to `mask`. Prompt coordinates are multiplied by `scale`,
+    e.g. the factor a stored image was downscaled by before its upload.
+    """
+    def __init__(self, api_url: str, image: Image.Image = None, backbone: str = None,
+                 image_id: str = None, scale: float = 1.0):
+        data = {"backbone": backbone} if backbone else {}
+        if image_id is not None:
+            response = requests.post(f"{api_url}/sessions/", data=dict(data, image_id=image_id))
+        else:
+            buffered = io.BytesIO()
+            # Clicks are in original-image coordinates, so the image is compressed but not resized
+            image.convert("RGB").save(buffered, format="JPEG", quality=90)
+            response = requests.post(f"{api_url}/sessions/", files={"image_file": ("image.jpg", buffered.getvalue())}, data=data)
+        response.raise_for_status()
+        info = response.json()
+        self.api_url = api_url
+        self.session_id = info["session_id"]
+        self.backbone = info["backbone"]
+        self.scale = scale
+        self.last_used = time.monotonic()
+        # Masks come back at the server's decode resolution; prompts use original coordinates
+        self.mask = np.zeros((info["mask_height"], info["mask_width"]), dtype=bool)
+        ws_url = api_url.replace("http://", "ws://", 1).replace("https://", "wss://", 1)
+        self._ws = connect(f"{ws_url}/sessions/{self.session_id}/ws")
+
+    def add_point(self, point: list, label: int = 1) -> np.ndarray:
+        """Add a foreground (1) or background (0) click and return the refined mask."""
+        return self._send({"type": "point", "point": [v * self.scale for v in point], "label": label})
+
+    def set_box(self, box: list) -> np.ndarray:
+        return self._send({"type": "box", "box": [v * self.scale for v in box]})
+
+    def finalize(self, backbone: str = None) -> np.ndarray:
+        """The mask for the prompts so far from the server's final (heavier) SAM backbone."""
+        message = {"type": "final"}
+        if backbone:
+            message["backbone"] = backbone
+        return self._send(message)
+
+    def reset(self) -> None:
+        """Start segmenting a new object in the same image."""
+        self._send({"type": "reset"})
+        self.mask = np.zeros_like(self.mask)
+
+    def close(self) -> None:
+        self._ws.close()
+        requests.delete(f"{self.api_url}/sessions/{self.session_id}")
+
+    def _send(self, message: dict) -> np.ndarray:
+        self.last_used = time.monotonic()
+        self._ws.send(json.dumps(message))
+        reply = json.loads(self._ws.recv())
+        if reply["type"] == "error":
+            raise ValueError(reply["detail"])
+        if reply["type"] == "mask":
+            self.mask = apply_mask_delta(self.mask, reply)
+        return self.mask
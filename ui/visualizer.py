@@ -1,6 +1,7 @@
 # one_shot_object_detection/ui/visualizer.py
-import matplotlib.pyplot as plt
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from PIL import Image, ImageFont
+from core.render import render
 
 class ResultsVisualizer:
     """Handles drawing and displaying detection results."""
@@ -14,20 +15,37 @@ class ResultsVisualizer:
         """Draw bounding boxes and scores on an image."""
         if "boxes" not in results or "scores" not in results:
             return image
-        
-        img_draw = image.copy()
-        draw = ImageDraw.Draw(img_draw)
-        boxes = results["boxes"].tolist()
-        scores = results["scores"].tolist()
+        captions = [f"Score: {score:.2f}" for score in results["scores"].tolist()]
+        return render(image, boxes=results["boxes"].tolist(), captions=captions,
+                      box_color=color, box_width=width, font=self.font)
+
+    def draw_mask(self, image: Image.Image, mask: np.ndarray, color: tuple = (30, 144, 255), alpha: float = 0.5) -> Image.Image:
+        """Blend a binary mask over an image in a single color, resizing the mask to the image if needed."""
+        return render(image, masks=[mask], mask_colors=[color], alpha=alpha)
 
-        for box, score in zip(boxes, scores):
-            x1, y1, x2, y2 = box
-            draw.rectangle((x1, y1, x2, y2), outline=color, width=width)
-            draw.text((x1, y1 - 20), f"Score: {score:.2f}", fill=color, font=self.font)
-        return img_draw
+    def draw_payload(self, image: Image.Image, payload: dict, color: str = 'red', width: int = 3) -> Image.Image:
+        """Render an API `output=json` response (boxes and RLE masks) on the original image."""
+        from core.rle import decode_rle
+        masks = [decode_rle(mask["segmentation"]) for mask in payload.get("masks", [])]
+        detections = payload.get("detections", [])
+        captions = [" ".join(str(part) for part in (
+            detection.get("label"),
+            f"{detection['score']:.2f}" if "score" in detection else None,
+        ) if part is not None) for detection in detections]
+        return render(
+            image,
+            masks=masks,
+            mask_colors=np.random.default_rng(0).integers(0, 255, (len(masks), 3)),
+            boxes=[detection["box"] for detection in detections],
+            captions=captions,
+            box_color=color,
+            box_width=width,
+            font=self.font,
+        )
 
     def display_image(self, image: Image.Image, title: str):
         """Display a single image."""
+        import matplotlib.pyplot as plt  # Only needed for on-screen display
         plt.figure(figsize=(12, 8))
         plt.imshow(image)
         plt.title(title)
@@ -36,6 +54,7 @@ class ResultsVisualizer:
 
     def display_results_grid(self, images_with_titles: list):
         """Display multiple images with their titles in a grid."""
+        import matplotlib.pyplot as plt
         n_images = len(images_with_titles)
         if n_images == 0:
             return